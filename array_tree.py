@@ -0,0 +1,513 @@
+""" Red-Black Tree stored as parallel arrays of node fields
+
+mduder.net
+October 2026
+
+Classes:
+    ArrayNode -- Lightweight view of one node of an ArrayTree.  Views are
+                 only created when a node is handed out to the caller.
+
+    ArrayTree -- Tree with the same interface as red_black_tree.Tree, keeping
+                 its keys, colors and left, right and parent links in flat
+                 arrays instead of one object per node.  A populated tree
+                 is a handful of buffers, which need a fraction of the memory
+                 of node objects and are never scanned by the cyclic GC.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import bisect
+import operator
+import random
+from array import array
+
+import red_black_tree as rbt
+
+# Slot 0 of every array is the tree's nil sentinel
+_NIL = 0
+
+
+class ArrayNode(object):
+    """ View of the node held in one slot of an ArrayTree
+
+    Instance variables:
+    tree  -- The ArrayTree owning the slot.
+
+    index -- The slot holding the node in the tree's arrays.
+
+    key, value, color -- As on Node, read from the tree's arrays.  Setting
+                value writes it through to the tree.
+
+    A view holds no node data of its own.  Deleted slots are reused, so a
+    view of a deleted node must not be used afterwards.
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def key(self):
+        return self.tree.keys[self.index]
+
+    @property
+    def value(self):
+        return self.tree.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.tree.values[self.index] = value
+
+    @property
+    def color(self):
+        return self.tree.colors[self.index]
+
+
+class ArrayTree(object):
+    """ Red-Black Tree holding its nodes as slots across parallel arrays
+
+    Rotations and fixups follow Tree exactly, but move slot indices between
+    the link arrays rather than aliases between objects.  Deleted slots are
+    chained into a free list through the left array and reused by inserts.
+
+    Instance variables:
+    keys    -- array of the signed 64-bit integer key in each slot.
+
+    values  -- list of the value in each slot.
+
+    colors  -- array of the color of each slot.
+
+    left, right, parent -- arrays of the linked slot indices, where 0 is the
+                nil sentinel.  child holds (left, right) for access by
+                direction.
+
+    The buffers may be read directly, e.g. to write a snapshot, but must only
+    be changed through the tree.  Slots on the free list hold stale keys.
+
+    Interfaces:
+    find, find_many, contains_many, insert, delete, update, boundary,
+    traverse -- As on Tree.  Nodes are handed out as ArrayNode views.
+
+    validate -- Verify the tree's ordering, coloring and slot accounting.
+
+    len(tree) returns the node count in O(1).
+    """
+
+    def __init__(self):
+        self.keys = array('q', [0])
+        self.values = [None]
+        self.colors = array('b', [rbt.BLACK])
+        self.left = array('i', [_NIL])
+        self.right = array('i', [_NIL])
+        self.parent = array('i', [_NIL])
+        self.child = (self.left, self.right)
+        self.__root = _NIL
+        self.__count = 0
+        self.__free = _NIL
+
+    # The key is stored first, so one outside the int64 array's range raises
+    # OverflowError before a free slot is taken or a new one appended
+    def __allocate(self, key, value):
+        slot = self.__free
+        if slot:
+            self.keys[slot] = key
+            self.__free = self.left[slot]
+            self.values[slot] = value
+            self.colors[slot] = rbt.RED
+            self.left[slot] = self.right[slot] = self.parent[slot] = _NIL
+            return slot
+
+        self.keys.append(key)
+        self.values.append(value)
+        self.colors.append(rbt.RED)
+        self.left.append(_NIL)
+        self.right.append(_NIL)
+        self.parent.append(_NIL)
+        return len(self.keys) - 1
+
+    def __release(self, slot):
+        self.values[slot] = None
+        self.left[slot] = self.__free
+        self.__free = slot
+
+    def __rotate(self, focus, _OBVERSE_DIRECTION):
+        near = self.child[_OBVERSE_DIRECTION]
+        far = self.child[1 - _OBVERSE_DIRECTION]
+        parent_of = self.parent
+
+        parent = parent_of[focus]
+        child = far[focus]
+        grandchild = far[focus] = near[child]
+        near[child] = focus
+        if grandchild:
+            parent_of[grandchild] = focus
+        parent_of[child] = parent
+        parent_of[focus] = child
+        if not parent:
+            self.__root = child
+        elif self.left[parent] == focus:
+            self.left[parent] = child
+        else:
+            self.right[parent] = child
+
+    def __find_slot(self, key):
+        if not isinstance(key, int):
+            raise TypeError
+        keys, left, right = self.keys, self.left, self.right
+        focus = self.__root
+        while focus:
+            focus_key = keys[focus]
+            if key < focus_key:
+                focus = left[focus]
+            elif key > focus_key:
+                focus = right[focus]
+            else:
+                return focus
+        raise LookupError
+
+    def find(self, key):
+        return ArrayNode(self, self.__find_slot(key))
+
+    # As Tree.find_many, partitioning the sorted batch at each slot
+    def find_many(self, keys):
+        keys = [operator.index(key) for key in keys]
+        values, found = [None] * len(keys), [False] * len(keys)
+        order = sorted(range(len(keys)), key = keys.__getitem__)
+        ordered = [keys[index] for index in order]
+
+        stack = [(self.__root, 0, len(ordered))] if self.__root and keys else []
+        while stack:
+            focus, low, high = stack.pop()
+            if high - low == 1:
+                # A lone key finishes with a plain descent
+                key = ordered[low]
+                while focus and key != self.keys[focus]:
+                    if key < self.keys[focus]:
+                        focus = self.left[focus]
+                    else:
+                        focus = self.right[focus]
+                if focus:
+                    values[order[low]] = self.values[focus]
+                    found[order[low]] = True
+                continue
+
+            focus_key = self.keys[focus]
+            match_low = bisect.bisect_left(ordered, focus_key, low, high)
+            match_high = bisect.bisect_right(ordered, focus_key, match_low, high)
+            for index in order[match_low:match_high]:
+                values[index], found[index] = self.values[focus], True
+            if low < match_low and self.left[focus]:
+                stack.append((self.left[focus], low, match_low))
+            if match_high < high and self.right[focus]:
+                stack.append((self.right[focus], match_high, high))
+        return values, found
+
+    def contains_many(self, keys):
+        return self.find_many(keys)[1]
+
+    def insert(self, key, value = None):
+        if not isinstance(key, int):
+            raise TypeError
+        keys, left, right = self.keys, self.left, self.right
+        focus, parent = self.__root, _NIL
+        while focus:
+            parent, focus_key = focus, keys[focus]
+            if key < focus_key:
+                focus = left[focus]
+            elif key > focus_key:
+                focus = right[focus]
+            else:
+                raise LookupError
+
+        new = self.__allocate(key, value)
+        self.parent[new] = parent
+        if not parent:
+            self.__root = new
+        elif key < keys[parent]:
+            left[parent] = new
+        else:
+            right[parent] = new
+        self.__count += 1
+        self.__insert_fixup(new)
+
+    def __insert_fixup(self, focus):
+        colors, left, right, parent_of = \
+                self.colors, self.left, self.right, self.parent
+        while parent_of[focus] and colors[parent_of[focus]] == rbt.RED:
+            parent = parent_of[focus]
+            grandpa = parent_of[parent]
+            if left[grandpa] == parent:
+                _DIRECTION_FROM_GRANDPA, uncle = rbt.LEFT, right[grandpa]
+            else:
+                _DIRECTION_FROM_GRANDPA, uncle = rbt.RIGHT, left[grandpa]
+            _OPPOSITE_DIRECTION = 1 - _DIRECTION_FROM_GRANDPA
+
+            if colors[uncle] == rbt.RED:
+                # CLRS Case 1
+                colors[parent] = colors[uncle] = rbt.BLACK
+                colors[grandpa] = rbt.RED
+                focus = grandpa
+                continue
+
+            if self.child[_OPPOSITE_DIRECTION][parent] == focus:
+                # CLRS Case 2
+                focus = parent
+                self.__rotate(focus, _DIRECTION_FROM_GRANDPA)
+                parent = parent_of[focus]
+                grandpa = parent_of[parent] # re-alias
+
+            # CLRS Case 3
+            colors[parent], colors[grandpa] = rbt.BLACK, rbt.RED
+            self.__rotate(grandpa, _OPPOSITE_DIRECTION)
+        colors[self.__root] = rbt.BLACK
+
+    # Unlink a slot as Tree.__remove does.  The nil slot is never
+    # re-parented, so the fixup is handed the spliced position's parent.
+    def delete(self, key):
+        focus = self.__find_slot(key)
+        left, right, parent_of, colors = \
+                self.left, self.right, self.parent, self.colors
+        if not left[focus] or not right[focus]:
+            removed_color = colors[focus]
+            rep_child = left[focus] or right[focus]
+            rep_parent = parent_of[focus]
+            self.__transplant(focus, rep_child)
+        else:
+            # Locate next-largest value as successor
+            replacer = right[focus]
+            while left[replacer]:
+                replacer = left[replacer]
+            removed_color = colors[replacer]
+            rep_child = right[replacer]
+            if parent_of[replacer] == focus:
+                rep_parent = replacer
+            else:
+                rep_parent = parent_of[replacer]
+                self.__transplant(replacer, rep_child)
+                right[replacer] = right[focus]
+                parent_of[right[replacer]] = replacer
+            self.__transplant(focus, replacer)
+            left[replacer] = left[focus]
+            parent_of[left[replacer]] = replacer
+            colors[replacer] = colors[focus]
+
+        self.__count -= 1
+        self.__release(focus)
+        if self.__root and removed_color == rbt.BLACK:
+            self.__delete_fixup(rep_child, rep_parent)
+
+    # Put slot new (possibly nil) in the position held by slot old
+    def __transplant(self, old, new):
+        parent = self.parent[old]
+        if not parent:
+            self.__root = new
+        elif self.left[parent] == old:
+            self.left[parent] = new
+        else:
+            self.right[parent] = new
+        if new:
+            self.parent[new] = parent
+
+    def __delete_fixup(self, focus, parent):
+        colors, left, right = self.colors, self.left, self.right
+        while focus != self.__root and colors[focus] == rbt.BLACK:
+            if left[parent] == focus:
+                _DIRECTION_FROM_PARENT, sibling = rbt.LEFT, right[parent]
+            else:
+                _DIRECTION_FROM_PARENT, sibling = rbt.RIGHT, left[parent]
+            _OPPOSITE_DIRECTION = 1 - _DIRECTION_FROM_PARENT
+            near = self.child[_DIRECTION_FROM_PARENT]
+            far = self.child[_OPPOSITE_DIRECTION]
+
+            if colors[sibling] == rbt.RED:
+                # CLRS Case 1
+                colors[sibling] = rbt.BLACK
+                colors[parent] = rbt.RED
+                self.__rotate(parent, _DIRECTION_FROM_PARENT)
+                sibling = far[parent] # re-alias
+
+            if colors[left[sibling]] == rbt.BLACK and \
+                    colors[right[sibling]] == rbt.BLACK:
+                # CLRS Case 2
+                colors[sibling] = rbt.RED
+                focus, parent = parent, self.parent[parent]
+                continue
+
+            if colors[far[sibling]] == rbt.BLACK:
+                # CLRS Case 3
+                colors[near[sibling]] = rbt.BLACK
+                colors[sibling] = rbt.RED
+                self.__rotate(sibling, _OPPOSITE_DIRECTION)
+                sibling = far[parent] # re-alias
+
+            # CLRS Case 4
+            colors[far[sibling]] = rbt.BLACK
+            colors[sibling] = colors[parent]
+            colors[parent] = rbt.BLACK
+            self.__rotate(parent, _DIRECTION_FROM_PARENT)
+            focus = self.__root
+        colors[focus] = rbt.BLACK
+
+    def update(self, key, value):
+        self.values[self.__find_slot(key)] = value
+
+    def boundary(self, find_option):
+        if not self.__root:
+            return None
+        elif find_option is rbt.LOWEST_KEY:
+            links = self.left
+        elif find_option is rbt.HIGHEST_KEY:
+            links = self.right
+        else:
+            raise KeyError
+
+        curr = self.__root
+        while links[curr]:
+            curr = links[curr]
+        return ArrayNode(self, curr)
+
+    # The parent-walk of Tree.traverse, over slot indices
+    def traverse(self, callback, process_order = rbt.IN_ORDER):
+        left, right, parent_of = self.left, self.right, self.parent
+        curr, prev = self.__root, _NIL
+        depth = 0
+
+        while curr:
+            if not prev or parent_of[curr] == prev:
+                depth += 1
+                prev = curr
+
+                if process_order is rbt.PRE_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                if left[curr]:
+                    curr = left[curr]
+                    continue
+
+                if process_order is rbt.IN_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                if right[curr]:
+                    curr = right[curr]
+                    continue
+
+                if process_order is rbt.POST_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                curr = parent_of[curr]
+
+            elif prev == left[curr]:
+                depth -= 1
+                prev = curr
+
+                if process_order is rbt.IN_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                if right[curr]:
+                    curr = right[curr]
+                    continue
+
+                if process_order is rbt.POST_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                curr = parent_of[curr]
+
+            elif prev == right[curr]:
+                depth -= 1
+                prev = curr
+
+                if process_order is rbt.POST_ORDER:
+                    callback(ArrayNode(self, curr), depth)
+                curr = parent_of[curr]
+
+    def __len__(self):
+        return self.__count
+
+    # Return the black height of the subtree, raising on any violation
+    def __inspect(self, focus, low_key, high_key):
+        if not focus:
+            return 0
+        key, colors = self.keys[focus], self.colors
+        left, right = self.left[focus], self.right[focus]
+        if (low_key is not None and key <= low_key) or \
+                (high_key is not None and key >= high_key):
+            print('Key out of order at val:', key)
+            raise KeyError
+        elif (left and self.parent[left] != focus) or \
+                (right and self.parent[right] != focus):
+            print('Parent index mismatch at children of val:', key)
+            raise ReferenceError
+        elif colors[focus] == rbt.RED and \
+                (colors[left] == rbt.RED or colors[right] == rbt.RED):
+            print('Child and focus both red at val:', key)
+            raise ValueError
+
+        left_height = self.__inspect(left, low_key, key)
+        if left_height != self.__inspect(right, key, high_key):
+            print('Black height mismatch at children of val:', key)
+            raise ValueError
+        self.__inspected += 1
+        return left_height + (colors[focus] == rbt.BLACK)
+
+    def validate(self):
+        if self.colors[self.__root] == rbt.RED or self.colors[_NIL] == rbt.RED:
+            print('Red root or sentinel')
+            raise ValueError
+
+        self.__inspected = 0
+        self.__inspect(self.__root, None, None)
+        free, slot = 0, self.__free
+        while slot:
+            free, slot = free + 1, self.left[slot]
+        if self.__inspected != self.__count or \
+                self.__count + free + 1 != len(self.keys):
+            print('Slot count mismatch, %d nodes and %d free of %d slots' %
+                    (self.__inspected, free, len(self.keys)))
+            raise ArithmeticError
+
+
+# Sanity check the array tree with a large count of variant instances,
+# interleaving inserts and deletes so freed slots are reused
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        for count in range(1, test_count):
+            rand_array = list(range(count))
+            random.shuffle(rand_array)
+            tree = ArrayTree()
+            for key in rand_array:
+                tree.insert(key, -key)
+                tree.validate()
+            for key in rand_array[::2]:
+                tree.delete(key)
+                tree.validate()
+            for key in rand_array[::2]:
+                tree.insert(key, -key)
+                tree.validate()
+            keys = []
+            tree.traverse(lambda node, depth: keys.append(node.key))
+            if keys != sorted(rand_array) or \
+                    any(tree.find(key).value != -key for key in keys):
+                print('Array tree contents mismatch at count:', count)
+                raise ValueError
+            slots = len(tree.keys)
+            for key in rand_array:
+                tree.delete(key)
+                tree.validate()
+            # Refused keys must leave every released slot on the free list
+            for key in (2 ** 63, -2 ** 63 - 1):
+                try:
+                    tree.insert(key)
+                except OverflowError:
+                    pass
+                else:
+                    print('Out of range key accepted at count:', count)
+                    raise ValueError
+            for key in rand_array:
+                tree.insert(key, key)
+            if len(tree.keys) != slots:
+                print('Free slot lost at count:', count)
+                raise ValueError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
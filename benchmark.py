@@ -0,0 +1,548 @@
+""" Benchmarks for the Red-Black Tree module
+
+mduder.net
+October 2026
+
+Functions:
+    memory_benchmark -- Report the bytes held per key by a populated Tree,
+                        next to the original layout in which every node
+                        owned a child list, a __dict__ and two nil nodes,
+                        and to an ArrayTree.
+
+    throughput_benchmark -- Report inserts/sec and lookups/sec over shuffled
+                        integer keys at several tree sizes.
+
+    aggregate_benchmark -- Report range sums/sec over a tree of counters by
+                        aggregate, next to summing the values of iter_range,
+                        at several range widths.
+
+    batch_benchmark -- Report keys/sec resolved by a find loop catching
+                        LookupError on misses, next to one find_many call,
+                        at several batch sizes with half of the keys missing.
+
+    concurrent_benchmark -- Report the throughput of reader, writer and full
+                        scan threads sharing one tree behind a global lock,
+                        a ConcurrentTree, and a ConcurrentTree which scans
+                        snapshots.
+
+    durable_benchmark -- Report mutations/sec of a DurableTree under each
+                        write-ahead log sync policy.
+
+    sorted_map_benchmark -- Report the time a SortedMap takes to load random
+                        keys and scan them in order, and to serve inserts
+                        interleaved with range queries, next to a dict sorted
+                        on demand and a dict kept beside a bisect.insort list.
+
+    priority_queue_benchmark -- Report timer events/sec of a scheduler which
+                        pops the next deadline, re-arms it and reschedules
+                        another timer earlier, on a PriorityQueue, on heapq
+                        with lazily cancelled entries, and on a Tree popped
+                        through boundary and delete.
+
+    service_benchmark -- Report ops/sec and p50/p99 latency of clients each
+                        making one get or put at a time against a local
+                        TreeService server, alone and while another client
+                        scans the whole tree, with and without batching.
+
+    sharded_benchmark -- Report inserts/sec and lookups/sec of random keys
+                        sent in batches to a ShardedTree with 1, 2, 4 and
+                        cpu_count() workers, next to one Tree in process.
+
+    snapshot_benchmark -- Report the time to dump a snapshot and to reload it,
+                        next to rebuilding the same tree key by key.
+
+Running as main invokes every benchmark, or only those named as arguments.
+"""
+from __future__ import print_function
+import asyncio
+import bisect
+import functools
+import heapq
+import itertools
+import multiprocessing
+import operator
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import array_tree
+import concurrent_tree
+import durable_tree
+import priority_queue
+import red_black_tree as rbt
+import sharded_tree
+import sorted_map
+import tree_service
+import tree_snapshot
+
+
+class _LegacyNode(object):
+    """ Replica of the original Node layout, kept only for measurement.
+    """
+    def __init__(self, key, value = None, nil = False):
+        self.parent = None
+        self.key = key
+        if value:
+            self.value = value
+
+        if nil:
+            self.color = rbt.BLACK
+            self.child = [None, None]
+        else:
+            self.color = rbt.RED
+            self.child = [_LegacyNode(None, None, True),
+                            _LegacyNode(None, None, True)]
+            self.child[rbt.LEFT].parent = self
+            self.child[rbt.RIGHT].parent = self
+
+
+# Trace the bytes allocated by build(keys) which are still held afterwards
+def _traced_bytes(build, keys):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build(keys)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return after - before
+
+def _build_legacy(keys):
+    return [_LegacyNode(key, key) for key in keys]
+
+def _build_tree(keys):
+    tree = rbt.Tree()
+    for key in keys:
+        tree.insert(key, key)
+    return tree
+
+def _build_array_tree(keys):
+    tree = array_tree.ArrayTree()
+    for key in keys:
+        tree.insert(key, key)
+    return tree
+
+def memory_benchmark(counts = (10 ** 4, 10 ** 5)):
+    for count in counts:
+        keys = list(range(count))
+        # The legacy nodes are held by a list; do not charge its slots to them
+        legacy = _traced_bytes(_build_legacy, keys) - sys.getsizeof(keys)
+        compact = _traced_bytes(_build_tree, keys)
+        arrays = _traced_bytes(_build_array_tree, keys)
+        print('memory  keys=%-8d legacy %6.1f B/key  compact %6.1f B/key  '
+              'array %6.1f B/key' % (count, float(legacy) / count,
+                                     float(compact) / count,
+                                     float(arrays) / count))
+
+def throughput_benchmark(counts = (10 ** 4, 10 ** 5, 10 ** 6)):
+    for count in counts:
+        keys = list(range(count))
+        random.seed(count)
+        random.shuffle(keys)
+        tree = rbt.Tree()
+
+        start = time.perf_counter()
+        for key in keys:
+            tree.insert(key, key)
+        inserted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in keys:
+            tree.find(key)
+        found = time.perf_counter() - start
+        print('throughput  keys=%-8d %10.0f inserts/sec %10.0f lookups/sec' %
+                (count, count / inserted, count / found))
+
+def snapshot_benchmark(counts = (10 ** 5, 10 ** 6)):
+    for count in counts:
+        keys = list(range(count))
+        random.seed(count)
+        random.shuffle(keys)
+
+        start = time.perf_counter()
+        tree = rbt.Tree()
+        for key in keys:
+            tree.insert(key, key)
+        rebuilt = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tree.snapshot')
+            start = time.perf_counter()
+            tree_snapshot.dump(tree, path)
+            dumped = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tree_snapshot.load(path)
+            loaded = time.perf_counter() - start
+        print('snapshot  keys=%-8d insert %7.2fs  dump %7.2fs  load %7.2fs' %
+                (count, rebuilt, dumped, loaded))
+
+def aggregate_benchmark(count = 10 ** 5, widths = (10, 10 ** 3, 10 ** 5 // 2),
+                        queries = 1000):
+    tree = rbt.Tree(combine = operator.add, identity = 0)
+    for key in range(count):
+        tree.insert(key, key % 97)
+    random.seed(count)
+    for width in widths:
+        lows = [random.randrange(count - width) for _ in range(queries)]
+
+        start = time.perf_counter()
+        for low in lows:
+            sum(node.value for node in tree.iter_range(low, low + width - 1))
+        walked = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for low in lows:
+            tree.aggregate(low, low + width - 1)
+        aggregated = time.perf_counter() - start
+        print('aggregate  width=%-8d iter_range %10.0f sums/sec  aggregate %10.0f '
+              'sums/sec' % (width, queries / walked, queries / aggregated))
+
+def batch_benchmark(count = 10 ** 5, batch_sizes = (10 ** 2, 10 ** 4, 10 ** 5)):
+    tree = rbt.Tree()
+    for key in range(0, 2 * count, 2):
+        tree.insert(key, key)
+    random.seed(count)
+    for batch_size in batch_sizes:
+        batch = [random.randrange(2 * count) for _ in range(batch_size)]
+        rounds = max(1, 10 ** 5 // batch_size)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            values = []
+            for key in batch:
+                try:
+                    values.append(tree.find(key).value)
+                except LookupError:
+                    values.append(None)
+        looped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            tree.find_many(batch)
+        batched = time.perf_counter() - start
+        print('batch  size=%-8d find loop %10.0f keys/sec  find_many %10.0f '
+              'keys/sec' % (batch_size, rounds * batch_size / looped,
+                            rounds * batch_size / batched))
+
+class _SortedDict(object):
+    """ Baseline dict whose keys are sorted whenever a query needs order.
+    """
+    def __init__(self):
+        self.map = {}
+
+    def insert(self, key):
+        self.map[key] = key
+
+    def scan(self, low, count):
+        keys = sorted(self.map)
+        start = bisect.bisect_left(keys, low)
+        return [(key, self.map[key]) for key in keys[start:start + count]]
+
+class _InsortDict(_SortedDict):
+    """ Baseline dict with a sorted key list maintained by bisect.insort.
+    """
+    def __init__(self):
+        super(_InsortDict, self).__init__()
+        self.keys = []
+
+    def insert(self, key):
+        if key not in self.map:
+            bisect.insort(self.keys, key)
+        self.map[key] = key
+
+    def scan(self, low, count):
+        start = bisect.bisect_left(self.keys, low)
+        return [(key, self.map[key]) for key in self.keys[start:start + count]]
+
+class _TreeMap(object):
+    def __init__(self):
+        self.map = sorted_map.SortedMap()
+
+    def insert(self, key):
+        self.map[key] = key
+
+    def scan(self, low, count):
+        return list(itertools.islice(
+                ((key, self.map[key]) for key in self.map.irange(low)), count))
+
+def sorted_map_benchmark(counts = (10 ** 4, 10 ** 5), query_every = 10):
+    contenders = (('SortedMap', _TreeMap), ('dict+sorted', _SortedDict),
+                  ('dict+insort', _InsortDict))
+    for count in counts:
+        random.seed(count)
+        keys = [random.randrange(10 * count) for _ in range(count)]
+        for name, factory in contenders:
+            container = factory()
+            start = time.perf_counter()
+            for key in keys:
+                container.insert(key)
+            container.scan(0, count)
+            loaded = time.perf_counter() - start
+
+            # Re-sorting per query is quadratic; skip it at the larger sizes
+            if factory is _SortedDict and count > 10 ** 4:
+                print('sorted_map  keys=%-8d %-12s load+scan %7.3fs' %
+                        (count, name, loaded))
+                continue
+            container = factory()
+            start = time.perf_counter()
+            for index, key in enumerate(keys):
+                container.insert(key)
+                if index % query_every == 0:
+                    container.scan(key, 10)
+            mixed = time.perf_counter() - start
+            print('sorted_map  keys=%-8d %-12s load+scan %7.3fs  '
+                  'insert+query %7.3fs' % (count, name, loaded, mixed))
+
+class _GlobalLockTree(object):
+    """ Baseline serializing every call on one tree behind one lock.
+    """
+    def __init__(self):
+        self.__tree = rbt.Tree()
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, name):
+        def call(*args):
+            with self.__lock:
+                result = getattr(self.__tree, name)(*args)
+                return list(result) if name == 'iter_range' else result
+        return call
+
+def concurrent_benchmark(count = 20000, threads = 4, seconds = 2.0):
+    contenders = (('global-lock', _GlobalLockTree),
+                  ('rw-lock', concurrent_tree.ConcurrentTree),
+                  ('rw-snapshots',
+                   lambda: concurrent_tree.ConcurrentTree(snapshots = True)))
+    for name, factory in contenders:
+        tree = factory()
+        for key in range(0, 2 * count, 2):
+            tree.insert(key, key)
+        ops, stop = [0] * (2 * threads + 1), time.perf_counter() + seconds
+
+        def read(slot):
+            rand = random.Random(slot)
+            while time.perf_counter() < stop:
+                for _ in range(100):
+                    try:
+                        tree.find(rand.randrange(2 * count))
+                    except LookupError:
+                        pass
+                low = rand.randrange(2 * count)
+                for _ in tree.iter_range(low, low + 1000):
+                    pass
+                ops[slot] += 101
+
+        # Each writer owns the odd keys congruent to its slot
+        def write(slot):
+            rand = random.Random(slot)
+            while time.perf_counter() < stop:
+                key = 2 * (rand.randrange(count // threads) * threads + slot) + 1
+                try:
+                    tree.insert(key, key)
+                except LookupError:
+                    tree.delete(key)
+                ops[slot] += 1
+
+        def scan(slot):
+            while time.perf_counter() < stop:
+                tree.traverse(lambda node, depth: None)
+                ops[slot] += 1
+
+        workers = [threading.Thread(target = read, args = (slot,))
+                   for slot in range(threads)]
+        workers += [threading.Thread(target = write, args = (slot,))
+                    for slot in range(threads, 2 * threads)]
+        workers.append(threading.Thread(target = scan, args = (2 * threads,)))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        print('concurrent  %-12s %9.0f reads/sec %9.0f writes/sec %6.1f scans/sec' %
+                (name, sum(ops[:threads]) / seconds,
+                 sum(ops[threads:2 * threads]) / seconds, ops[-1] / seconds))
+
+def durable_benchmark(count = 2000):
+    policies = (('always', durable_tree.SYNC_ALWAYS, 1),
+                ('batch-64', durable_tree.SYNC_BATCH, 64),
+                ('batch-1024', durable_tree.SYNC_BATCH, 1024),
+                ('none', durable_tree.SYNC_NONE, 1024))
+    keys = list(range(count))
+    random.seed(count)
+    random.shuffle(keys)
+    for name, sync, batch_size in policies:
+        with tempfile.TemporaryDirectory() as directory:
+            tree = durable_tree.DurableTree(directory, sync, batch_size)
+            start = time.perf_counter()
+            for key in keys:
+                tree.insert(key, key)
+            for key in keys:
+                tree.update(key, -key)
+            for key in keys:
+                tree.delete(key)
+            tree.close()
+            elapsed = time.perf_counter() - start
+        print('durable  sync=%-10s %10.0f mutations/sec' %
+                (name, 3 * count / elapsed))
+
+# Each event fires the earliest timer, re-arms it at a later deadline and
+# pulls another pending timer a little earlier, as a timeout reset does.
+# Deadlines are (time, timer) pairs, so every contender sees unique keys.
+def _schedule_heapq(deadlines, events, rand):
+    heap = [(deadline, timer) for timer, deadline in enumerate(deadlines)]
+    heapq.heapify(heap)
+    current = list(deadlines)
+    for _ in range(events):
+        deadline, timer = heapq.heappop(heap)
+        while current[timer] != deadline:
+            deadline, timer = heapq.heappop(heap)
+        current[timer] = deadline + rand.random()
+        heapq.heappush(heap, (current[timer], timer))
+        other = rand.randrange(len(current))
+        current[other] -= rand.random() * (current[other] - deadline)
+        heapq.heappush(heap, (current[other], other))
+
+def _schedule_queue(deadlines, events, rand):
+    queue = priority_queue.PriorityQueue()
+    handles = [queue.push(deadline, timer)
+               for timer, deadline in enumerate(deadlines)]
+    for _ in range(events):
+        deadline, timer = queue.pop_min()
+        handles[timer] = queue.push(deadline + rand.random(), timer)
+        other = rand.randrange(len(handles))
+        later = handles[other].key[0]
+        handles[other] = queue.decrease_key(
+                handles[other], later - rand.random() * (later - deadline))
+
+def _schedule_tree(deadlines, events, rand):
+    tree = rbt.Tree()
+    current = list(deadlines)
+    for timer, deadline in enumerate(deadlines):
+        tree.insert((deadline, timer))
+    for _ in range(events):
+        deadline, timer = tree.boundary(rbt.LOWEST_KEY).key
+        tree.delete((deadline, timer))
+        current[timer] = deadline + rand.random()
+        tree.insert((current[timer], timer))
+        other = rand.randrange(len(current))
+        tree.delete((current[other], other))
+        current[other] -= rand.random() * (current[other] - deadline)
+        tree.insert((current[other], other))
+
+def priority_queue_benchmark(counts = (10 ** 3, 10 ** 5), events = 10 ** 5):
+    contenders = (('PriorityQueue', _schedule_queue), ('heapq', _schedule_heapq),
+                  ('Tree', _schedule_tree))
+    for count in counts:
+        random.seed(count)
+        deadlines = [random.random() for _ in range(count)]
+        for name, schedule in contenders:
+            start = time.perf_counter()
+            schedule(deadlines, events, random.Random(count))
+            elapsed = time.perf_counter() - start
+            print('priority_queue  timers=%-8d %-14s %10.0f events/sec' %
+                    (count, name, events / elapsed))
+
+# Serve from a process of its own, so the load generator does not share
+# the server's event loop
+def _run_service(batching, count, ports):
+    async def run():
+        service = tree_service.TreeService(batching)
+        service.tree.bulk_insert(range(count), range(count))
+        server = await tree_service.serve(service)
+        ports.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+    asyncio.run(run())
+
+# Closed-loop load: every client waits for each reply before its next request
+async def _service_load(port, clients, count, seconds, scanning):
+    connections = [await tree_service.TreeClient.connect(port = port)
+                   for _ in range(clients + 1)]
+    loop = asyncio.get_running_loop()
+    stop, latencies, scans = loop.time() + seconds, [], [0]
+
+    async def request(client, rand):
+        while loop.time() < stop:
+            key = rand.randrange(count)
+            start = time.perf_counter()
+            if rand.random() < 0.8:
+                await client.get(key)
+            else:
+                await client.put(key, -key)
+            latencies.append(time.perf_counter() - start)
+
+    async def scan(client):
+        while scanning and loop.time() < stop:
+            async for _ in client.scan():
+                pass
+            scans[0] += 1
+
+    await asyncio.gather(scan(connections[-1]),
+                         *(request(client, random.Random(slot))
+                           for slot, client in enumerate(connections[:-1])))
+    for client in connections:
+        await client.close()
+    latencies.sort()
+    return (len(latencies) / seconds, latencies[len(latencies) // 2],
+            latencies[len(latencies) * 99 // 100], scans[0])
+
+def service_benchmark(count = 10 ** 5, client_counts = (1, 16, 64),
+                      seconds = 2.0):
+    for batching in (False, True):
+        ports = multiprocessing.Queue()
+        server = multiprocessing.Process(target = _run_service,
+                                         args = (batching, count, ports))
+        server.start()
+        port = ports.get()
+        for scanning, clients in itertools.product((False, True),
+                                                   client_counts):
+            ops, p50, p99, scans = asyncio.run(
+                    _service_load(port, clients, count, seconds, scanning))
+            print('service  batching=%-5s scanning=%-5s clients=%-4d '
+                  '%9.0f ops/sec  p50 %8.1f us  p99 %8.1f us  %3d scans' %
+                  (batching, scanning, clients, ops, p50 * 1e6, p99 * 1e6,
+                   scans))
+        server.terminate()
+        server.join()
+
+def sharded_benchmark(count = 4 * 10 ** 5, batch_size = 10 ** 4):
+    random.seed(count)
+    keys = random.sample(range(count * 10), count)
+    batches = [keys[start:start + batch_size]
+               for start in range(0, count, batch_size)]
+    contenders = [('Tree', 0, rbt.Tree)]
+    for workers in sorted(set((1, 2, 4, multiprocessing.cpu_count()))):
+        contenders.append(('ShardedTree', workers, functools.partial(
+                sharded_tree.ShardedTree, workers, count // (4 * workers))))
+    for name, workers, factory in contenders:
+        tree = factory()
+        start = time.perf_counter()
+        for batch in batches:
+            tree.bulk_insert(batch, batch)
+        inserted = time.perf_counter()
+        for batch in batches:
+            tree.find_many(batch)
+        elapsed = time.perf_counter() - inserted
+        print('sharded  %-12s workers=%-3d %10.0f inserts/sec %10.0f lookups/sec' %
+                (name, workers, count / (inserted - start), count / elapsed))
+        if workers:
+            tree.close()
+
+
+BENCHMARKS = {'aggregate': aggregate_benchmark,
+              'batch': batch_benchmark,
+              'concurrent': concurrent_benchmark,
+              'durable': durable_benchmark,
+              'memory': memory_benchmark,
+              'priority_queue': priority_queue_benchmark,
+              'service': service_benchmark,
+              'sharded': sharded_benchmark,
+              'snapshot': snapshot_benchmark,
+              'sorted_map': sorted_map_benchmark,
+              'throughput': throughput_benchmark}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
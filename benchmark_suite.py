@@ -0,0 +1,546 @@
+""" Benchmark suite comparing the Red-Black Tree with other ordered structures
+
+mduder.net
+October 2026
+
+Every structure runs the same workload of inserts, finds, updates, boundary
+reads, full in-order traversals and deletes, at several sizes and under
+several key distributions:
+
+    sequential  -- Keys inserted, read and deleted in ascending order.
+    random      -- Keys inserted, read and deleted in shuffled order.
+    zipfian     -- Keys inserted and deleted in shuffled order, while finds
+                   and updates favour a few hot keys (exponent 1.1).
+    adversarial -- Keys inserted in descending order, read zig-zagging
+                   between both ends and deleted from the low end, the worst
+                   case for a sorted array and a steady rotation load for
+                   the tree.
+
+The contenders are Tree, a sorted list kept with bisect, a dict (sorting on
+demand for boundary and traverse), and the reference SkipList and BTree
+below.  Each result records wall time per operation, the peak memory
+allocated while inserting every key (measured in a separate, untimed
+pass), and for Tree the rotations per operation.
+
+Classes:
+    SkipList -- Probabilistic skip list with a promotion chance of 1/4.
+
+    BTree    -- B-tree of minimum degree 16 following CLRS, deleting in one
+                downward pass.
+
+Functions:
+    run_suite -- Run every workload and return the results as a dict.
+
+    compare   -- Print the results of one run which are slower than those
+                 of another by more than a threshold.
+
+Running as main writes the results as JSON to the path given (by default
+benchmark_results.json), or with 'compare OLD NEW' reports regressions.
+"""
+from __future__ import print_function
+import bisect
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import red_black_tree as rbt
+
+DISTRIBUTIONS = ('sequential', 'random', 'zipfian', 'adversarial')
+OPERATIONS = ('insert', 'find', 'update', 'boundary', 'traverse', 'delete')
+
+
+class _CountingTree(rbt.Tree):
+    """ Tree counting the rotations made by its private __rotate.
+    """
+    rotations = 0
+
+    def _Tree__rotate(self, nFocus, direction):
+        self.rotations += 1
+        super(_CountingTree, self)._Tree__rotate(nFocus, direction)
+
+
+class SkipList(object):
+    """ Ordered map kept in a skip list of singly linked levels
+
+    Each node is a list [key, value, next_0, next_1, ...], so a node of
+    height h carries h forward links.  Heights are drawn with a promotion
+    chance of 1/4, capped at _MAX_HEIGHT.
+    """
+    _MAX_HEIGHT = 24
+
+    def __init__(self):
+        self.__head = [None, None] + [None] * self._MAX_HEIGHT
+        self.__height = 1
+        self.__random = random.Random(0)
+
+    # Return the last node before key on every level, lowest level first
+    def __predecessors(self, key):
+        preds, node = [None] * self.__height, self.__head
+        for level in range(self.__height - 1, -1, -1):
+            nxt = node[level + 2]
+            while nxt is not None and nxt[0] < key:
+                node, nxt = nxt, nxt[level + 2]
+            preds[level] = node
+        return preds
+
+    def insert(self, key, value = None):
+        preds = self.__predecessors(key)
+        nxt = preds[0][2]
+        if nxt is not None and nxt[0] == key:
+            raise LookupError
+        height = 1
+        while height < self._MAX_HEIGHT and self.__random.random() < 0.25:
+            height += 1
+        if height > self.__height:
+            preds += [self.__head] * (height - self.__height)
+            self.__height = height
+        node = [key, value] + [None] * height
+        for level in range(height):
+            node[level + 2] = preds[level][level + 2]
+            preds[level][level + 2] = node
+
+    def find(self, key):
+        node = self.__head
+        for level in range(self.__height - 1, -1, -1):
+            nxt = node[level + 2]
+            while nxt is not None and nxt[0] < key:
+                node, nxt = nxt, nxt[level + 2]
+        node = node[2]
+        if node is None or node[0] != key:
+            raise LookupError
+        return node
+
+    def update(self, key, value):
+        self.find(key)[1] = value
+
+    def delete(self, key):
+        preds = self.__predecessors(key)
+        node = preds[0][2]
+        if node is None or node[0] != key:
+            raise LookupError
+        for level in range(len(node) - 2):
+            preds[level][level + 2] = node[level + 2]
+        while self.__height > 1 and self.__head[self.__height + 1] is None:
+            self.__height -= 1
+
+    def boundary(self):
+        node = self.__head[2]
+        return None if node is None else node[0]
+
+    def traverse(self, callback):
+        node = self.__head[2]
+        while node is not None:
+            callback(node[0], node[1])
+            node = node[2]
+
+
+class _BTreeNode(object):
+    __slots__ = ('keys', 'values', 'children')
+
+    def __init__(self, leaf):
+        self.keys, self.values = [], []
+        self.children = None if leaf else []
+
+
+class BTree(object):
+    """ Ordered map kept in a B-tree of the given minimum degree (CLRS 18)
+
+    Inserts split full nodes on the way down and deletes top up thin
+    nodes on the way down, so neither ever walks back up the tree.
+    """
+
+    def __init__(self, degree = 16):
+        self.degree = degree
+        self.__root = _BTreeNode(True)
+
+    def find(self, key):
+        node = self.__root
+        while True:
+            index = bisect.bisect_left(node.keys, key)
+            if index < len(node.keys) and node.keys[index] == key:
+                return node.values[index]
+            elif node.children is None:
+                raise LookupError
+            node = node.children[index]
+
+    def update(self, key, value):
+        node = self.__root
+        while True:
+            index = bisect.bisect_left(node.keys, key)
+            if index < len(node.keys) and node.keys[index] == key:
+                node.values[index] = value
+                return
+            elif node.children is None:
+                raise LookupError
+            node = node.children[index]
+
+    def __split_child(self, parent, index):
+        degree, child = self.degree, parent.children[index]
+        sibling = _BTreeNode(child.children is None)
+        sibling.keys = child.keys[degree:]
+        sibling.values = child.values[degree:]
+        parent.keys.insert(index, child.keys[degree - 1])
+        parent.values.insert(index, child.values[degree - 1])
+        del child.keys[degree - 1:], child.values[degree - 1:]
+        if child.children is not None:
+            sibling.children = child.children[degree:]
+            del child.children[degree:]
+        parent.children.insert(index + 1, sibling)
+
+    def insert(self, key, value = None):
+        full = 2 * self.degree - 1
+        if len(self.__root.keys) == full:
+            root = _BTreeNode(False)
+            root.children.append(self.__root)
+            self.__root = root
+            self.__split_child(root, 0)
+        node = self.__root
+        while True:
+            index = bisect.bisect_left(node.keys, key)
+            if index < len(node.keys) and node.keys[index] == key:
+                raise LookupError
+            elif node.children is None:
+                node.keys.insert(index, key)
+                node.values.insert(index, value)
+                return
+            if len(node.children[index].keys) == full:
+                self.__split_child(node, index)
+                if node.keys[index] == key:
+                    raise LookupError
+                elif node.keys[index] < key:
+                    index += 1
+            node = node.children[index]
+
+    # Make sure child index of node holds at least degree keys, borrowing
+    # from a sibling or merging with one.  Returns the child to descend to.
+    def __fill_child(self, node, index):
+        degree, child = self.degree, node.children[index]
+        if len(child.keys) >= degree:
+            return child
+        left = node.children[index - 1] if index > 0 else None
+        right = node.children[index + 1] \
+                if index + 1 < len(node.children) else None
+        if left is not None and len(left.keys) >= degree:
+            child.keys.insert(0, node.keys[index - 1])
+            child.values.insert(0, node.values[index - 1])
+            node.keys[index - 1] = left.keys.pop()
+            node.values[index - 1] = left.values.pop()
+            if left.children is not None:
+                child.children.insert(0, left.children.pop())
+            return child
+        elif right is not None and len(right.keys) >= degree:
+            child.keys.append(node.keys[index])
+            child.values.append(node.values[index])
+            node.keys[index] = right.keys.pop(0)
+            node.values[index] = right.values.pop(0)
+            if right.children is not None:
+                child.children.append(right.children.pop(0))
+            return child
+        if right is None:
+            index -= 1
+            child, right = left, child
+        self.__merge_children(node, index)
+        return child
+
+    # Merge child index + 1 and the key between into child index
+    def __merge_children(self, node, index):
+        child, right = node.children[index], node.children[index + 1]
+        child.keys.append(node.keys.pop(index))
+        child.values.append(node.values.pop(index))
+        child.keys += right.keys
+        child.values += right.values
+        if child.children is not None:
+            child.children += right.children
+        del node.children[index + 1]
+        if node is self.__root and not node.keys:
+            self.__root = child
+
+    def delete(self, key):
+        node, degree = self.__root, self.degree
+        while True:
+            index = bisect.bisect_left(node.keys, key)
+            found = index < len(node.keys) and node.keys[index] == key
+            if node.children is None:
+                if not found:
+                    raise LookupError
+                del node.keys[index], node.values[index]
+                return
+            elif not found:
+                node = self.__fill_child(node, index)
+                continue
+
+            # Replace an inner key by its predecessor or successor, or
+            # merge the two children around it and delete from the merge
+            left, right = node.children[index], node.children[index + 1]
+            if len(left.keys) >= degree:
+                pred = left
+                while pred.children is not None:
+                    pred = pred.children[-1]
+                node.keys[index], node.values[index] = \
+                        pred.keys[-1], pred.values[-1]
+                node, key = left, pred.keys[-1]
+            elif len(right.keys) >= degree:
+                succ = right
+                while succ.children is not None:
+                    succ = succ.children[0]
+                node.keys[index], node.values[index] = \
+                        succ.keys[0], succ.values[0]
+                node, key = right, succ.keys[0]
+            else:
+                self.__merge_children(node, index)
+                node = left
+
+    def boundary(self):
+        node = self.__root
+        while node.children is not None:
+            node = node.children[0]
+        return node.keys[0] if node.keys else None
+
+    def traverse(self, callback):
+        # Each stack entry is a node and the child to descend to next, after
+        # visiting the key before that child
+        stack = [(self.__root, 0)]
+        while stack:
+            node, index = stack.pop()
+            if node.children is None:
+                for key, value in zip(node.keys, node.values):
+                    callback(key, value)
+                continue
+            if index:
+                callback(node.keys[index - 1], node.values[index - 1])
+            if index + 1 < len(node.children):
+                stack.append((node, index + 1))
+            stack.append((node.children[index], 0))
+
+
+class _TreeAdapter(object):
+    def __init__(self):
+        self.tree = _CountingTree()
+
+    def insert(self, key, value):
+        self.tree.insert(key, value)
+
+    def find(self, key):
+        return self.tree.find(key).value
+
+    def update(self, key, value):
+        self.tree.update(key, value)
+
+    def delete(self, key):
+        self.tree.delete(key)
+
+    def boundary(self):
+        return self.tree.boundary(rbt.LOWEST_KEY)
+
+    def traverse(self, callback):
+        self.tree.traverse(lambda node, depth: callback(node.key, node.value))
+
+class _BisectAdapter(object):
+    def __init__(self):
+        self.keys, self.values = [], []
+
+    def insert(self, key, value):
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            raise LookupError
+        self.keys.insert(index, key)
+        self.values.insert(index, value)
+
+    def __index(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            raise LookupError
+        return index
+
+    def find(self, key):
+        return self.values[self.__index(key)]
+
+    def update(self, key, value):
+        self.values[self.__index(key)] = value
+
+    def delete(self, key):
+        index = self.__index(key)
+        del self.keys[index], self.values[index]
+
+    def boundary(self):
+        return self.keys[0] if self.keys else None
+
+    def traverse(self, callback):
+        for key, value in zip(self.keys, self.values):
+            callback(key, value)
+
+class _DictAdapter(object):
+    def __init__(self):
+        self.map = {}
+
+    def insert(self, key, value):
+        if key in self.map:
+            raise LookupError
+        self.map[key] = value
+
+    def find(self, key):
+        return self.map[key]
+
+    def update(self, key, value):
+        if key not in self.map:
+            raise LookupError
+        self.map[key] = value
+
+    def delete(self, key):
+        del self.map[key]
+
+    def boundary(self):
+        return min(self.map) if self.map else None
+
+    def traverse(self, callback):
+        for key in sorted(self.map):
+            callback(key, self.map[key])
+
+CONTENDERS = (('Tree', _TreeAdapter),
+              ('bisect', _BisectAdapter),
+              ('dict', _DictAdapter),
+              ('SkipList', SkipList),
+              ('BTree', BTree))
+
+
+# Zipf-distributed picks from keys, the first keys the most popular
+def _zipf_sample(keys, count, rand, exponent = 1.1):
+    weights = itertools.accumulate(1.0 / rank ** exponent
+                                   for rank in range(1, len(keys) + 1))
+    return rand.choices(keys, cum_weights = list(weights), k = count)
+
+# Return the (insert, access, delete) key orders of a distribution
+def _key_orders(distribution, count, rand):
+    keys = list(range(count))
+    if distribution == 'sequential':
+        return keys, keys, keys
+    elif distribution == 'adversarial':
+        zigzag = [key for pair in zip(keys, reversed(keys)) for key in pair]
+        return keys[::-1], zigzag[:count], keys
+    shuffled = rand.sample(keys, count)
+    if distribution == 'random':
+        return shuffled, rand.sample(keys, count), rand.sample(keys, count)
+    return shuffled, _zipf_sample(shuffled, count, rand), \
+            rand.sample(keys, count)
+
+# Time each operation of the workload on a fresh structure
+def _run_workload(factory, inserts, accesses, deletes, boundaries, traversals):
+    structure, seconds, rotations = factory(), {}, {}
+    tree = getattr(structure, 'tree', None)
+
+    def timed(operation, run, ops):
+        before = tree.rotations if tree is not None else 0
+        start = time.perf_counter()
+        run()
+        seconds[operation] = (time.perf_counter() - start, ops)
+        if tree is not None:
+            rotations[operation] = (tree.rotations - before) / float(ops)
+
+    def insert_all():
+        for key in inserts:
+            structure.insert(key, key)
+
+    def find_all():
+        for key in accesses:
+            structure.find(key)
+
+    def update_all():
+        for key in accesses:
+            structure.update(key, -key)
+
+    def boundary_all():
+        for _ in range(boundaries):
+            structure.boundary()
+
+    def traverse_all():
+        for _ in range(traversals):
+            structure.traverse(lambda key, value: None)
+
+    def delete_all():
+        for key in deletes:
+            structure.delete(key)
+
+    timed('insert', insert_all, len(inserts))
+    timed('find', find_all, len(accesses))
+    timed('update', update_all, len(accesses))
+    timed('boundary', boundary_all, boundaries)
+    timed('traverse', traverse_all, traversals * len(inserts))
+    timed('delete', delete_all, len(deletes))
+    return seconds, rotations
+
+# Peak bytes allocated while inserting every key into a fresh structure
+def _peak_memory(factory, inserts):
+    tracemalloc.start()
+    structure = factory()
+    for key in inserts:
+        structure.insert(key, key)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del structure
+    return peak
+
+def _commit():
+    try:
+        return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(counts = (10 ** 3, 10 ** 4, 10 ** 5),
+              distributions = DISTRIBUTIONS, boundaries = 100, traversals = 3,
+              verbose = True):
+    results = []
+    for count in counts:
+        for distribution in distributions:
+            inserts, accesses, deletes = \
+                    _key_orders(distribution, count, random.Random(count))
+            for name, factory in CONTENDERS:
+                seconds, rotations = _run_workload(
+                        factory, inserts, accesses, deletes, boundaries,
+                        traversals)
+                peak = _peak_memory(factory, inserts)
+                for operation in OPERATIONS:
+                    elapsed, ops = seconds[operation]
+                    result = {'structure': name, 'distribution': distribution,
+                              'size': count, 'operation': operation,
+                              'ops': ops, 'seconds': elapsed,
+                              'ns_per_op': 1e9 * elapsed / ops,
+                              'peak_bytes': peak,
+                              'rotations_per_op': rotations.get(operation)}
+                    results.append(result)
+                    if verbose:
+                        print('suite  %-8s size=%-7d %-11s %-9s %12.0f ns/op' %
+                                (name, count, distribution, operation,
+                                 result['ns_per_op']))
+    return {'commit': _commit(), 'python': platform.python_version(),
+            'timestamp': time.time(), 'results': results}
+
+def compare(baseline, current, threshold = 1.1):
+    def by_case(run):
+        return dict(((result['structure'], result['distribution'],
+                      result['size'], result['operation']), result)
+                    for result in run['results'])
+    old, new = by_case(baseline), by_case(current)
+    regressions = 0
+    for case in sorted(set(old) & set(new)):
+        ratio = new[case]['ns_per_op'] / max(old[case]['ns_per_op'], 1e-9)
+        if ratio > threshold:
+            regressions += 1
+            print('slower  %-8s size=%-7d %-11s %-9s %6.2fx' % (case[0],
+                    case[2], case[1], case[3], ratio))
+    return regressions
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['compare']:
+        with open(sys.argv[2]) as old_file, open(sys.argv[3]) as new_file:
+            slower = compare(json.load(old_file), json.load(new_file))
+        sys.exit(1 if slower else 0)
+    path = sys.argv[1] if len(sys.argv) > 1 else 'benchmark_results.json'
+    with open(path, 'w') as results_file:
+        json.dump(run_suite(), results_file, indent = 1, sort_keys = True)
@@ -0,0 +1,283 @@
+""" Thread-safe Red-Black Tree with readers-writer locking and snapshot reads
+
+mduder.net
+October 2026
+
+Classes:
+    ReadWriteLock  -- Lock admitting many readers or a single writer.  Waiting
+                      writers hold off new readers, so writers never starve.
+
+    ConcurrentTree -- Tree wrapper which runs lookups under the read lock and
+                      mutations under the write lock.  With snapshots enabled,
+                      full traversals run against a snapshot which a write
+                      copies away from only while it is still referenced,
+                      and never hold a lock at all.
+
+Running as main shall invoke the multithreaded stress tests.
+"""
+from __future__ import print_function
+import contextlib
+import random
+import threading
+import weakref
+
+import red_black_tree as rbt
+
+
+class ReadWriteLock(object):
+    """ Many-readers / single-writer lock alternating between the two sides
+
+    A waiting writer holds off newly arriving readers, so writers never
+    starve.  Releasing the write lock admits every reader waiting at that
+    moment before the next writer, so readers never starve either.
+
+    Interfaces:
+    reading -- Context manager holding the lock shared for its block.
+
+    writing -- Context manager holding the lock exclusively for its block.
+
+    Neither side is re-entrant: a thread holding the lock must not
+    acquire it again.
+    """
+
+    def __init__(self):
+        self.__cond = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__readers_waiting = 0
+        self.__reader_grants = 0
+        self.__writer = False
+        self.__writers_waiting = 0
+
+    @contextlib.contextmanager
+    def reading(self):
+        with self.__cond:
+            self.__readers_waiting += 1
+            while self.__writer or \
+                    (self.__writers_waiting and not self.__reader_grants):
+                self.__cond.wait()
+            self.__readers_waiting -= 1
+            if self.__reader_grants:
+                self.__reader_grants -= 1
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__cond.notify_all()
+
+    @contextlib.contextmanager
+    def writing(self):
+        with self.__cond:
+            self.__writers_waiting += 1
+            while self.__writer or self.__readers or self.__reader_grants:
+                self.__cond.wait()
+            self.__writers_waiting -= 1
+            self.__writer = True
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__writer = False
+                self.__reader_grants = self.__readers_waiting
+                self.__cond.notify_all()
+
+
+class ConcurrentTree(object):
+    """ Tree safe for use from many threads at once
+
+    Instance variables:
+    snapshots -- When set as True at object initialization, snapshot returns
+                a view sharing the live tree's nodes, in O(1).  A mutation
+                made while any view is still referenced first copies the
+                tree, in O(n) under the write lock, and changes the copy, so
+                readers of a view never see a write and never block one.
+                Views dropped before the next mutation cost nothing, so a
+                traversal which has returned forces no copy; under a load
+                of long-held snapshots, though, every write may pay for one.
+
+    Interfaces:
+    find, find_many, contains_many, count, boundary, floor, ceiling,
+    predecessor, successor, rank, select, count_range, len() --
+                As on Tree, under the read lock.  The nodes returned stay
+                live: later writes may change them, unless they came from a
+                snapshot.
+
+    insert, delete, update, bulk_insert, delete_range, remove_one,
+    remove_all, validate -- As on Tree, under the write lock.  validate
+                updates the tree's debug counters, so it counts as a write.
+
+    iter_range / iter_items -- As on Tree, but the range is collected under
+                the read lock before the first node or item is yielded.
+
+    traverse -- As on Tree.  With snapshots enabled the walk runs over a
+                snapshot without locking; otherwise the nodes are collected
+                under the read lock before the first callback.
+
+    snapshot -- Return a read-only Tree of the current contents (requires
+                snapshots=True).  It must never be mutated, and should be
+                dropped once read, as a write copies the tree while it lives.
+
+    Any extra keyword arguments are passed on to the Tree constructor.
+    """
+    _READERS = ('find', 'find_many', 'contains_many', 'count', 'boundary',
+                'floor', 'ceiling', 'predecessor', 'successor', 'rank',
+                'select', 'count_range')
+    _WRITERS = ('insert', 'delete', 'update', 'bulk_insert', 'delete_range',
+                'remove_one', 'remove_all', 'validate')
+
+    def __init__(self, snapshots = False, **options):
+        self.snapshots = snapshots
+        self.__options = options
+        self.__tree = rbt.Tree(**options)
+        self.__views = weakref.WeakSet()
+        self.__views_lock = threading.Lock()
+        self.__lock = ReadWriteLock()
+
+    def __getattr__(self, name):
+        if name in self._READERS:
+            return self.__reader(name)
+        elif name in self._WRITERS:
+            return self.__writer(name)
+        raise AttributeError(name)
+
+    def __reader(self, name):
+        def read(*args, **kwargs):
+            with self.__lock.reading():
+                return getattr(self.__tree, name)(*args, **kwargs)
+        return read
+
+    def __writer(self, name):
+        def write(*args, **kwargs):
+            with self.__lock.writing():
+                if self.__views:
+                    self.__tree = self.__copy(self.__tree)
+                    self.__views = weakref.WeakSet()
+                return getattr(self.__tree, name)(*args, **kwargs)
+        return write
+
+    def __copy(self, tree):
+        keys, values = [], []
+        for key, value in tree.iter_items():
+            keys.append(key)
+            values.append(value)
+        return rbt.Tree.from_sorted(keys, values, **self.__options)
+
+    def __len__(self):
+        with self.__lock.reading():
+            return len(self.__tree)
+
+    def snapshot(self):
+        if not self.snapshots:
+            raise ValueError('snapshot requires snapshots=True')
+        # Readers may take snapshots at once, so the set is guarded apart
+        with self.__lock.reading():
+            view = self.__tree.view()
+            with self.__views_lock:
+                self.__views.add(view)
+            return view
+
+    def iter_range(self, low_key = None, high_key = None, reverse = False):
+        with self.__lock.reading():
+            return iter(list(self.__tree.iter_range(low_key, high_key, reverse)))
+
+    def iter_items(self, low_key = None, high_key = None, reverse = False):
+        with self.__lock.reading():
+            return iter(list(self.__tree.iter_items(low_key, high_key, reverse)))
+
+    def traverse(self, callback, process_order = rbt.IN_ORDER):
+        if self.snapshots:
+            self.snapshot().traverse(callback, process_order)
+            return
+        visits = []
+        with self.__lock.reading():
+            self.__tree.traverse(lambda node, depth: visits.append((node, depth)),
+                                 process_order)
+        for node, depth in visits:
+            callback(node, depth)
+
+
+# Hammer a tree with writer threads owning disjoint key ranges while reader
+# threads look keys up and scan, checking every scan is strictly ascending.
+def stress_tests():
+    thread_count, key_count = 4, 2000
+    for snapshots in (False, True):
+        print('Stress testing snapshots:', snapshots)
+        tree = ConcurrentTree(snapshots, order_statistic = True)
+        failures = []
+
+        def write(offset):
+            keys = list(range(offset, offset + key_count))
+            random.Random(offset).shuffle(keys)
+            for key in keys:
+                tree.insert(key, key)
+            for key in keys[::2]:
+                tree.delete(key)
+            for key in keys[1::2]:
+                tree.update(key, -key)
+
+        def read(seed):
+            rand = random.Random(seed)
+            for _ in range(200):
+                try:
+                    node = tree.find(rand.randrange(thread_count * key_count))
+                    if abs(node.value) != node.key:
+                        failures.append('value mismatch at %d' % node.key)
+                except LookupError:
+                    pass
+                keys = [node.key for node in tree.iter_range()]
+                if keys != sorted(set(keys)):
+                    failures.append('range out of order')
+                keys = []
+                tree.traverse(lambda node, depth: keys.append(node.key))
+                if keys != sorted(set(keys)):
+                    failures.append('traversal out of order')
+
+        threads = [threading.Thread(target = write, args = (i * key_count,))
+                   for i in range(thread_count)]
+        threads += [threading.Thread(target = read, args = (i,))
+                    for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = []
+        for offset in range(0, thread_count * key_count, key_count):
+            keys = list(range(offset, offset + key_count))
+            random.Random(offset).shuffle(keys)
+            expected.extend(keys[1::2])
+        tree.validate(incremental = True)
+        tree.bulk_insert(keys = [-2, -1], values = [2, 1])
+        tree.delete_range(low_key = -2, high_key = -1)
+        remaining = [(node.key, node.value) for node in tree.iter_range()]
+        if failures or len(tree) != len(expected) or \
+                remaining != [(key, -key) for key in sorted(expected)] or \
+                [tree.select(i).key for i in range(len(tree))] != sorted(expected):
+            print('Stress test failed:', failures[:5])
+            raise AssertionError
+
+    # Only a snapshot still referenced makes the next write copy the tree
+    tree = ConcurrentTree(True)
+    tree.bulk_insert(range(100))
+    live = tree._ConcurrentTree__tree
+    tree.traverse(lambda node, depth: None)
+    tree.insert(100)
+    held = tree.snapshot()
+    if tree._ConcurrentTree__tree is not live or \
+            [node.key for node in held.iter_range()] != list(range(101)):
+        print('Dropped snapshot forced a copy')
+        raise AssertionError
+    tree.delete(0)
+    if tree._ConcurrentTree__tree is live or len(held) != 101 or \
+            [node.key for node in held.iter_range()] != list(range(101)) or \
+            list(tree.iter_items())[0] != (1, None):
+        print('Held snapshot saw a write')
+        raise AssertionError
+    held.validate()
+
+# Running as main shall invoke the stress tests
+if __name__ == '__main__':
+    print('Init')
+    stress_tests()
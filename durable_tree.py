@@ -0,0 +1,348 @@
+""" Crash-recoverable Red-Black Tree backed by a snapshot and write-ahead log
+
+mduder.net
+October 2026
+
+Classes:
+    DurableTree -- Tree wrapper which appends every successful insert, delete
+                   and update to a write-ahead log before acknowledging it.
+                   Opening a directory loads its last snapshot and replays
+                   the log on top; checkpoint writes a fresh snapshot and
+                   starts an empty log.
+
+Log records reuse the tree operation constants as record types:
+
+    type (uint8) | key (int64) | value length (uint32) | crc32 (uint32) | value
+
+Keys must therefore be integers within int64, whatever ordering the tree
+is given.  A value of None is logged with no value bytes.  A record cut
+short by a crash (or failing its checksum) ends the replay and is truncated
+away.
+Replay cannot tell a repeated insert from an update, so multisets are
+refused.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import os
+import pickle
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+import red_black_tree as rbt
+import tree_snapshot
+
+(SYNC_ALWAYS, SYNC_BATCH, SYNC_NONE) = range(3)
+
+_PREFIX, _SUFFIX = struct.Struct('<Bq'), struct.Struct('<II')
+_SNAPSHOT_NAME, _LOG_NAME = 'tree.snapshot', 'tree.wal'
+
+
+class DurableTree(object):
+    """ Tree whose mutations survive a crash of the process or machine
+
+    Instance variables:
+    tree     -- The in-memory Tree, built with any extra keyword arguments.
+                Mutate it only through this wrapper, or the log misses it.
+
+    sync     -- SYNC_ALWAYS writes and fsyncs each record before the mutating
+                call returns.  SYNC_BATCH groups records into one write and
+                fsync per batch_size records, or batch_seconds after the
+                batch's first record, whichever comes first, so a crash
+                loses at most one unsynced batch.  A timer thread commits a
+                batch left idle; batch_seconds of None disables it.
+                SYNC_NONE writes batches without fsync, leaving durability
+                to the operating system.
+
+    Interfaces:
+    insert / delete / update -- As on Tree, with the change logged.  The
+                record is built before the tree is changed, so a key outside
+                int64 (OverflowError) or a value which cannot be pickled
+                fails the call with the tree untouched.
+
+    find, find_many, contains_many, count, boundary, traverse, iter_range,
+    iter_items, floor, ceiling, predecessor, successor, rank, select,
+    count_range, display, validate -- As on Tree.
+
+    commit     -- Write and fsync any records still pending in the batch.
+
+    checkpoint -- Snapshot the tree and start an empty log.
+
+    close      -- Commit pending records and close the log.  Also invoked
+                  when leaving a with block.
+    """
+    _READERS = frozenset(('find', 'find_many', 'contains_many', 'count',
+                          'boundary', 'traverse', 'iter_range', 'iter_items',
+                          'floor', 'ceiling', 'predecessor', 'successor',
+                          'rank', 'select', 'count_range', 'display',
+                          'validate'))
+
+    def __init__(self, directory, sync = SYNC_ALWAYS, batch_size = 256,
+                 batch_seconds = 0.01, **options):
+        # Replay applies an insert of a present key as an update
+        if options.get('multiset'):
+            raise ValueError
+        self.sync = sync
+        self.batch_size = 1 if sync == SYNC_ALWAYS else batch_size
+        self.batch_seconds = batch_seconds
+        self.__snapshot_path = os.path.join(directory, _SNAPSHOT_NAME)
+        self.__log_path = os.path.join(directory, _LOG_NAME)
+        self.__pending = []
+        self.__timer = None
+        self.__lock = threading.RLock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.__snapshot_path):
+            self.tree = tree_snapshot.load(self.__snapshot_path, **options)
+        else:
+            self.tree = rbt.Tree(**options)
+        created = not os.path.exists(self.__log_path)
+        self.__log = open(self.__log_path, 'ab+')
+        if created:
+            tree_snapshot.fsync_directory(self.__log_path)
+        self.__replay()
+
+    def __getattr__(self, name):
+        if name in self._READERS:
+            return getattr(self.tree, name)
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Records are re-applied as upserts and tolerant deletes, so replaying
+    # a log over a snapshot that already holds its changes is harmless.
+    def __replay(self):
+        self.__log.seek(0)
+        data = self.__log.read()
+        offset = 0
+        while offset + _PREFIX.size + _SUFFIX.size <= len(data):
+            record_type, key = _PREFIX.unpack_from(data, offset)
+            length, checksum = _SUFFIX.unpack_from(data, offset + _PREFIX.size)
+            start = offset + _PREFIX.size + _SUFFIX.size
+            end = start + length
+            if end > len(data) or checksum != zlib.crc32(
+                    data[offset:offset + _PREFIX.size] + data[start:end]):
+                break
+            value = pickle.loads(data[start:end]) if length else None
+            if record_type == rbt.TREE_DELETE:
+                try:
+                    self.tree.delete(key)
+                except LookupError:
+                    pass
+            else:
+                try:
+                    self.tree.update(key, value)
+                except LookupError:
+                    self.tree.insert(key, value)
+            offset = end
+
+        if offset != len(data):
+            self.__log.truncate(offset)
+            self.__fsync()
+
+    # Everything which may fail on a bad key or value happens here
+    def __record(self, record_type, key, value):
+        if not isinstance(key, int):
+            raise TypeError
+        elif not -2 ** 63 <= key < 2 ** 63:
+            raise OverflowError
+        blob = b'' if value is None else \
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        prefix = _PREFIX.pack(record_type, key)
+        checksum = zlib.crc32(prefix + blob)
+        return prefix + _SUFFIX.pack(len(blob), checksum) + blob
+
+    def __append(self, record):
+        with self.__lock:
+            self.__pending.append(record)
+            if len(self.__pending) >= self.batch_size:
+                self.commit()
+            elif self.__timer is None and self.batch_seconds is not None:
+                self.__timer = threading.Timer(self.batch_seconds, self.commit)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def __fsync(self):
+        self.__log.flush()
+        os.fsync(self.__log.fileno())
+
+    # The record is built first, so a key or value the log cannot hold is
+    # refused before the tree is touched.  The tree is then changed, so a
+    # failing call is never logged, and the record committed (per the sync
+    # policy) before returning.
+    def insert(self, key, value = None):
+        record = self.__record(rbt.TREE_INSERT, key, value)
+        self.tree.insert(key, value)
+        self.__append(record)
+
+    def delete(self, key):
+        record = self.__record(rbt.TREE_DELETE, key, None)
+        self.tree.delete(key)
+        self.__append(record)
+
+    def update(self, key, value):
+        record = self.__record(rbt.TREE_UPDATE, key, value)
+        self.tree.update(key, value)
+        self.__append(record)
+
+    # Also run by the batch timer, so the log is only touched under the lock
+    def commit(self):
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            if not self.__pending or self.__log.closed:
+                return
+            self.__log.write(b''.join(self.__pending))
+            self.__pending = []
+            if self.sync == SYNC_NONE:
+                self.__log.flush()
+            else:
+                self.__fsync()
+
+    # dump fsyncs the directory after renaming the snapshot into place, so
+    # the snapshot is durable before the log it covers is cleared.  A crash
+    # between the two merely replays the old log over the new snapshot,
+    # which changes nothing.
+    def checkpoint(self):
+        with self.__lock:
+            self.commit()
+            tree_snapshot.dump(self.tree, self.__snapshot_path)
+            self.__log.truncate(0)
+            self.__fsync()
+
+    def close(self):
+        with self.__lock:
+            if self.__log.closed:
+                return
+            self.commit()
+            self.__log.close()
+
+# Reference state: the snapshot's items with the logged records applied to
+# a plain Tree, the same way __replay applies them
+def _replayed(items, records):
+    tree = rbt.Tree.from_sorted([key for key, _ in items],
+                                [value for _, value in items])
+    for record_type, key, value in records:
+        try:
+            if record_type == rbt.TREE_DELETE:
+                tree.delete(key)
+            else:
+                tree.update(key, value)
+        except LookupError:
+            if record_type != rbt.TREE_DELETE:
+                tree.insert(key, value)
+    return tree
+
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        sync = random.choice((SYNC_ALWAYS, SYNC_BATCH, SYNC_NONE))
+        batch_size = random.randrange(1, 8)
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, _LOG_NAME)
+            tree = DurableTree(directory, sync, batch_size, None)
+            snapshot, logged, pending = [], [], []
+            for _ in range(test_count * 4):
+                key, roll = random.randrange(test_count), random.random()
+                value = random.choice((None, key, str(key), [key]))
+                try:
+                    if roll < 0.4:
+                        tree.insert(key, value)
+                        record = (rbt.TREE_INSERT, key, value)
+                    elif roll < 0.6:
+                        tree.delete(key)
+                        record = (rbt.TREE_DELETE, key, None)
+                    elif roll < 0.8:
+                        tree.update(key, value)
+                        record = (rbt.TREE_UPDATE, key, value)
+                    else:
+                        record = None
+                except LookupError:
+                    continue
+
+                if record is not None:
+                    pending.append(record)
+                    if len(pending) >= tree.batch_size:
+                        logged, pending = logged + pending, []
+                elif roll < 0.85:
+                    tree.checkpoint()
+                    snapshot, logged, pending = list(tree.iter_items()), [], []
+                elif roll < 0.9:
+                    before = list(tree.iter_items())
+                    for bad_key, bad_value in ((2 ** 63, None),
+                                               (-2 ** 63 - 1, None),
+                                               (key, lambda: key)):
+                        try:
+                            tree.insert(bad_key, bad_value)
+                        except (OverflowError, pickle.PicklingError,
+                                AttributeError, TypeError):
+                            pass
+                        else:
+                            print('Unloggable insert accepted at seed:', seed)
+                            raise ValueError
+                    if list(tree.iter_items()) != before:
+                        print('Refused insert changed tree at seed:', seed)
+                        raise ValueError
+                else:
+                    # Crash: drop the tree unclosed, losing uncommitted
+                    # records, then perhaps tear the log's last record
+                    del tree
+                    pending = []
+                    size = os.path.getsize(log_path)
+                    if logged and random.random() < 0.5:
+                        with open(log_path, 'r+b') as log:
+                            log.truncate(size - random.randrange(1, 1 +
+                                _PREFIX.size + _SUFFIX.size))
+                        logged.pop()
+                    elif random.random() < 0.5:
+                        with open(log_path, 'ab') as log:
+                            log.write(os.urandom(random.randrange(1,
+                                _PREFIX.size + _SUFFIX.size)))
+                    tree = DurableTree(directory, sync, batch_size, None)
+                    tree.validate()
+                    expected = _replayed(snapshot, logged)
+                    if list(tree.iter_items()) != list(expected.iter_items()):
+                        print('Replay mismatch at seed:', seed)
+                        raise ValueError
+                    if os.path.getsize(log_path) > size:
+                        print('Torn tail not truncated at seed:', seed)
+                        raise ValueError
+
+            tree.close()
+            logged, pending = logged + pending, []
+            with DurableTree(directory, sync, batch_size, None) as reopened:
+                expected = _replayed(snapshot, logged)
+                if list(reopened.iter_items()) != list(expected.iter_items()):
+                    print('Reopen mismatch at seed:', seed)
+                    raise ValueError
+
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, _LOG_NAME)
+            with DurableTree(directory, SYNC_BATCH, test_count, 0.01) as tree:
+                tree.insert(seed)
+                deadline = time.monotonic() + 5
+                while os.path.getsize(log_path) == 0:
+                    if time.monotonic() > deadline:
+                        print('Idle batch never committed at seed:', seed)
+                        raise ValueError
+                    time.sleep(0.01)
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
@@ -0,0 +1,306 @@
+""" Red-Black Tree counting its descents, rotations, fixup cases and latencies
+
+mduder.net
+October 2026
+
+Classes:
+    InstrumentedTree -- Tree recording the depth of every descent, each
+                        rotation, which CLRS case fired in each insert and
+                        delete fixup, and a latency histogram per public
+                        operation.  Tree itself carries no instrumentation,
+                        so trees which are not instrumented pay nothing.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import functools
+import random
+import time
+
+import red_black_tree as rbt
+
+# Events handed to callbacks, each with the value described
+OPERATION   = 'operation'    # (operation name, seconds)
+ROTATION    = 'rotation'     # direction of the rotation (LEFT or RIGHT)
+INSERT_CASE = 'insert_case'  # CLRS insert fixup case number, 1 to 3
+DELETE_CASE = 'delete_case'  # CLRS delete fixup case number, 1 to 4
+DESCENT     = 'descent'      # nodes visited by a find or insert descent
+
+# Public operations whose latency is recorded.  Only the outermost call is
+# timed, so a delete is not also timed as the find and delete_node it makes.
+_TIMED = ('insert', 'delete', 'delete_node', 'update', 'find', 'find_many',
+          'contains_many', 'count', 'remove_one', 'remove_all', 'boundary',
+          'traverse', 'floor', 'ceiling', 'predecessor', 'successor', 'rank',
+          'select', 'count_range', 'bulk_insert', 'join', 'split',
+          'delete_range', 'union', 'intersection', 'difference', 'aggregate',
+          'validate')
+
+
+def _depth(node):
+    depth = 0
+    while node is not None:
+        depth, node = depth + 1, node.parent
+    return depth
+
+# Count a value into a histogram keyed by the power of two bounding it
+def _record(histogram, value):
+    bucket = 1 << int(value).bit_length()
+    histogram[bucket] = histogram.get(bucket, 0) + 1
+
+def _timed(name, method):
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        if self._nesting:
+            return method(self, *args, **kwargs)
+        self._nesting += 1
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self._nesting -= 1
+            self._record_operation(name, seconds)
+            self._record_misses()
+    return timed
+
+
+class InstrumentedTree(rbt.Tree):
+    """ Tree recording where its time goes
+
+    Instance variables:
+    callbacks -- Functions called as callback(event, value) for every
+                event recorded; see the event constants above.
+
+    Interfaces:
+    snapshot -- Return a dict of everything recorded so far:
+                'rotations'     -- rotation count
+                'insert_cases', 'delete_cases' -- {case number: count}
+                'descents'      -- histogram of descent depths
+                'operations'    -- {name: {'count', 'seconds', 'histogram'}}
+                with each histogram keyed by the power of two bounding its
+                values (nanoseconds for latencies), e.g. {8: 3} for three
+                descents of 4 to 7 nodes.
+
+    reset    -- Forget everything recorded so far.
+
+    add_callback / remove_callback -- Register or drop a callback.
+
+    All other interfaces are as on Tree.  The fixup cases are classified
+    by replaying the fixup's tests read-only just before it runs, and
+    descents are measured by walking parent aliases back up, so recording
+    costs O(log(n)) per operation on top of the operation itself.  A find
+    which misses is measured by searching again for the node it stopped
+    below, once the outermost operation's timer has stopped, so latencies
+    never include that search.  A miss on an empty tree visits no nodes and
+    records no descent, as the first insert does not.
+    """
+
+    def __init__(self, **options):
+        self.callbacks = []
+        self._nesting = 0
+        self._misses = []
+        self.reset()
+        super(InstrumentedTree, self).__init__(**options)
+
+    def reset(self):
+        self.__rotations = 0
+        self.__insert_cases = dict.fromkeys(range(1, 4), 0)
+        self.__delete_cases = dict.fromkeys(range(1, 5), 0)
+        self.__descents = {}
+        self.__operations = {}
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def snapshot(self):
+        return {'rotations': self.__rotations,
+                'insert_cases': dict(self.__insert_cases),
+                'delete_cases': dict(self.__delete_cases),
+                'descents': dict(self.__descents),
+                'operations': dict((name, {'count': stats['count'],
+                                           'seconds': stats['seconds'],
+                                           'histogram': dict(stats['histogram'])})
+                                   for name, stats in self.__operations.items())}
+
+    def __notify(self, event, value):
+        for callback in self.callbacks:
+            callback(event, value)
+
+    def _record_operation(self, name, seconds):
+        stats = self.__operations.get(name)
+        if stats is None:
+            stats = self.__operations[name] = {'count': 0, 'seconds': 0.0,
+                                               'histogram': {}}
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        _record(stats['histogram'], seconds * 1e9)
+        self.__notify(OPERATION, (name, seconds))
+
+    # A miss visits every node down to where the key would hang, so its
+    # descent is the depth of the would-be parent.  The key may have been
+    # inserted (or the tree emptied) since, in which case it is dropped.
+    def _record_misses(self):
+        misses, self._misses = self._misses, []
+        for key in misses:
+            if not self._Tree__root:
+                continue
+            try:
+                nParent = super(InstrumentedTree, self)._Tree__find_parent(key)
+            except LookupError:
+                continue
+            self.__record_descent(_depth(nParent))
+
+    def __record_descent(self, depth):
+        _record(self.__descents, depth)
+        self.__notify(DESCENT, depth)
+
+    def __record_case(self, cases, event, case):
+        cases[case] += 1
+        self.__notify(event, case)
+
+    # Tree calls its private hooks by their mangled names, so overriding
+    # those names here intercepts every call Tree makes to them
+    def _Tree__rotate(self, nFocus, direction):
+        self.__rotations += 1
+        self.__notify(ROTATION, direction)
+        super(InstrumentedTree, self)._Tree__rotate(nFocus, direction)
+
+    def find(self, key, _post_action = None):
+        try:
+            node = super(InstrumentedTree, self).find(key, _post_action)
+        except LookupError:
+            if _post_action != rbt.TREE_INSERT and self._Tree__root:
+                self._misses.append(key)
+            raise
+        if _post_action != rbt.TREE_INSERT:
+            self.__record_descent(_depth(node))
+        return node
+
+    def _Tree__find_parent(self, key):
+        nParent = super(InstrumentedTree, self)._Tree__find_parent(key)
+        self.__record_descent(_depth(nParent) + 1)
+        return nParent
+
+    def _Tree__insert_fixup(self, nFocus):
+        nStart = nFocus
+        while nFocus.parent and nFocus.parent.color == rbt.RED:
+            nParent, nGrandpa = nFocus.parent, nFocus.parent.parent
+            nUncle = nGrandpa.right if nGrandpa.left is nParent else \
+                    nGrandpa.left
+            if nUncle.color == rbt.RED:
+                self.__record_case(self.__insert_cases, INSERT_CASE, 1)
+                nFocus = nGrandpa
+                continue
+            if (nGrandpa.left is nParent) != (nParent.left is nFocus):
+                self.__record_case(self.__insert_cases, INSERT_CASE, 2)
+            self.__record_case(self.__insert_cases, INSERT_CASE, 3)
+            break
+        return super(InstrumentedTree, self)._Tree__insert_fixup(nStart)
+
+    def _Tree__delete_fixup(self, nFocus, nParent):
+        nStart, nStartParent = nFocus, nParent
+        while nFocus is not self._Tree__root and nFocus.color == rbt.BLACK:
+            direction = rbt.LEFT if nParent.left is nFocus else rbt.RIGHT
+            nSibling = nParent.get_child(1 - direction)
+            # Case 1 rotates the sibling's near child into its place and
+            # reddens the parent, so case 2 then ends the loop
+            reddened = nSibling.color == rbt.RED
+            if reddened:
+                self.__record_case(self.__delete_cases, DELETE_CASE, 1)
+                nSibling = nSibling.get_child(direction)
+            if nSibling.left.color == rbt.BLACK and \
+                    nSibling.right.color == rbt.BLACK:
+                self.__record_case(self.__delete_cases, DELETE_CASE, 2)
+                if reddened:
+                    break
+                nFocus, nParent = nParent, nParent.parent
+                continue
+            if nSibling.get_child(1 - direction).color == rbt.BLACK:
+                self.__record_case(self.__delete_cases, DELETE_CASE, 3)
+            self.__record_case(self.__delete_cases, DELETE_CASE, 4)
+            break
+        super(InstrumentedTree, self)._Tree__delete_fixup(nStart, nStartParent)
+
+for _name in _TIMED:
+    setattr(InstrumentedTree, _name,
+            _timed(_name, getattr(InstrumentedTree, _name)))
+del _name
+
+
+# Check the recorded cases against the rotations actually made: insert
+# cases 2 and 3 and delete cases 1, 3 and 4 each rotate exactly once
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        for count in range(1, test_count * 4, 7):
+            rand_array = list(range(count))
+            random.shuffle(rand_array)
+            tree, events = InstrumentedTree(debug = True), []
+            tree.add_callback(lambda event, value: events.append(event))
+            for key in rand_array:
+                tree.insert(key)
+                tree.validate(rbt.TREE_INSERT, incremental = True)
+            random.shuffle(rand_array)
+            for key in rand_array:
+                tree.delete(key)
+                tree.validate(rbt.TREE_DELETE, incremental = True)
+
+            stats = tree.snapshot()
+            inserts, deletes = stats['insert_cases'], stats['delete_cases']
+            rotations = inserts[2] + inserts[3] + \
+                    deletes[1] + deletes[3] + deletes[4]
+            if stats['rotations'] != rotations or \
+                    events.count(ROTATION) != rotations:
+                print('Rotations and fixup cases disagree at count:', count)
+                raise ArithmeticError
+            # The first insert makes a root without descending
+            operations = stats['operations']
+            if operations['insert']['count'] != count or \
+                    operations['delete']['count'] != count or \
+                    'find' in operations or \
+                    sum(stats['descents'].values()) != 2 * count - 1:
+                print('Operation counts mismatch at count:', count)
+                raise ArithmeticError
+
+            # A missed key would hang below the deeper of its neighbours,
+            # so its descent visits that neighbour's depth in nodes.  An
+            # empty tree still misses with LookupError, recording nothing.
+            tree, depths = InstrumentedTree(), []
+            for method in (tree.find, tree.delete):
+                try:
+                    method(0)
+                except LookupError:
+                    pass
+                else:
+                    print('Empty tree found a key at count:', count)
+                    raise KeyError
+            if tree.count(0) or tree.snapshot()['descents']:
+                print('Empty tree recorded a descent at count:', count)
+                raise ArithmeticError
+            for key in rand_array:
+                tree.insert(2 * key)
+            tree.add_callback(lambda event, value: event == DESCENT and
+                              depths.append(value))
+            for key in range(-1, 2 * count + 1, 2):
+                try:
+                    tree.find(key)
+                except LookupError:
+                    pass
+                else:
+                    print('Missing key found at count:', count)
+                    raise KeyError
+                expected = max(_depth(tree.floor(key)),
+                               _depth(tree.ceiling(key)))
+                if depths[-1:] != [expected]:
+                    print('Miss descent mismatch at val:', key)
+                    raise ArithmeticError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
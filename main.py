@@ -12,25 +12,46 @@ June 2014
     NodeField        -- Canvas of drawn Nodes representing the tree's stored keys.
                         This field is horizontally scrollable on touch screens.
 
+    BatchRenderer    -- Draws a large tree as a handful of batched canvas
+                        instructions, for trees too big for a widget per key.
+
+    WatchedTree      -- Red-Black Tree noting the nodes its rotations raise, so
+                        the node field knows which subtrees a mutation moved.
+
     TreeDisplay      -- App root which owns the button / text input menu, the
                         node field display and the tree back-end database.
 """
+from array import array
+import math
+import random
+
 from kivy.app import App
 from kivy.clock import Clock
-from kivy.properties import ObjectProperty, BooleanProperty
+from kivy.properties import ObjectProperty, BooleanProperty, \
+        NumericProperty, ListProperty
 from kivy.core.window import Window
+from kivy.core.text import Label as CoreLabel
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.scatter import Scatter
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.boxlayout import BoxLayout
-from kivy.graphics.vertex_instructions import Line
+from kivy.graphics.vertex_instructions import Line, Mesh, Rectangle
 from kivy.graphics.context_instructions import Color
+from kivy.graphics.instructions import InstructionGroup
+from kivy.graphics.transformation import Matrix
 
 import kivy.metrics as k_met
 import red_black_tree as rbt_ns
 
-(POS_X, POS_Y) = range(2)
+# Fields of a NodeField layout entry, one kept per drawn key
+(POS_X, POS_Y, DEPTH, WIDGET, EDGE) = range(5)
+# Levels of detail drawn by a BatchRenderer
+(DETAIL_POINTS, DETAIL_CIRCLES, DETAIL_LABELS) = range(3)
+
+# Keys accepted from the text input, and the most keys one Fill may add
+KEY_LIMIT = 999999
+FILL_LIMIT = 100000
 
 # Begin empty classes for cleaner kv syntax
 class ActionButtonBase(Button):
@@ -48,6 +69,9 @@ class DeleteButton(ActionButtonBase):
 class ClearButton(ActionButtonBase):
     pass
 
+class FillButton(ActionButtonBase):
+    pass
+
 class LandscapeMenu(BoxLayout):
     pass
 
@@ -59,25 +83,32 @@ class NodeFieldContainer(FloatLayout):
 class Node(Scatter):
     """ Graphical representation of a red or black node in the tree.
 
-    A Node object will be generated for each key in the red-black tree.
-    These exist only for the duration of the current canvas drawing and
-    are not tied to the persistence of the red-black tree numeric keys
-    which they represent.
+    A Node object is shown for each key in the red-black tree.  Nodes are
+    pooled by the NodeField: a node whose key leaves the tree is detached
+    and later shown again for another key, so its key and color may change.
 
     Class variable:
     radius -- A length unit used by the NodeField for determining canvas
               draw sizes and distances.  Note that Kivy requires
               class level properties for any canvas interface.
+
+    node_key / canvas_color -- The key shown and the fill color.  These are
+              Kivy properties, so the kv rules follow any change.
     """
     radius = 10
+    node_key = NumericProperty(0)
+    canvas_color = ListProperty([1, 0, 0, 1])
 
     def __init__(self, node_key = 0, node_color = rbt_ns.RED, **kwargs):
+        super(Node, self).__init__(**kwargs)
         self.node_key = node_key
+        self.set_color(node_color)
+
+    def set_color(self, node_color):
         if node_color == rbt_ns.RED:
-            self.canvas_color = (1, 0, 0, 1)
+            self.canvas_color = [1, 0, 0, 1]
         elif node_color == rbt_ns.BLACK:
-            self.canvas_color = (0, 0, 0, 1)
-        super(Node, self).__init__(**kwargs)
+            self.canvas_color = [0, 0, 0, 1]
 
 
 class NodeValTextInput(TextInput):
@@ -116,11 +147,28 @@ class NodeField(Scatter):
         by means of user swiping.  The drawn field persists only for the
         duration of the application
 
+        Node coordinates are kept in a layout cache beside the tree, never in
+        the tree's values.  After an insert or delete only the subtree below
+        the nodes the mutation touched or raised is laid out again; the whole
+        field is repositioned only when the tree's height changes.  A Fill
+        may insert anywhere, so it is laid out in full, as Redraw is.  Node
+        widgets and edge lines are reused from pools rather than rebuilt.
+
+        Past BATCH_THRESHOLD keys the widgets are dropped and a BatchRenderer
+        draws the tree instead.  The field may then be panned vertically as
+        well and zoomed, by pinching or with the mouse wheel; both move only
+        the field's transform, so the GPU does the work until the view leaves
+        the region last built.
+
     Class variable / Interface:
     draw_action -- An event container which triggers redraw when modified.
                    Kivy requires properties be defined at the class level.
+                   Set to (action id, action, key, touched nodes).
+
+    BATCH_THRESHOLD -- Key count beyond which the tree is drawn batched.
     """
     draw_action = ObjectProperty()
+    BATCH_THRESHOLD = 512
 
     def __init__(self, **kwargs):
         super(NodeField, self).__init__(**kwargs)
@@ -128,6 +176,13 @@ class NodeField(Scatter):
         self.origin = (self.get_center_x(), self.get_center_y())
         self.coords_valid = False
         self.rbt_draw_depth = 0
+        self.layout = {}
+        self.depth_counts = {}
+        self.node_pool = []
+        self.edge_pool = []
+        self.batched = False
+        self.renderer = BatchRenderer(self.canvas)
+        self.bind(transform = self._draw_batched)
         self._async_init_trigger = Clock.create_trigger(self.__async__init__)
         self._async_init_trigger()
 
@@ -151,10 +206,25 @@ class NodeField(Scatter):
             return
         self.origin = current_position
         self.coords_valid = True
-        self._draw_tree_on_canvas(self, ('Redraw', False, 0))
+        self._draw_tree_on_canvas(self, (0, 'Redraw', None, ()))
+
+    # Batched, the whole container area grabs touches for panning and zooming
+    def collide_point(self, x, y):
+        if self.batched:
+            return self.parent.collide_point(x, y)
+        return super(NodeField, self).collide_point(x, y)
 
     # This handler is called implicitly by the Kivy framework on user touch
     def on_touch_down(self, touch):
+        if self.batched:
+            if getattr(touch, 'button', None) in ('scrollup', 'scrolldown') \
+                    and self.collide_point(*touch.pos):
+                factor = 1 / 1.2 if touch.button == 'scrollup' else 1.2
+                self.apply_transform(Matrix().scale(factor, factor, 1),
+                                     anchor = touch.pos)
+                return True
+            return super(NodeField, self).on_touch_down(touch)
+
         # Fake the X axis position to 'enable' endless horizontal scrolling
         touch.push()
         touch.x = self.get_center_x()
@@ -163,9 +233,21 @@ class NodeField(Scatter):
         return ret
 
     # Oddly enough, Kivy passes self twice to this handler
-    def _draw_tree_on_canvas(self, self_again, unused_object):
-        self.clear_widgets()
-        self.canvas.clear()
+    def _draw_tree_on_canvas(self, self_again, draw_action):
+        rbt_db = self.parent.parent.rbt_db
+        unused_id, action, key, touched = draw_action
+        if len(rbt_db) > self.BATCH_THRESHOLD:
+            refit = action in ('Redraw', 'Clear') or not self.batched
+            if not self.batched:
+                self._enter_batched()
+            self.renderer.load(rbt_db)
+            if refit:
+                self._fit_view()
+            self._draw_batched()
+            return
+        elif self.batched:
+            self._leave_batched()
+            action = 'Redraw'
 
         # Must re-center the tree on every redraw because app re-orientation
         # events handled internally by Kivy force a widget level position
@@ -174,52 +256,416 @@ class NodeField(Scatter):
         # can end up drawn either off the screen, or over the buttons, or worse.
         self.set_center_x(self.origin[POS_X])
         self.set_center_y(self.origin[POS_Y])
-        self.rbt_draw_depth = 0
-        self.parent.parent.rbt_db.traverse(self._find_tree_depth, rbt_ns.IN_ORDER)
-        self.parent.parent.rbt_db.traverse(self._draw_field_node, rbt_ns.PRE_ORDER)
-
-    # This event will be called back from the tree traversal for each key.
-    def _find_tree_depth(self, db_node, node_depth):
-        if self.rbt_draw_depth < node_depth:
-            self.rbt_draw_depth = node_depth
+        if action == 'Delete' and key in self.layout:
+            self._release(key)
+        # A rotation moves the subtree below the node it raises.  A fill
+        # inserts keys all over the tree, so it is always laid out in full.
+        touched = list(touched) + rbt_db.raised
+        db_top = self._common_ancestor(touched)
+        if action in ('Redraw', 'Clear', 'Fill') or db_top is None:
+            self._layout_all(rbt_db)
+            return
 
-    # This event will be called back from the tree traversal for each key.
-    # Kivy metrics are leveraged (as k_met) to keep distances relative to
-    # the size of the device screen.
+        prev_draw_depth = self.rbt_draw_depth
+        self._count_depths(db_top, self._depth_of(db_top))
+        if self.rbt_draw_depth != prev_draw_depth:
+            # Every horizontal offset depends on the tree height
+            self._layout_subtree(self._root_of(db_top))
+        else:
+            self._layout_subtree(db_top)
+
+        # Fixup recolors ancestors and their other children in place
+        db_node = db_top.parent
+        while db_node:
+            for db_child in (db_node, db_node.left, db_node.right):
+                if not db_child.is_nil():
+                    self.layout[db_child.key][WIDGET].set_color(db_child.color)
+            db_node = db_node.parent
+
+    def _enter_batched(self):
+        for key in list(self.layout):
+            self._release(key)
+        self.batched = True
+        self.do_scale = True
+        self.do_translation_y = True
+        self.scale_min = 1e-4
+
+    def _leave_batched(self):
+        self.batched = False
+        self.renderer.clear()
+        self.do_scale = False
+        self.do_translation_y = False
+        self.transform = Matrix()
+
+    # Scale the whole tree to fit the container and center it there, in one
+    # assignment so the region is built only for the final transform
+    def _fit_view(self):
+        box = self.parent
+        width, height = self.renderer.size()
+        scale = 0.95 * min(1.0, box.width / width, box.height / height)
+        self.transform = Matrix().scale(scale, scale, 1).translate(
+                box.x + (box.width - width * scale) / 2,
+                box.y + (box.height - height * scale) / 2, 0)
+
+    # The container's area in field coordinates, as (x0, y0, x1, y1)
+    def _view(self):
+        box = self.parent
+        x0, y0 = self.to_local(box.x, box.y)
+        x1, y1 = self.to_local(box.right, box.top)
+        return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+    # Bound to transform changes, so panning and zooming land here
+    def _draw_batched(self, *unused_args):
+        if not self.batched:
+            return
+        view = self._view()
+        if not self.renderer.covers(view, self.scale):
+            self.renderer.draw(view, self.scale)
+
+    # Lay out every node again, releasing the widgets of keys since removed
+    def _layout_all(self, rbt_db):
+        db_root = rbt_db.boundary(rbt_ns.LOWEST_KEY)
+        walked = list(self._walk(self._root_of(db_root), 1)) if db_root else []
+        kept = set(db_node.key for db_node, unused_depth in walked)
+        for key in list(self.layout):
+            if key not in kept:
+                self._release(key)
+        self.depth_counts = {}
+        for unused_node, node_depth in walked:
+            self.depth_counts[node_depth] = \
+                    self.depth_counts.get(node_depth, 0) + 1
+        self._update_draw_depth()
+        if db_root:
+            self._layout_subtree(self._root_of(db_root))
+
+    # Move the subtree's keys from their cached depths to their new ones
+    def _count_depths(self, db_top, top_depth):
+        for db_node, node_depth in self._walk(db_top, top_depth):
+            entry = self.layout.get(db_node.key)
+            if entry is not None:
+                self.depth_counts[entry[DEPTH]] -= 1
+            self.depth_counts[node_depth] = \
+                    self.depth_counts.get(node_depth, 0) + 1
+        self._update_draw_depth()
+
+    def _update_draw_depth(self):
+        self.rbt_draw_depth = max([depth for depth, count in
+                                   self.depth_counts.items() if count] or [0])
+
+    # Pre-order walk of a subtree, yielding each node with its depth
+    def _walk(self, db_top, top_depth):
+        stack = [(db_top, top_depth)]
+        while stack:
+            db_node, node_depth = stack.pop()
+            yield db_node, node_depth
+            for db_child in (db_node.right, db_node.left):
+                if not db_child.is_nil():
+                    stack.append((db_child, node_depth + 1))
+
+    def _depth_of(self, db_node):
+        node_depth = 0
+        while db_node:
+            node_depth += 1
+            db_node = db_node.parent
+        return node_depth
+
+    def _root_of(self, db_node):
+        while db_node.parent:
+            db_node = db_node.parent
+        return db_node
+
+    # The deepest node above (or among) all of the given nodes
+    def _common_ancestor(self, db_nodes):
+        db_top = None
+        for db_node in db_nodes:
+            if db_node is None:
+                return None
+            elif db_top is None:
+                db_top = db_node
+                continue
+            top_depth, node_depth = self._depth_of(db_top), self._depth_of(db_node)
+            while top_depth > node_depth:
+                db_top, top_depth = db_top.parent, top_depth - 1
+            while node_depth > top_depth:
+                db_node, node_depth = db_node.parent, node_depth - 1
+            while db_top is not db_node:
+                db_top, db_node = db_top.parent, db_node.parent
+        return db_top
+
+    # Calculate and store the X / Y coordinates of each Node in the subtree,
+    # parents first, then move its widget and edge there.  Kivy metrics are
+    # leveraged (as k_met) to keep distances relative to the size of the
+    # device screen.
     #
     # TODO: Need to rescale the canvas drawing after nodes reach the screen edge.
     #       Must keep all the nodes on the screen vertically but can not allow
     #       the user to drag and scale field, as this will overlap with buttons.
-    def _draw_field_node(self, db_node, node_depth):
-        # First, calculate and store the X / Y coordinates of the Node
-        if not db_node.parent:
-            db_node.value = (self.get_center_x(),
-                             self.get_center_y() + \
-                             k_met.sp((self.rbt_draw_depth - 1) * 2 * Node.radius))
-        else:
-            if db_node is db_node.parent.child[rbt_ns.LEFT]:
-                DIRECTION_INDICATOR = -1
+    def _layout_subtree(self, db_top):
+        for db_node, node_depth in self._walk(db_top, self._depth_of(db_top)):
+            if not db_node.parent:
+                x_position = self.get_center_x()
+                y_position = self.get_center_y() + \
+                        k_met.sp((self.rbt_draw_depth - 1) * 2 * Node.radius)
             else:
-                DIRECTION_INDICATOR = 1
-            x_offset = 2 ** (self.rbt_draw_depth - node_depth - 1)
-            x_position = db_node.parent.value[POS_X] + \
-                    k_met.sp((2 * Node.radius * x_offset * DIRECTION_INDICATOR))
-            y_position = db_node.parent.value[POS_Y] - \
-                    k_met.sp((2 * 2 * Node.radius))
-            db_node.value = (x_position, y_position)
-
-        # Next, draw the graphical node onto the canvas using previous coordinates
-        new_node = Node(db_node.key, db_node.color)
-        new_node.set_center_x(db_node.value[POS_X])
-        new_node.set_center_y(db_node.value[POS_Y])
+                if db_node is db_node.parent.child[rbt_ns.LEFT]:
+                    DIRECTION_INDICATOR = -1
+                else:
+                    DIRECTION_INDICATOR = 1
+                parent_entry = self.layout[db_node.parent.key]
+                x_offset = 2 ** (self.rbt_draw_depth - node_depth - 1)
+                x_position = parent_entry[POS_X] + \
+                        k_met.sp((2 * Node.radius * x_offset * DIRECTION_INDICATOR))
+                y_position = parent_entry[POS_Y] - k_met.sp((2 * 2 * Node.radius))
+
+            entry = self.layout.get(db_node.key)
+            if entry is None:
+                entry = self.layout[db_node.key] = \
+                        [0, 0, 0, self._acquire_node(db_node.key), None]
+            entry[POS_X], entry[POS_Y], entry[DEPTH] = \
+                    x_position, y_position, node_depth
+            entry[WIDGET].set_color(db_node.color)
+            entry[WIDGET].set_center_x(x_position)
+            entry[WIDGET].set_center_y(y_position)
+
+            if not db_node.parent:
+                if entry[EDGE] is not None:
+                    entry[EDGE].points = []
+                    self.edge_pool.append(entry[EDGE])
+                    entry[EDGE] = None
+                continue
+            if entry[EDGE] is None:
+                entry[EDGE] = self._acquire_edge()
+            entry[EDGE].points = [x_position,
+                                  y_position + k_met.sp(Node.radius),
+                                  parent_entry[POS_X],
+                                  parent_entry[POS_Y] - k_met.sp(Node.radius)]
+
+    def _acquire_node(self, key):
+        if self.node_pool:
+            new_node = self.node_pool.pop()
+            new_node.node_key = key
+        else:
+            new_node = Node(key)
         self.add_widget(new_node)
-        if db_node.parent:
-            with self.canvas:
-                Color(0, 0, 1, 1)
-                Line(points = [db_node.value[POS_X],
-                               db_node.value[POS_Y] + k_met.sp(Node.radius),
-                               db_node.parent.value[POS_X],
-                               db_node.parent.value[POS_Y] - k_met.sp(Node.radius)])
+        return new_node
+
+    def _acquire_edge(self):
+        if self.edge_pool:
+            return self.edge_pool.pop()
+        with self.canvas:
+            Color(0, 0, 1, 1)
+            return Line(points = [])
+
+    # Hide a key's widget and edge, keeping both for reuse
+    def _release(self, key):
+        entry = self.layout.pop(key)
+        self.depth_counts[entry[DEPTH]] -= 1
+        self.remove_widget(entry[WIDGET])
+        self.node_pool.append(entry[WIDGET])
+        if entry[EDGE] is not None:
+            entry[EDGE].points = []
+            self.edge_pool.append(entry[EDGE])
+
+
+class BatchRenderer(object):
+    """ Draws a whole tree as a few batched canvas instructions.
+
+    Keys are placed by in-order rank across and by depth down, so the field
+    grows linearly with the key count.  Edges are drawn by line Meshes and
+    circles by triangle Meshes, one of each color; Kivy indexes mesh
+    vertices with unsigned shorts, so a batch past MESH_VERTICES is split.
+    Key labels are drawn from a texture cache.
+
+    Only the region around the view is built: the view plus half its size
+    on every side.  Nodes and edges outside it are culled, and the level of
+    detail follows the zoom: single points while nodes are tiny on screen,
+    circles above POINT_RADIUS pixels, and labels above LABEL_RADIUS.
+    The region is built again only once the view leaves it or the level of
+    detail changes, so panning and zooming within it cost nothing here.
+
+    Interfaces:
+    load   -- Lay out the given tree, in O(n).
+    size   -- Return the (width, height) of the laid out field.
+    covers -- Whether the region built serves the given view and scale.
+    draw   -- Build the region around the given view at the given scale.
+    clear  -- Remove everything drawn.
+    """
+    SEGMENTS = 8
+    POINT_RADIUS = 1.5
+    LABEL_RADIUS = 8
+    MESH_VERTICES = 65535
+    LABEL_CACHE = 4096
+
+    def __init__(self, canvas):
+        self.group = InstructionGroup()
+        canvas.add(self.group)
+        self.textures = {}
+        self.radius = k_met.sp(Node.radius)
+        self.spacing = 2.5 * self.radius
+        self.level_height = 2 * 2 * self.radius
+        self.rim = [(self.radius * math.cos(2 * math.pi * side / self.SEGMENTS),
+                     self.radius * math.sin(2 * math.pi * side / self.SEGMENTS))
+                    for side in range(self.SEGMENTS)]
+        self.keys, self.colors = [], array('b')
+        self.depths, self.parents = array('i'), array('i')
+        self.max_depth = 0
+        self.built = None
+
+    def load(self, rbt_db):
+        keys, colors, depths, parent_keys = [], array('b'), array('i'), []
+
+        def add_node(db_node, node_depth):
+            keys.append(db_node.key)
+            colors.append(db_node.color)
+            depths.append(node_depth)
+            parent_keys.append(db_node.parent.key if db_node.parent else None)
+        rbt_db.traverse(add_node, rbt_ns.IN_ORDER)
+
+        index_of = dict((key, index) for index, key in enumerate(keys))
+        self.parents = array('i', [-1 if key is None else index_of[key]
+                                   for key in parent_keys])
+        self.keys, self.colors, self.depths = keys, colors, depths
+        self.max_depth = max(depths) if depths else 0
+        self.built = None
+
+    def size(self):
+        return (2 * self.radius + max(len(self.keys) - 1, 0) * self.spacing,
+                2 * self.radius + max(self.max_depth - 1, 0) * self.level_height)
+
+    def position(self, index):
+        return (self.radius + index * self.spacing,
+                self.radius + (self.max_depth - self.depths[index]) * \
+                        self.level_height)
+
+    def detail(self, scale):
+        if self.radius * scale < self.POINT_RADIUS:
+            return DETAIL_POINTS
+        elif self.radius * scale < self.LABEL_RADIUS:
+            return DETAIL_CIRCLES
+        return DETAIL_LABELS
+
+    def covers(self, view, scale):
+        if self.built is None:
+            return False
+        x0, y0, x1, y1, detail = self.built
+        return detail == self.detail(scale) and x0 <= view[0] and \
+                y0 <= view[1] and view[2] <= x1 and view[3] <= y1
+
+    def clear(self):
+        self.group.clear()
+        self.built = None
+
+    def draw(self, view, scale):
+        x0, y0, x1, y1 = view
+        margin_x, margin_y = (x1 - x0) / 2, (y1 - y0) / 2
+        x0, y0, x1, y1 = x0 - margin_x, y0 - margin_y, x1 + margin_x, y1 + margin_y
+        detail = self.detail(scale)
+        self.built = (x0, y0, x1, y1, detail)
+        self.group.clear()
+        if not self.keys:
+            return
+
+        # Ranks, and so x, ascend with the index; depths bound y
+        radius, spacing = self.radius, self.spacing
+        low = max(0, int(math.ceil((x0 - 2 * radius) / spacing)))
+        high = min(len(self.keys), int(math.floor(x1 / spacing)) + 1)
+        top_depth = self.max_depth - y1 / self.level_height
+        bottom_depth = self.max_depth - (y0 - 2 * radius) / self.level_height
+        shown = [index for index in range(low, high)
+                 if top_depth <= self.depths[index] <= bottom_depth]
+
+        # An edge crossing the region has its child among the ancestors of
+        # the nodes in its columns, or of the column just outside either
+        # edge; walks stop at ancestors already taken
+        edges, taken = [], set()
+        for index in range(max(low - 1, 0), min(high + 1, len(self.keys))):
+            while self.parents[index] >= 0 and index not in taken:
+                taken.add(index)
+                parent = self.parents[index]
+                child_x, parent_x = self.position(index)[0], self.position(parent)[0]
+                if min(child_x, parent_x) <= x1 and max(child_x, parent_x) >= x0 \
+                        and self.depths[parent] <= bottom_depth and \
+                        self.depths[index] >= top_depth:
+                    edges.append(index)
+                index = parent
+
+        self.group.add(Color(0, 0, 1, 1))
+        self._add_edges(edges)
+        for node_color, rgba in ((rbt_ns.RED, (1, 0, 0, 1)),
+                                 (rbt_ns.BLACK, (0, 0, 0, 1))):
+            self.group.add(Color(*rgba))
+            self._add_circles([index for index in shown
+                               if self.colors[index] == node_color],
+                              detail == DETAIL_POINTS)
+        if detail == DETAIL_LABELS:
+            self.group.add(Color(1, 1, 1, 1))
+            for index in shown:
+                texture = self._texture(self.keys[index])
+                x_position, y_position = self.position(index)
+                self.group.add(Rectangle(
+                        texture = texture, size = texture.size,
+                        pos = (x_position - texture.width / 2.0,
+                               y_position - texture.height / 2.0)))
+
+    def _add_edges(self, edges):
+        step = self.MESH_VERTICES // 2
+        for start in range(0, len(edges), step):
+            vertices = []
+            for index in edges[start:start + step]:
+                child_x, child_y = self.position(index)
+                parent_x, parent_y = self.position(self.parents[index])
+                vertices += [child_x, child_y, 0, 0, parent_x, parent_y, 0, 0]
+            self.group.add(Mesh(vertices = vertices, mode = 'lines',
+                                indices = range(len(vertices) // 4)))
+
+    # Each circle is a fan of triangles around its center, or a lone point
+    def _add_circles(self, shown, points):
+        per_node = 1 if points else self.SEGMENTS + 1
+        step = self.MESH_VERTICES // per_node
+        for start in range(0, len(shown), step):
+            vertices, indices = [], []
+            for index in shown[start:start + step]:
+                x_position, y_position = self.position(index)
+                center = len(vertices) // 4
+                vertices += [x_position, y_position, 0, 0]
+                if points:
+                    indices.append(center)
+                    continue
+                for x_offset, y_offset in self.rim:
+                    vertices += [x_position + x_offset, y_position + y_offset, 0, 0]
+                for side in range(self.SEGMENTS):
+                    indices += [center, center + 1 + side,
+                                center + 1 + (side + 1) % self.SEGMENTS]
+            self.group.add(Mesh(vertices = vertices, indices = indices,
+                                mode = 'points' if points else 'triangles'))
+
+    def _texture(self, key):
+        texture = self.textures.get(key)
+        if texture is None:
+            if len(self.textures) >= self.LABEL_CACHE:
+                self.textures.clear()
+            label = CoreLabel(text = str(key), font_size = self.radius)
+            label.refresh()
+            texture = self.textures[key] = label.texture
+        return texture
+
+
+class WatchedTree(rbt_ns.Tree):
+    """ Red-Black Tree noting each node a rotation raises into another's place.
+
+    Instance variable:
+    raised -- The nodes raised since the list was last emptied.  Every node
+              moved by those rotations lies below one of them.  The caller
+              empties it before each mutation it wants to watch.
+    """
+    def __init__(self, *args, **options):
+        self.raised = []
+        super(WatchedTree, self).__init__(*args, **options)
+
+    # Tree calls its private __rotate by this mangled name
+    def _Tree__rotate(self, nFocus, direction):
+        super(WatchedTree, self)._Tree__rotate(nFocus, direction)
+        self.raised.append(nFocus.parent)
 
 
 class TreeDisplay(BoxLayout):
@@ -231,16 +677,36 @@ class TreeDisplay(BoxLayout):
         self.ui_locked = True
         self.buttons_locked = False
         self.action_id = 0
-        self.rbt_db = rbt_ns.Tree()
+        self.rbt_db = WatchedTree()
         self.rbt_op = {'Redraw': lambda unused: None,
-                       'Insert': self.rbt_db.insert,
-                       'Delete': self.rbt_db.delete,
+                       'Insert': self._insert,
+                       'Delete': self._delete,
+                       'Fill'  : self._fill,
                        'Clear' : self.rbt_db.__init__}
         self.rbt_nf = None
         self.nv_ti = None
         self._comp_wait_trigger = Clock.create_trigger(self._comp_wait_handler)
         self._comp_wait_trigger()
 
+    # The insert and delete actions return the nodes they touched, which
+    # with the raised nodes bound the part of the field to lay out again
+    def _insert(self, key):
+        return [self.rbt_db.insert(key)]
+
+    def _delete(self, key):
+        db_parent = self.rbt_db.find(key).parent
+        self.rbt_db.delete(key)
+        return [db_parent]
+
+    # Insert up to the given count of random keys not yet in the tree.  No
+    # touched nodes are returned, as the field lays out a fill in full.
+    def _fill(self, count):
+        keys = random.sample(xrange(1, KEY_LIMIT + 1), count)
+        found = self.rbt_db.contains_many(keys)
+        self.rbt_db.bulk_insert([key for key, present in zip(keys, found)
+                                 if not present])
+        return []
+
     # This trigger will re-activate itself until the app components
     # are ready for user interaction.
     def _comp_wait_handler(self, time_elapsed):
@@ -275,9 +741,10 @@ class TreeDisplay(BoxLayout):
             print 'TextInput not found - will not %s' % (input_option)
             return
 
+        del self.rbt_db.raised[:]
         if input_option in ('Redraw', 'Clear'):
             self.rbt_op[input_option](None)
-            self.rbt_nf.draw_action = (self.action_id)
+            self.rbt_nf.draw_action = (self.action_id, input_option, None, ())
             return
 
         try:
@@ -286,20 +753,21 @@ class TreeDisplay(BoxLayout):
             print 'invalid input \'%s\' - will not %s' % \
                     (self.nv_ti.text, input_option)
             return
-        if key < 1 or key > 999:
+        limit = FILL_LIMIT if input_option == 'Fill' else KEY_LIMIT
+        if key < 1 or key > limit:
             print 'integer %s out of range - will not %s' % \
                     (self.nv_ti.text, input_option)
             return
 
         try:
-            self.rbt_op[input_option](key)
+            touched = self.rbt_op[input_option](key)
         except LookupError:
             if input_option == 'Insert':
                 print 'duplicate key found in tree - will not Insert'
             elif input_option == 'Delete':
                 print 'key not found in tree - will not Delete'
             return
-        self.rbt_nf.draw_action = (self.action_id)
+        self.rbt_nf.draw_action = (self.action_id, input_option, key, touched)
 
 
 class Tree_GUIApp(App):
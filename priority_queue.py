@@ -0,0 +1,200 @@
+""" Double-ended priority queue built on the Red-Black Tree
+
+mduder.net
+October 2026
+
+Classes:
+    PriorityQueue -- Queue of items ordered by priority, caching the lowest
+                     and highest nodes of its tree so either end is read in
+                     O(1) and popped in amortized O(1).  Items pushed with
+                     equal priorities leave in the order they were pushed.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import heapq
+import itertools
+import random
+
+import red_black_tree as rbt
+
+
+class PriorityQueue(object):
+    """ Items ordered by priority, with O(1) access to both ends
+
+    Every item is held by a tree node keyed by (priority, sequence), where
+    the sequence number increases with each push.  Keys are therefore
+    unique, ties between equal priorities break first-in first-out, and
+    items themselves are never compared.  Priorities may be of any totally
+    ordered type other than None.
+
+    The lowest and highest nodes are cached and kept up to date on every
+    push and removal.  Popping an end hands the cache the node's in-order
+    neighbour, found by a parent walk, and unlinks the node without
+    searching for its key; both take amortized O(1) time.
+
+    Interfaces:
+    push     -- Add an item with the given priority in O(log(n)), and return
+                a handle to it for decrease_key and remove.
+
+    peek_min / peek_max -- Return the (priority, item) pair with the lowest /
+                highest priority in O(1).  An empty queue raises IndexError.
+
+    pop_min / pop_max -- Remove and return the (priority, item) pair with the
+                lowest / highest priority in amortized O(1).
+
+    decrease_key -- Lower the priority of the item behind a handle, and
+                return the item's new handle.  The old handle is spent.
+                Raising a priority raises ValueError.
+
+    remove   -- Remove the item behind a handle and return its
+                (priority, item) pair.  The handle is spent.
+
+    Passing a spent handle, whose item was popped or removed, to
+    decrease_key or remove raises KeyError.
+
+    len(queue) returns the item count in O(1).
+    """
+
+    def __init__(self, items = None):
+        self.__tree = rbt.Tree()
+        self.__sequence = itertools.count()
+        self.__min = self.__max = None
+        if items is not None:
+            for priority, item in items:
+                self.push(priority, item)
+
+    def __len__(self):
+        return len(self.__tree)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__,
+                           [(node.key[0], node.value)
+                            for node in self.__tree.iter_range()])
+
+    def push(self, priority, item = None):
+        if priority is None:
+            raise TypeError
+        node = self.__tree.insert((priority, next(self.__sequence)), item)
+        if self.__min is None or node.key < self.__min.key:
+            self.__min = node
+        if self.__max is None or self.__max.key < node.key:
+            self.__max = node
+        return node
+
+    def peek_min(self):
+        return self.__entry(self.__min)
+
+    def peek_max(self):
+        return self.__entry(self.__max)
+
+    def pop_min(self):
+        return self.remove(self.__min)
+
+    def pop_max(self):
+        return self.remove(self.__max)
+
+    def decrease_key(self, handle, priority):
+        if handle.is_nil():
+            raise KeyError
+        elif handle.key[0] < priority:
+            raise ValueError
+        _, item = self.remove(handle)
+        return self.push(priority, item)
+
+    # The neighbours are found before unlinking, while the node's parent
+    # aliases still lead back into the tree
+    def remove(self, handle):
+        entry = self.__entry(handle)
+        if handle.is_nil():
+            raise KeyError
+        if handle is self.__min:
+            self.__min = self.__tree.adjacent(handle, rbt.RIGHT)
+        if handle is self.__max:
+            self.__max = self.__tree.adjacent(handle, rbt.LEFT)
+        self.__tree.delete_node(handle)
+        return entry
+
+    def __entry(self, node):
+        if node is None:
+            raise IndexError('priority queue is empty')
+        return node.key[0], node.value
+
+
+# Sanity check the queue against a sorted list, interleaving pushes with
+# pops from both ends and priority decreases
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        for count in range(1, test_count):
+            queue, expected, handles = PriorityQueue(), [], []
+            for item in range(count):
+                priority = random.randrange(count // 2 + 1)
+                handles.append(queue.push(priority, item))
+                expected.append((priority, item))
+            for index in range(0, count, 3):
+                priority = expected[index][0] - random.randrange(3)
+                handles[index] = queue.decrease_key(handles[index], priority)
+                expected[index] = (priority, index)
+
+            # Equal priorities pop in push order, and decreases push anew
+            order = sorted(range(count),
+                           key = lambda item: (expected[item][0],
+                                               handles[item].key[1]))
+            ordered = [expected[item] for item in order]
+            while ordered:
+                if len(queue) != len(ordered) or \
+                        queue.peek_min() != ordered[0] or \
+                        queue.peek_max() != ordered[-1]:
+                    print('Queue ends mismatch at count:', count)
+                    raise ValueError
+                if random.randrange(2):
+                    popped, wanted = queue.pop_min(), ordered.pop(0)
+                else:
+                    popped, wanted = queue.pop_max(), ordered.pop()
+                if popped != wanted:
+                    print('Queue pop mismatch at count:', count)
+                    raise ValueError
+            if queue:
+                print('Queue not empty at count:', count)
+                raise ValueError
+
+            # The queue must agree with heapq on the order of pops
+            heap = []
+            for item in range(count):
+                entry = (random.randrange(count), item)
+                heapq.heappush(heap, entry)
+                queue.push(*entry)
+            while heap:
+                if queue.pop_min() != heapq.heappop(heap):
+                    print('Queue disagrees with heapq at count:', count)
+                    raise ValueError
+
+            # Spent handles must be refused without touching the tree
+            if count < 3:
+                continue
+            handles = [queue.push(item, item) for item in range(count)]
+            handle = queue.decrease_key(handles[0], -1)
+            queue.remove(handle)
+            queue.pop_max()
+            for spent in (handles[0], handle, handles[-1]):
+                for reuse in (queue.remove,
+                              lambda spent: queue.decrease_key(spent, -2)):
+                    try:
+                        reuse(spent)
+                    except KeyError:
+                        continue
+                    print('Spent handle accepted at count:', count)
+                    raise ValueError
+            queue._PriorityQueue__tree.validate()
+            if [queue.pop_min() for _ in range(len(queue))] != \
+                    [(item, item) for item in range(1, count - 1)]:
+                print('Queue changed by spent handles at count:', count)
+                raise ValueError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
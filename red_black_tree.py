@@ -6,11 +6,23 @@ February 2014
 Classes:
     Node -- Construct with Red-Black and general Binary Search Tree node properties
 
+    AugmentedNode -- Node which also tracks the size of its subtree
+
+    SummaryNode -- AugmentedNode which also holds a summary of its subtree,
+            such as the highest interval endpoint or the sum of its values
+
     Tree -- Construct supporting common Binary Search Tree methods
             This tree is NOT performant.  The implementation goal
             is to minimize lines of code and maximize readibility.
+
+    PersistentNode -- Node without a parent alias, never changed once linked
+
+    PersistentTree -- Immutable Tree whose insert, delete and update return
+            a new version sharing all untouched subtrees with the old one
 """
 from __future__ import print_function
+import bisect
+import functools
 import random
 
 (RED, BLACK), (LEFT, RIGHT), (_REPORTED, _ACTUAL) = range(2), range(2), range(2)
@@ -23,8 +35,11 @@ class Node(object):
     """ Container for a key and it's associated meta-data
 
     Instance variables:
-    key -- The integer-based value used for comparing against other nodes
-                existing in a given Tree for locating values and positions.
+    key -- The value used for comparing against other nodes existing in
+                a given Tree for locating values and positions.  Any totally
+                ordered type other than None may be used.
+
+    value -- The payload associated with the key (None when not given).
 
     color -- The node property which a Red-Black tree leverages, binding
                 its height to O(log(n)) where n is the tree node count.
@@ -33,52 +48,120 @@ class Node(object):
                 path tracing during tree traversal.  An alternative to using
                 parent aliases would be to store the path walked in a stack.
 
-    child -- A pair of aliases to the node's direct descendants.
+    left, right -- Aliases to the node's direct descendants.  Missing children
+                are represented by the owning tree's single NIL sentinel,
+                so no nil objects are allocated per key.
+
+    child -- Read-only (left, right) pair for direction-indexed access.
+                Hot paths use get_child, which allocates no tuple.
+
+    Nodes declare __slots__, so they carry no per-instance __dict__.
 
     Interfaces:
     compare -- This class method will compare the keys of two nodes
                 (passed as arguments) and return the direction of the node
-                with the lower value.
+                with the lower value.  An optional key function maps each
+                key to the value it is ordered by.
+
+    get_child -- Return the descendant in the given direction.
+
+    set_child -- Alias the given node as the descendant in the given direction.
 
     is_nil -- Per CLRS spec, Nil nodes contain no value, no children, and
                 are guaranteed to be black.  This helper method was introduced
                 to abstract the check out from the Tree methods (algorithms).
     """
+    __slots__ = ('key', 'value', 'color', 'parent', 'left', 'right')
 
     @classmethod
-    def compare(cls, n1, n2):
+    def compare(cls, n1, n2, order = None):
         if not isinstance(n1, Node) or not isinstance(n2, Node):
             raise TypeError
         elif n1.key is None or n2.key is None:
             raise KeyError
-        elif n1.key < n2.key:
+        k1, k2 = (n1.key, n2.key) if order is None else \
+                (order(n1.key), order(n2.key))
+        if k1 < k2:
             return LEFT
-        elif n1.key > n2.key:
+        elif k2 < k1:
             return RIGHT
         else:
             return None
 
-    def __init__(self, key, value = None, nil = False):
+    # Constructing without a nil sentinel produces a sentinel itself
+    def __init__(self, key, value = None, nil = None):
         self.parent = None
         self.key = key
-        if value:
-            self.value = value
+        self.value = value
 
-        if nil:
+        if nil is None:
             self.color = BLACK
-            self.child = [None, None]
+            self.left = self.right = None
         else:
             self.color = RED
-            self.child = [Node(None, None, True),
-                            Node(None, None, True)]
-            self.child[LEFT].parent = self
-            self.child[RIGHT].parent = self
+            self.left = self.right = nil
+
+    @property
+    def child(self):
+        return (self.left, self.right)
+
+    def get_child(self, direction):
+        if direction == LEFT:
+            return self.left
+        return self.right
+
+    def set_child(self, direction, node):
+        if direction == LEFT:
+            self.left = node
+        else:
+            self.right = node
 
     def is_nil(self):
-        if self.child == [None, None]:
-            return True
-        return False
+        return self.left is None
+
+
+class AugmentedNode(Node):
+    """ Node carrying annotations about the subtree rooted at itself
+
+    Instance variables:
+    size -- The count of real nodes in this subtree; zero for the nil sentinel.
+    """
+    __slots__ = ('size',)
 
+    def __init__(self, key, value = None, nil = None):
+        super(AugmentedNode, self).__init__(key, value, nil)
+        self.size = 0 if nil is None else 1
+
+
+class SummaryNode(AugmentedNode):
+    """ AugmentedNode carrying a tree-defined summary of its subtree
+
+    Instance variables:
+    summary -- The value the owning tree computes from this node and the
+                summaries of its children; None for the nil sentinel.
+    """
+    __slots__ = ('summary',)
+
+    def __init__(self, key, value = None, nil = None):
+        super(SummaryNode, self).__init__(key, value, nil)
+        self.summary = None
+
+
+# The nil sentinels are never written to (the delete fixup is handed the
+# replacer's parent instead), so every tree shares one per node layout.
+# This also lets join and split move subtrees between trees in O(1).
+_NIL = Node(None)
+_AUGMENTED_NIL = AugmentedNode(None)
+_SUMMARY_NIL = SummaryNode(None)
+
+# Summarize an interval subtree by the highest endpoint within it
+def _max_endpoint(node, left, right):
+    high = node.key[1]
+    if left is not None and high < left:
+        high = left
+    if right is not None and high < right:
+        high = right
+    return high
 
 class Tree(object):
     """ Binary Search Tree leveraging colored nodes for binding tree height
@@ -88,95 +171,551 @@ class Tree(object):
                 data is stored which allows future 'validate' method calls
                 on the tree to inspect the tree's structure and elements.
 
+    order_statistic -- When set as True at object initialization, each node
+                tracks its subtree size, enabling rank, select and count_range.
+
+    interval -- When set as True at object initialization, keys are (low, high)
+                interval pairs with low <= high, ordered by low then high.
+                Each node summarizes the highest endpoint in its subtree,
+                enabling overlapping and stab.  Interval trees also track
+                subtree sizes, and take no key or cmp.
+
+    multiset -- When set as True at object initialization, a key may be
+                inserted any number of times.  Each node's value is then a
+                bucket: the list of values inserted under its key, earliest
+                first.  Sizes, len(), rank, select and count_range count
+                every entry, so multisets always track subtree sizes.
+
+    combine / identity / measure -- Optional monoid given at object
+                initialization.  Each node contributes measure(node) (by
+                default its value), and each node's summary combines the
+                contributions across its subtree in key order.  combine must
+                be associative, and identity must leave any element unchanged
+                when combined with it.  Such trees enable aggregate, track
+                subtree sizes, and cannot also be interval trees.  A value
+                must be changed through update for its summaries to follow.
+                A summary of None stands for an empty subtree, so without a
+                measure every value must be given (a value of None raises
+                ValueError), and a measure must never return None.
+
+    key / cmp -- Optional ordering given at object initialization, either as
+                a function mapping each key to the value it is ordered by,
+                or as a comparator returning a negative, zero or positive
+                number as for sorted(..., key=functools.cmp_to_key(cmp)).
+                Without either, keys are compared directly.  Keys may be of
+                any totally ordered type other than None.
+
     Interfaces:
-    find     -- Given an integer value, retrieve the associated node.
+    find     -- Given a key, retrieve the associated node.
+
+    find_many / contains_many -- Given a batch of keys (any iterable, such
+                as a list or NumPy array), return a list of the values
+                and a list of found flags (or only the flags), in batch order.
+                Misses give a value of None and raise nothing.  The batch is
+                sorted and resolved in one walk rather than k descents.
 
-    insert   -- Instantiate a Node object with the given integer value. Insert
+    insert   -- Instantiate a Node object with the given key. Insert
                 this node at the correct location in the tree, then re-balance
                 the tree as necessary to maintain a height of O(log(n)).
+                In a multiset, a key already present gains another entry.
+                Returns the node holding the key.
 
-    delete   -- Locate the Node object associated with the given integer value.
+    delete   -- Locate the Node object associated with the given key.
                 Remove this node from the tree, then re-balance the tree
                 as necessary to maintain a height of O(log(n)).
+                In a multiset, every entry of the key is removed.
+
+    delete_node -- As delete, given a node of this tree rather than its key,
+                so no search is made.  Removing the lowest or highest node
+                takes amortized O(1) time in trees without subtree sizes.
+                A removed node has its links cleared, so is_nil holds for
+                it, and passing it again raises KeyError.
+
+    count    -- Return the number of entries with the given key.
+
+    remove_one / remove_all -- Remove the earliest entry / every entry with
+                the given key from a multiset, and return its value / the
+                list of their values.
 
     validate -- This utility method verifies its associated tree's correctness.
-                This will need to be called explicitly after any insert or delete.
-                This will only run if the tree was initialized with debug=True.
+                The walk is iterative, holding nothing beyond a few counters,
+                so it runs in O(n) time and O(1) memory at any tree size.
+                With incremental=True only the path to the node touched by
+                the last insert, delete or update is checked, in O(log(n)),
+                which is cheap enough to leave on after every mutation; after
+                any other change the whole tree is checked.  Debug trees also
+                compare the entry count with the inserts and deletes passed
+                to validate as TREE_INSERT and TREE_DELETE.
 
     display  -- This utility method displays an in-order traversal of the tree.
                 Each node will be represented by a three-value list, containing
                 the node's value, the node's depth, and the node's color.
 
-    update   -- Given an existing key in the tree, update its value.
+    update   -- Given an existing key in the tree, update its value.  In a
+                multiset, the given values replace the key's whole bucket.
 
     boundary -- Return the value of either lowest or highest key (as specified).
 
     traverse -- Given a callback (and optional process order), traverse the tree
                 and invoke the callback once for each node.
+
+    rank     -- Return the count of keys lower than the given key.
+
+    select   -- Return the node holding the i-th lowest key (zero-based).
+
+    count_range -- Return the count of keys between two keys, inclusive.
+
+    floor / ceiling -- Return the node with the highest key not above / lowest
+                key not below the given key, or None if there is no such node.
+
+    predecessor / successor -- As floor / ceiling, but excluding the given key.
+
+    adjacent -- Return the in-order neighbour of a node of this tree in the
+                given direction (LEFT or RIGHT), or None past either end,
+                by walking parent aliases in amortized O(1).
+
+    iter_items -- As iter_range, but yield a (key, value) pair per entry, so
+                multisets yield repeated keys once per entry.
+
+    iter_range -- Lazily yield the nodes with keys between two keys, inclusive,
+                in ascending (or, if reverse, descending) order.  A bound of
+                None leaves that end of the range open.  Reaching the first
+                node costs O(log(n)) and each further node amortized O(1).
+                The tree must not be modified while the generator is live.
+
+    from_sorted -- Class method building a tree in O(n) from strictly ascending
+                keys (any iterable) and optional values of equal length.
+                Multisets take non-descending keys, one per entry.
+
+    bulk_insert -- Insert a batch of unsorted keys (and optional values).  Large
+                batches are merged with the existing keys and rebuilt in O(n).
+                The batch is checked for duplicates before the tree is touched.
+
+    overlapping -- Lazily yield the nodes whose intervals share at least one
+                point with the interval from low to high, inclusive, in key
+                order.  Subtrees ending below low are skipped whole and the
+                walk stops at the first interval starting above high, so
+                each reported node costs at most O(log(n)).  The tree must
+                not be modified while the generator is live.
+
+    stab     -- As overlapping, for the intervals holding a single point.
+
+    aggregate -- Return the combined measure of the nodes with keys between
+                two keys, inclusive, in O(log(n)).  A bound of None leaves
+                that end of the range open; an empty range gives identity.
+
+    join     -- Given a key above every key of this tree and another tree whose
+                keys are all above it, absorb the key and the other tree in
+                O(log(n)).  The other tree is left empty.
+
+    split    -- Given a key, return a tree of the lower keys, the node holding
+                the key (or None) and a tree of the higher keys in O(log(n)).
+                This tree is left empty.
+
+    delete_range -- Remove every key between two keys, inclusive, in O(log(n)).
+
+    view     -- Return a tree sharing this tree's nodes, in O(1).  It must
+                never be mutated, and only reads correctly until this tree
+                next changes.
+
+    union / intersection / difference -- Combine another tree into this one
+                by joins and splits, doing O(m*log(n/m + 1)) work for tree
+                sizes m <= n.  The other tree is left empty; on duplicate
+                keys this tree's node is kept (in a multiset union, with
+                the other tree's entries appended to its bucket).
+
+    Every range taken between two keys (count_range, iter_range, iter_items,
+    overlapping, aggregate, delete_range) is empty when the high key lies
+    below the low key: nothing is counted, yielded or removed, and
+    aggregate gives identity.
+
+    len(tree) returns the entry count in O(1).  The rank, select and
+    count_range methods run in O(log(n)) and require order_statistic=True
+    (or multiset=True).  Calling a method on a tree built without the
+    option it requires raises TypeError naming that option.
+    Lookups in trees ordered by key or cmp run separate descent loops, so
+    directly compared keys never pay for the ordering function.
+    Without order statistics, the first len() after a split, delete_range
+    or set operation recounts the nodes.
     """
 
-    def __init__(self, debug = False):
+    def __init__(self, debug = False, order_statistic = False, key = None,
+                 cmp = None, interval = False, combine = None, identity = None,
+                 measure = None, multiset = False):
+        if (key is not None and cmp is not None) or \
+                (interval and (key is not None or cmp is not None)) or \
+                (interval and combine is not None) or \
+                (combine is None and measure is not None):
+            raise ValueError
         self.__root = None
+        self.__count = 0
+        self.__order = functools.cmp_to_key(cmp) if cmp is not None else key
+        self.__interval = interval
+        self.__combine, self.__identity = combine, identity
+        self.__measure = measure
+        self.__multiset = multiset
+        if interval:
+            self.__summarize = _max_endpoint
+        elif combine is not None:
+            self.__summarize = self.__monoid_summary
+        else:
+            self.__summarize = None
+        self.__sized = order_statistic or multiset or \
+                self.__summarize is not None
+        if self.__summarize is not None:
+            self.__node, self.__nil = SummaryNode, _SUMMARY_NIL
+        elif self.__sized:
+            self.__node, self.__nil = AugmentedNode, _AUGMENTED_NIL
+        else:
+            self.__node, self.__nil = Node, _NIL
+        self.__options = {'debug': debug, 'order_statistic': order_statistic,
+                          'key': key, 'cmp': cmp, 'interval': interval,
+                          'combine': combine, 'identity': identity,
+                          'measure': measure, 'multiset': multiset}
         self.__debug = debug
+        self.__touched = None
         if debug:
-            self.__vals = {}
             self.__max_nodes = [0, 0]
 
     def __rotate(self, nFocus, _OBVERSE_DIRECTION):
-        _REVERSE_DIRECTION = 1 - _OBVERSE_DIRECTION
-        nChild = nFocus.child[_REVERSE_DIRECTION]
-        nFocus.child[_REVERSE_DIRECTION] = nChild.child[_OBVERSE_DIRECTION]
-        if nChild.child[_OBVERSE_DIRECTION]:
-            nChild.child[_OBVERSE_DIRECTION].parent = nFocus
-        nChild.parent = nFocus.parent
-        if not nFocus.parent:
-            self.__root = nChild
+        nParent = nFocus.parent
+        if _OBVERSE_DIRECTION == LEFT:
+            nChild = nFocus.right
+            nGrandchild = nFocus.right = nChild.left
+            nChild.left = nFocus
         else:
-            _DIRECTION_FROM_PARENT = nFocus.parent.child.index(nFocus)
-            nFocus.parent.child[_DIRECTION_FROM_PARENT] = nChild
-        nChild.child[_OBVERSE_DIRECTION] = nFocus
+            nChild = nFocus.left
+            nGrandchild = nFocus.left = nChild.right
+            nChild.right = nFocus
+        if nGrandchild is not self.__nil:
+            nGrandchild.parent = nFocus
+        nChild.parent = nParent
         nFocus.parent = nChild
+        if self.__sized:
+            self.__refresh(nFocus)
+            self.__refresh(nChild)
+        if not nParent:
+            self.__root = nChild
+        elif nParent.left is nFocus:
+            nParent.left = nChild
+        else:
+            nParent.right = nChild
 
+    # Keys are compared directly while descending, so a lookup allocates
+    # nothing.  Insertion descends through __find_parent instead.
     def find(self, key, _post_action = None):
-        if not isinstance(key, int):
+        if key is None:
             raise TypeError
         elif not self.__root:
             raise LookupError
+        elif _post_action == TREE_INSERT:
+            return self.__find_parent(key)
+        elif self.__order is not None:
+            return self.__find_ordered(key)
+
+        nFocus, nil = self.__root, self.__nil
+        while nFocus is not nil:
+            nKey = nFocus.key
+            if key < nKey:
+                nFocus = nFocus.left
+            elif key > nKey:
+                nFocus = nFocus.right
+            else:
+                return nFocus
+        raise LookupError
+
+    # As find, for trees ordered by key or cmp
+    def __find_ordered(self, key):
+        nFocus, nil, order = self.__root, self.__nil, self.__order
+        key = order(key)
+        while nFocus is not nil:
+            nKey = order(nFocus.key)
+            if key < nKey:
+                nFocus = nFocus.left
+            elif nKey < key:
+                nFocus = nFocus.right
+            else:
+                return nFocus
+        raise LookupError
 
-        nFocus = self.__root
-        _DIRECTION = None
-        while not nFocus.is_nil():
-            _DIRECTION = Node.compare(Node(key), nFocus)
-            if _DIRECTION not in (LEFT, RIGHT):
-                break
-            nFocus = nFocus.child[_DIRECTION]
-        if not nFocus.is_nil() and _post_action == TREE_INSERT:
-            raise LookupError
-        elif nFocus.is_nil() and _post_action != TREE_INSERT:
-            raise LookupError
-        return nFocus
+    # Map a key to the value it is ordered by
+    def __sort_key(self, key):
+        if key is None:
+            raise TypeError
+        return key if self.__order is None else self.__order(key)
+
+    def __less(self, k1, k2):
+        return self.__sort_key(k1) < self.__sort_key(k2)
+
+    # Resolve a batch in one walk: the sorted keys are partitioned at each
+    # node, and a subtree is entered only if keys remain on its side.
+    def find_many(self, keys):
+        keys = [self.__sort_key(key) for key in keys]
+        values, found = [None] * len(keys), [False] * len(keys)
+        order = sorted(range(len(keys)), key = keys.__getitem__)
+        ordered = [keys[index] for index in order]
+
+        nil, sort_key = self.__nil, self.__order
+        stack = [(self.__root, 0, len(ordered))] if self.__root and keys else []
+        while stack:
+            nFocus, low, high = stack.pop()
+            if high - low == 1:
+                # A lone key finishes with a plain descent
+                key = ordered[low]
+                while nFocus is not nil:
+                    nKey = nFocus.key if sort_key is None else \
+                            sort_key(nFocus.key)
+                    if key < nKey:
+                        nFocus = nFocus.left
+                    elif nKey < key:
+                        nFocus = nFocus.right
+                    else:
+                        index = order[low]
+                        values[index], found[index] = nFocus.value, True
+                        break
+                continue
+
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            match_low = bisect.bisect_left(ordered, nKey, low, high)
+            match_high = bisect.bisect_right(ordered, nKey, match_low, high)
+            for index in order[match_low:match_high]:
+                values[index], found[index] = nFocus.value, True
+            if low < match_low and nFocus.left is not nil:
+                stack.append((nFocus.left, low, match_low))
+            if match_high < high and nFocus.right is not nil:
+                stack.append((nFocus.right, match_high, high))
+        return values, found
+
+    def contains_many(self, keys):
+        return self.find_many(keys)[1]
+
+    # The shared nil carries no position, so return the would-be parent
+    def __find_parent(self, key):
+        if self.__order is not None:
+            return self.__find_parent_ordered(key)
+        nFocus, nParent, nil = self.__root, None, self.__nil
+        while nFocus is not nil:
+            nParent, nKey = nFocus, nFocus.key
+            if key < nKey:
+                nFocus = nFocus.left
+            elif key > nKey:
+                nFocus = nFocus.right
+            else:
+                raise LookupError
+        return nParent
+
+    def __find_parent_ordered(self, key):
+        nFocus, nParent, nil = self.__root, None, self.__nil
+        order = self.__order
+        key = order(key)
+        while nFocus is not nil:
+            nParent, nKey = nFocus, order(nFocus.key)
+            if key < nKey:
+                nFocus = nFocus.left
+            elif nKey < key:
+                nFocus = nFocus.right
+            else:
+                raise LookupError
+        return nParent
 
     def insert(self, key, value = None):
-        if not isinstance(key, int):
-            raise TypeError
-        nNew = Node(key, value)
+        self.__check_entry(key, value)
+        if self.__multiset:
+            try:
+                node = self.find(key)
+            except LookupError:
+                value = [value]
+            else:
+                node.value.append(value)
+                self.__count += 1
+                self.__refresh_path(node)
+                self.__touched = node
+                return node
+
         if not self.__root:
-            nNew.color = BLACK
-            self.__root = nNew
+            self.__root = self.__node(key, value, self.__nil)
+            self.__root.color = BLACK
+            self.__count = 1
+            if self.__sized:
+                self.__refresh(self.__root)
+            self.__touched = self.__root
+            return self.__root
+
+        nParent = self.__find_parent(key)
+        nNew = self.__node(key, value, self.__nil)
+        nNew.parent = nParent
+        if (key < nParent.key if self.__order is None else
+                self.__less(key, nParent.key)):
+            nParent.left = nNew
+        else:
+            nParent.right = nNew
+        if self.__count is not None:
+            self.__count += 1
+        if self.__sized:
+            self.__refresh_path(nNew)
+        self.__insert_fixup(nNew)
+        self.__touched = nNew
+        return nNew
+
+    # Reject keys which may not be stored: None, or a malformed interval
+    # A summary of None stands for an empty subtree, so a node measured by
+    # its value must hold one, or it would silently count as the identity
+    def __check_entry(self, key, value):
+        if key is None:
+            raise TypeError
+        elif self.__interval:
+            low, high = key
+            if high < low:
+                raise ValueError
+        elif value is None and self.__combine is not None and \
+                self.__measure is None and not self.__multiset:
+            raise ValueError('combine without measure requires a value')
+
+    # Recompute a node's size and summary from those of its children.  All
+    # augmented subtree data is maintained through this hook: rotations
+    # call it on both rotated nodes, and every change in membership calls
+    # it along the path from the changed position up to the root.
+    def __refresh(self, nFocus):
+        nLeft, nRight = nFocus.left, nFocus.right
+        nFocus.size = nLeft.size + nRight.size + \
+                (len(nFocus.value) if self.__multiset else 1)
+        if self.__summarize is not None:
+            nFocus.summary = self.__summarize(nFocus, nLeft.summary,
+                                              nRight.summary)
+
+    def __refresh_path(self, nFocus):
+        while nFocus:
+            self.__refresh(nFocus)
+            nFocus = nFocus.parent
+
+    # The nil sentinel's summary of None stands in for the identity
+    def __monoid_summary(self, nFocus, left, right):
+        total = self.__measure_of(nFocus)
+        if left is not None:
+            total = self.__combine(left, total)
+        if right is not None:
+            total = self.__combine(total, right)
+        return total
+
+    @classmethod
+    def from_sorted(cls, keys, values = None, **options):
+        tree = cls(**options)
+        keys = list(keys)
+        values = [None] * len(keys) if values is None else list(values)
+        if len(values) != len(keys):
+            raise ValueError
+
+        sort_keys = []
+        for key, value in zip(keys, values):
+            tree.__check_entry(key, value)
+            key = tree.__sort_key(key)
+            if sort_keys and (key < sort_keys[-1] if tree.__multiset else
+                              not sort_keys[-1] < key):
+                raise ValueError
+            sort_keys.append(key)
+        if tree.__multiset:
+            keys, values, _ = tree.__group(keys, values, sort_keys)
+        tree.__build(keys, values)
+        return tree
+
+    # Gather the values of equal adjacent keys into multiset buckets
+    def __group(self, keys, values, sort_keys):
+        grouped_keys, buckets, grouped_sort_keys = [], [], []
+        for key, value, sort_key in zip(keys, values, sort_keys):
+            if grouped_sort_keys and not grouped_sort_keys[-1] < sort_key:
+                buckets[-1].append(value)
+            else:
+                grouped_keys.append(key)
+                buckets.append([value])
+                grouped_sort_keys.append(sort_key)
+        return grouped_keys, buckets, grouped_sort_keys
+
+    def bulk_insert(self, keys, values = None):
+        keys = list(keys)
+        values = [None] * len(keys) if values is None else list(values)
+        if len(values) != len(keys):
+            raise ValueError
+        for key, value in zip(keys, values):
+            self.__check_entry(key, value)
+        sort_keys = [self.__sort_key(key) for key in keys]
+        order = sorted(range(len(keys)), key = sort_keys.__getitem__)
+        keys = [keys[index] for index in order]
+        values = [values[index] for index in order]
+        sort_keys = [sort_keys[index] for index in order]
+        for index in range(1, len(keys)):
+            if not self.__multiset and not sort_keys[index - 1] < sort_keys[index]:
+                raise LookupError
+
+        # Small batches are cheaper to insert one at a time
+        if len(keys) * len(self).bit_length() < len(self):
+            for key in keys:
+                if not self.__multiset:
+                    self.find(key, TREE_INSERT)
+            for key, value in zip(keys, values):
+                self.insert(key, value)
+            if self.__debug:
+                self.__max_nodes[_REPORTED] += len(keys)
             return
 
-        nFocus = self.find(key, TREE_INSERT)
-        nNew.parent = nFocus.parent
-        _DIRECTION = nFocus.parent.child.index(nFocus)
-        nFocus.parent.child[_DIRECTION] = nNew
-        self.__insert_fixup(nNew)
+        if self.__multiset:
+            keys, values, sort_keys = self.__group(keys, values, sort_keys)
+        merged_keys, merged_values = [], []
+        index = 0
+        for node in self.iter_range():
+            node_key = self.__sort_key(node.key)
+            while index < len(keys) and sort_keys[index] < node_key:
+                merged_keys.append(keys[index])
+                merged_values.append(values[index])
+                index += 1
+            merged_keys.append(node.key)
+            if index < len(keys) and not node_key < sort_keys[index]:
+                if not self.__multiset:
+                    raise LookupError
+                merged_values.append(node.value + values[index])
+                index += 1
+            else:
+                merged_values.append(node.value)
+        self.__build(merged_keys + keys[index:], merged_values + values[index:])
+
+    # Replace the tree contents with a perfectly balanced tree over sorted
+    # keys.  Every level is full except possibly the deepest, whose nodes
+    # are colored red, so all root-to-nil paths hold the same black count.
+    def __build(self, keys, values):
+        red_depth = (len(keys) + 1).bit_length() - 1
+        self.__root = self.__touched = None
+        if keys:
+            self.__root = self.__link(keys, values, 0, len(keys), 0, red_depth)
+        self.__count = self.__root.size if self.__multiset and keys \
+                else len(keys)
+        if self.__debug:
+            self.__max_nodes[_REPORTED] = self.__count
+
+    # Link keys[low:high] (never empty) into a subtree and return its root
+    def __link(self, keys, values, low, high, depth, red_depth):
+        mid = (low + high) // 2
+        nNew = self.__node(keys[mid], values[mid], self.__nil)
+        if depth != red_depth:
+            nNew.color = BLACK
+
+        if low < mid:
+            nNew.left = self.__link(keys, values, low, mid, depth + 1, red_depth)
+            nNew.left.parent = nNew
+        if mid + 1 < high:
+            nNew.right = self.__link(keys, values, mid + 1, high,
+                                     depth + 1, red_depth)
+            nNew.right.parent = nNew
+        if self.__sized:
+            self.__refresh(nNew)
+        return nNew
 
     def __insert_fixup(self, nFocus):
         while nFocus.parent and nFocus.parent.color == RED:
             nParent, nGrandpa = nFocus.parent, nFocus.parent.parent
-            _DIRECTION_FROM_GRANDPA = nGrandpa.child.index(nParent)
+            if nGrandpa.left is nParent:
+                _DIRECTION_FROM_GRANDPA, nUncle = LEFT, nGrandpa.right
+            else:
+                _DIRECTION_FROM_GRANDPA, nUncle = RIGHT, nGrandpa.left
             _OPPOSITE_DIRECTION = 1 - _DIRECTION_FROM_GRANDPA
-            nUncle = nGrandpa.child[_OPPOSITE_DIRECTION]
 
             if nUncle.color == RED:
                 # CLRS Case 1
@@ -184,7 +723,7 @@ class Tree(object):
                 nFocus = nGrandpa
                 continue
 
-            if nParent.child[_OPPOSITE_DIRECTION] is nFocus:
+            if nParent.get_child(_OPPOSITE_DIRECTION) is nFocus:
                 # CLRS Case 2
                 nFocus = nFocus.parent
                 self.__rotate(nFocus, _DIRECTION_FROM_GRANDPA)
@@ -193,76 +732,412 @@ class Tree(object):
             # CLRS Case 3
             nParent.color, nGrandpa.color = BLACK, RED
             self.__rotate(nGrandpa, _OPPOSITE_DIRECTION)
+
+        # Report whether blackening the root grew the black height
+        grown = self.__root.color == RED
         self.__root.color = BLACK
+        return grown
 
     def delete(self, key):
-        nFocus = self.find(key, TREE_DELETE)
+        self.delete_node(self.find(key, TREE_DELETE))
 
-        # Locate next-largest value as successor
-        nReplacer = nFocus
-        if not nFocus.child[LEFT].is_nil() and not nFocus.child[RIGHT].is_nil():
-            nReplacer = nFocus.child[RIGHT]
-            while not nReplacer.child[LEFT].is_nil():
-                nReplacer = nReplacer.child[LEFT]
+    def delete_node(self, nFocus):
+        if nFocus.is_nil():
+            raise KeyError
+        entries = len(nFocus.value) if self.__multiset else 1
+        if self.__count is not None:
+            self.__count -= entries
+        if self.__debug:
+            # validate(TREE_DELETE) accounts for one entry only
+            self.__max_nodes[_REPORTED] -= entries - 1
+        self.__remove(nFocus)
+
+    def count(self, key):
+        try:
+            nFocus = self.find(key)
+        except LookupError:
+            return 0
+        return len(nFocus.value) if self.__multiset else 1
 
-        # Extract replacer node from tree and copy its key to focus
-        if not nReplacer.child[LEFT].is_nil():
-            nRepChild = nReplacer.child[LEFT]
+    def remove_one(self, key):
+        if not self.__multiset:
+            raise TypeError('remove_one requires multiset=True')
+        nFocus = self.find(key, TREE_DELETE)
+        if len(nFocus.value) == 1:
+            self.delete(key)
+            return nFocus.value[0]
+        value = nFocus.value.pop(0)
+        self.__count -= 1
+        self.__refresh_path(nFocus)
+        self.__touched = nFocus
+        return value
+
+    def remove_all(self, key):
+        if not self.__multiset:
+            raise TypeError('remove_all requires multiset=True')
+        nFocus = self.find(key, TREE_DELETE)
+        self.delete(key)
+        return nFocus.value
+
+    # Unlink a node (CLRS 3rd edition RB-DELETE).  A node with two children
+    # is replaced by its successor node itself rather than by a copy of the
+    # successor's key, so nodes handed out earlier keep their key and value.
+    # The shared nil is never re-parented, so the parent of the spliced
+    # position is handed to the fixup explicitly (CLRS stores it in nil).
+    def __remove(self, nFocus):
+        nil = self.__nil
+        if nFocus.left is nil or nFocus.right is nil:
+            removed_color = nFocus.color
+            nRepChild = nFocus.right if nFocus.left is nil else nFocus.left
+            nRepParent = nFocus.parent
+            self.__transplant(nFocus, nRepChild)
         else:
-            nRepChild = nReplacer.child[RIGHT]
-        nRepChild.parent = nReplacer.parent
-        if nReplacer == self.__root:
-            if nRepChild.is_nil():
-                self.__root = None
+            # Locate next-largest value as successor
+            nReplacer = nFocus.right
+            while nReplacer.left is not nil:
+                nReplacer = nReplacer.left
+            removed_color = nReplacer.color
+            nRepChild = nReplacer.right
+            if nReplacer.parent is nFocus:
+                nRepParent = nReplacer
             else:
-                self.__root = nRepChild
-                nRepChild.color = BLACK
-            return
-
-        nReplacer.parent.child[nReplacer.parent.child.index(nReplacer)] = nRepChild
-        nFocus.key = nReplacer.key
-        if nReplacer.color == BLACK:
-            self.__delete_fixup(nRepChild)
+                nRepParent = nReplacer.parent
+                self.__transplant(nReplacer, nRepChild)
+                nReplacer.right = nFocus.right
+                nReplacer.right.parent = nReplacer
+            self.__transplant(nFocus, nReplacer)
+            nReplacer.left = nFocus.left
+            nReplacer.left.parent = nReplacer
+            nReplacer.color = nFocus.color
+
+        if self.__sized:
+            self.__refresh_path(nRepParent)
+        if self.__root and removed_color == BLACK:
+            self.__delete_fixup(nRepChild, nRepParent)
+        self.__touched = nRepParent or self.__root
+        # Cut the node loose, so a stale reference to it is refused rather
+        # than followed back into the tree
+        nFocus.parent = nFocus.left = nFocus.right = None
+
+    # Put nNew (possibly nil) in the position held by nOld
+    def __transplant(self, nOld, nNew):
+        nParent = nOld.parent
+        if not nParent:
+            self.__root = None if nNew is self.__nil else nNew
+        elif nParent.left is nOld:
+            nParent.left = nNew
+        else:
+            nParent.right = nNew
+        if nNew is not self.__nil:
+            nNew.parent = nParent
 
-    def __delete_fixup(self, nFocus):
+    def __delete_fixup(self, nFocus, nParent):
         while nFocus is not self.__root and nFocus.color == BLACK:
-            nParent = nFocus.parent
-            _DIRECTION_FROM_PARENT = nParent.child.index(nFocus)
+            if nParent.left is nFocus:
+                _DIRECTION_FROM_PARENT, nSibling = LEFT, nParent.right
+            else:
+                _DIRECTION_FROM_PARENT, nSibling = RIGHT, nParent.left
             _OPPOSITE_DIRECTION = 1 - _DIRECTION_FROM_PARENT
-            nSibling = nParent.child[_OPPOSITE_DIRECTION]
 
             if nSibling.color == RED:
                 # CLRS Case 1
                 nSibling.color = BLACK
                 nParent.color = RED
                 self.__rotate(nParent, _DIRECTION_FROM_PARENT)
-                nSibling = nParent.child[_OPPOSITE_DIRECTION] # re-alias
+                nSibling = nParent.get_child(_OPPOSITE_DIRECTION) # re-alias
 
-            if nSibling.child[LEFT].color == BLACK and \
-                    nSibling.child[RIGHT].color == BLACK:
+            if nSibling.left.color == BLACK and nSibling.right.color == BLACK:
                 # CLRS Case 2
                 nSibling.color = RED
-                nFocus = nParent
+                nFocus, nParent = nParent, nParent.parent
                 continue
 
-            if nSibling.child[_OPPOSITE_DIRECTION].color == BLACK:
+            if nSibling.get_child(_OPPOSITE_DIRECTION).color == BLACK:
                 # CLRS Case 3
-                nSibling.child[_DIRECTION_FROM_PARENT].color = BLACK
+                nSibling.get_child(_DIRECTION_FROM_PARENT).color = BLACK
                 nSibling.color = RED
                 self.__rotate(nSibling, _OPPOSITE_DIRECTION)
-                nSibling = nParent.child[_OPPOSITE_DIRECTION] # re-alias
+                nSibling = nParent.get_child(_OPPOSITE_DIRECTION) # re-alias
 
             # CLRS Case 4
-            nSibling.child[_OPPOSITE_DIRECTION].color = BLACK
+            nSibling.get_child(_OPPOSITE_DIRECTION).color = BLACK
             nSibling.color = nParent.color
             nParent.color = BLACK
             self.__rotate(nParent, _DIRECTION_FROM_PARENT)
             nFocus = self.__root
         nFocus.color = BLACK
 
+    # Count the black nodes on any path from the given node down to nil
+    def __black_height(self, nFocus):
+        height = 0
+        while nFocus is not self.__nil:
+            if nFocus.color == BLACK:
+                height += 1
+            nFocus = nFocus.left
+        return height
+
+    # Cut a subtree (whose black height as a node is given) loose from its
+    # parent as a standalone black-rooted tree.  Returns root and height.
+    def __detach(self, nFocus, height):
+        if nFocus is self.__nil:
+            return nFocus, 0
+        nFocus.parent = None
+        if nFocus.color == RED:
+            nFocus.color = BLACK
+            height += 1
+        return nFocus, height
+
+    # Tarjan's join: link detached subtrees (or nil) holding lower and
+    # higher keys around nMid, and return the new root and black height.
+    # Descend the taller side's inner spine to a black node as high as the
+    # shorter side, hang nMid there in red, then run the insert fixup.
+    # The tree's root alias serves as scratch for the fixup meanwhile.
+    def __join_nodes(self, nLeft, left_height, nMid, nRight, right_height):
+        nil = self.__nil
+        nMid.color = RED
+        if left_height >= right_height:
+            nFocus, nParent, height = nLeft, None, left_height
+            while nFocus.color == RED or height > right_height:
+                if nFocus.color == BLACK:
+                    height -= 1
+                nFocus, nParent = nFocus.right, nFocus
+            nMid.left, nMid.right = nFocus, nRight
+            if nParent:
+                nParent.right = nMid
+            self.__root = nLeft if nParent else nMid
+        else:
+            nFocus, nParent, height = nRight, None, right_height
+            while nFocus.color == RED or height > left_height:
+                if nFocus.color == BLACK:
+                    height -= 1
+                nFocus, nParent = nFocus.left, nFocus
+            nMid.left, nMid.right = nLeft, nFocus
+            if nParent:
+                nParent.left = nMid
+            self.__root = nRight if nParent else nMid
+
+        nMid.parent = nParent
+        if nMid.left is not nil:
+            nMid.left.parent = nMid
+        if nMid.right is not nil:
+            nMid.right.parent = nMid
+        if self.__sized:
+            self.__refresh_path(nMid)
+        grown = self.__insert_fixup(nMid)
+        return self.__root, max(left_height, right_height) + (1 if grown else 0)
+
+    # Join without a middle key: the lowest node of the higher side is
+    # removed from it and reused as the middle node.
+    def __concat_nodes(self, nLeft, left_height, nRight, right_height):
+        nil = self.__nil
+        if nRight is nil:
+            return nLeft, left_height
+        nMid = nRight
+        while nMid.left is not nil:
+            nMid = nMid.left
+        self.__root = nRight
+        self.__remove(nMid)
+        nRight = self.__root or nil
+        return self.__join_nodes(nLeft, left_height, nMid, nRight,
+                                 self.__black_height(nRight))
+
+    # Split a detached subtree around key.  Returns the subtrees holding
+    # the lower and higher keys (with black heights) and the node holding
+    # key itself, or None.  The search path is recorded on the way down,
+    # then each path node is joined onto one side on the way back up.
+    def __split_nodes(self, nFocus, height, key):
+        nil, sort_key = self.__nil, self.__order
+        key = self.__sort_key(key)
+        path = []
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if not (key < nKey or nKey < key):
+                break
+            path.append((nFocus, height, key < nKey))
+            if nFocus.color == BLACK:
+                height -= 1
+            nFocus = nFocus.left if key < nKey else nFocus.right
+
+        nFound = None
+        nLeft, left_height, nRight, right_height = nil, 0, nil, 0
+        if nFocus is not nil:
+            nFound = nFocus
+            child_height = height - (1 if nFocus.color == BLACK else 0)
+            nLeft, left_height = self.__detach(nFocus.left, child_height)
+            nRight, right_height = self.__detach(nFocus.right, child_height)
+            nFound.parent, nFound.left, nFound.right = None, nil, nil
+            if self.__sized:
+                self.__refresh(nFound)
+
+        while path:
+            nFocus, height, went_left = path.pop()
+            child_height = height - (1 if nFocus.color == BLACK else 0)
+            if went_left:
+                nHigher, higher_height = self.__detach(nFocus.right, child_height)
+                nRight, right_height = self.__join_nodes(
+                        nRight, right_height, nFocus, nHigher, higher_height)
+            else:
+                nLower, lower_height = self.__detach(nFocus.left, child_height)
+                nLeft, left_height = self.__join_nodes(
+                        nLower, lower_height, nFocus, nLeft, left_height)
+        return nLeft, left_height, nFound, nRight, right_height
+
+    def __union_nodes(self, nFirst, first_height, nSecond, second_height):
+        if nFirst is self.__nil:
+            return nSecond, second_height
+        elif nSecond is self.__nil:
+            return nFirst, first_height
+        nLower, lower_height = self.__detach(nFirst.left, first_height - 1)
+        nHigher, higher_height = self.__detach(nFirst.right, first_height - 1)
+        nSecLower, sec_lower_height, nFound, nSecHigher, sec_higher_height = \
+                self.__split_nodes(nSecond, second_height, nFirst.key)
+        if nFound and self.__multiset:
+            nFirst.value.extend(nFound.value)
+        nLeft, left_height = self.__union_nodes(
+                nLower, lower_height, nSecLower, sec_lower_height)
+        nRight, right_height = self.__union_nodes(
+                nHigher, higher_height, nSecHigher, sec_higher_height)
+        return self.__join_nodes(nLeft, left_height, nFirst, nRight, right_height)
+
+    def __intersection_nodes(self, nFirst, first_height, nSecond, second_height):
+        nil = self.__nil
+        if nFirst is nil or nSecond is nil:
+            return nil, 0
+        nLower, lower_height = self.__detach(nFirst.left, first_height - 1)
+        nHigher, higher_height = self.__detach(nFirst.right, first_height - 1)
+        nSecLower, sec_lower_height, nFound, nSecHigher, sec_higher_height = \
+                self.__split_nodes(nSecond, second_height, nFirst.key)
+        nLeft, left_height = self.__intersection_nodes(
+                nLower, lower_height, nSecLower, sec_lower_height)
+        nRight, right_height = self.__intersection_nodes(
+                nHigher, higher_height, nSecHigher, sec_higher_height)
+        if nFound:
+            return self.__join_nodes(nLeft, left_height, nFirst,
+                                     nRight, right_height)
+        return self.__concat_nodes(nLeft, left_height, nRight, right_height)
+
+    def __difference_nodes(self, nFirst, first_height, nSecond, second_height):
+        nil = self.__nil
+        if nFirst is nil or nSecond is nil:
+            return nFirst, first_height
+        nSecLower, sec_lower_height = self.__detach(nSecond.left, second_height - 1)
+        nSecHigher, sec_higher_height = \
+                self.__detach(nSecond.right, second_height - 1)
+        nLower, lower_height, _, nHigher, higher_height = \
+                self.__split_nodes(nFirst, first_height, nSecond.key)
+        nLeft, left_height = self.__difference_nodes(
+                nLower, lower_height, nSecLower, sec_lower_height)
+        nRight, right_height = self.__difference_nodes(
+                nHigher, higher_height, nSecHigher, sec_higher_height)
+        return self.__concat_nodes(nLeft, left_height, nRight, right_height)
+
+    # Install a detached subtree (or nil) as the contents of the tree.
+    # Without subtree sizes the count is unknown until len() asks for it.
+    def __adopt(self, nRoot, count = None):
+        self.__root = None if nRoot is self.__nil else nRoot
+        self.__touched = None
+        if not self.__root:
+            count = 0
+        elif count is None and self.__sized:
+            count = self.__root.size
+        self.__count = count
+        if self.__debug:
+            self.__max_nodes[_REPORTED] = len(self)
+
+    def __spawn(self):
+        return type(self)(**self.__options)
+
+    def view(self):
+        other = self.__spawn()
+        other.__adopt(self.__root or self.__nil, self.__count)
+        return other
+
+    def __check_compatible(self, other):
+        if other is self or not isinstance(other, Tree) or \
+                other.__nil is not self.__nil:
+            raise TypeError
+        for name in ('key', 'cmp', 'interval', 'combine', 'identity',
+                     'measure', 'multiset'):
+            if other.__options[name] != self.__options[name]:
+                raise TypeError
+
+    def join(self, key, other, value = None):
+        self.__check_entry(key, value)
+        self.__check_compatible(other)
+        if (self.__root and
+                not self.__less(self.boundary(HIGHEST_KEY).key, key)) or \
+                (other.__root and
+                 not self.__less(key, other.boundary(LOWEST_KEY).key)):
+            raise ValueError
+
+        if self.__multiset:
+            value = [value]
+        nil = self.__nil
+        nLeft, nRight = self.__root or nil, other.__root or nil
+        nRoot, _ = self.__join_nodes(nLeft, self.__black_height(nLeft),
+                                     self.__node(key, value, nil),
+                                     nRight, self.__black_height(nRight))
+        count = None
+        if self.__count is not None and other.__count is not None:
+            count = self.__count + other.__count + 1
+        self.__adopt(nRoot, count)
+        other.__adopt(nil)
+
+    def split(self, key):
+        if key is None:
+            raise TypeError
+        nRoot = self.__root or self.__nil
+        nLeft, _, nFound, nRight, _ = \
+                self.__split_nodes(nRoot, self.__black_height(nRoot), key)
+        lesser, greater = self.__spawn(), self.__spawn()
+        lesser.__adopt(nLeft)
+        greater.__adopt(nRight)
+        self.__adopt(self.__nil)
+        return lesser, nFound, greater
+
+    def delete_range(self, low_key, high_key):
+        if self.__less(high_key, low_key):
+            return
+        nRoot = self.__root or self.__nil
+        nLeft, left_height, _, nRest, rest_height = \
+                self.__split_nodes(nRoot, self.__black_height(nRoot), low_key)
+        _, _, _, nRight, right_height = \
+                self.__split_nodes(nRest, rest_height, high_key)
+        nRoot, _ = self.__concat_nodes(nLeft, left_height, nRight, right_height)
+        self.__adopt(nRoot)
+
+    def __merge(self, other, operation):
+        self.__check_compatible(other)
+        nil = self.__nil
+        nFirst, nSecond = self.__root or nil, other.__root or nil
+        nRoot, _ = operation(nFirst, self.__black_height(nFirst),
+                             nSecond, self.__black_height(nSecond))
+        self.__adopt(nRoot)
+        other.__adopt(nil)
+
+    def union(self, other):
+        self.__merge(other, self.__union_nodes)
+
+    def intersection(self, other):
+        self.__merge(other, self.__intersection_nodes)
+
+    def difference(self, other):
+        self.__merge(other, self.__difference_nodes)
+
     def update(self, key, value):
         node = self.find(key, TREE_UPDATE)
+        self.__check_entry(node.key, value)
+        if self.__multiset:
+            value = list(value)
+            if not value:
+                raise ValueError
+            self.__count += len(value) - len(node.value)
+            if self.__debug:
+                self.__max_nodes[_REPORTED] += len(value) - len(node.value)
         node.value = value
+        if self.__multiset or self.__summarize is not None:
+            self.__refresh_path(node)
+        self.__touched = node
 
     def boundary(self, find_option):
         if not self.__root:
@@ -274,9 +1149,9 @@ class Tree(object):
         else:
             raise KeyError
 
-        curr = self.__root
-        while curr.child[direction].key:
-            curr = curr.child[direction]
+        curr, nil = self.__root, self.__nil
+        while curr.get_child(direction) is not nil:
+            curr = curr.get_child(direction)
         return curr
 
     def traverse(self, callback, process_order = IN_ORDER):
@@ -286,41 +1161,41 @@ class Tree(object):
         depth = 0
 
         while curr:
-            if not prev or curr in prev.child:
+            if not prev or curr.parent is prev:
                 depth += 1
                 prev = curr
 
                 if process_order is PRE_ORDER:
                     callback(curr, depth)
-                if not curr.child[LEFT].is_nil():
-                    curr = curr.child[LEFT]
+                if not curr.left.is_nil():
+                    curr = curr.left
                     continue
 
                 if process_order is IN_ORDER:
                     callback(curr, depth)
-                if not curr.child[RIGHT].is_nil():
-                    curr = curr.child[RIGHT]
+                if not curr.right.is_nil():
+                    curr = curr.right
                     continue
 
                 if process_order is POST_ORDER:
                     callback(curr, depth)
                 curr = curr.parent
 
-            elif prev is curr.child[LEFT]:
+            elif prev is curr.left:
                 depth -= 1
                 prev = curr
 
                 if process_order is IN_ORDER:
                     callback(curr, depth)
-                if not curr.child[RIGHT].is_nil():
-                    curr = curr.child[RIGHT]
+                if not curr.right.is_nil():
+                    curr = curr.right
                     continue
 
                 if process_order is POST_ORDER:
                     callback(curr, depth)
                 curr = curr.parent
 
-            elif prev is curr.child[RIGHT]:
+            elif prev is curr.right:
                 depth -= 1
                 prev = curr
 
@@ -328,62 +1203,372 @@ class Tree(object):
                     callback(curr, depth)
                 curr = curr.parent
 
-    def __inspect(self, nFocus):
-        black_height = [0, 0]
-        if nFocus.is_nil():
-            return 1
+    def __len__(self):
+        if self.__count is None:
+            self.__count = sum(1 for _ in self.iter_range())
+        return self.__count
 
-        self.__max_nodes[_ACTUAL] += 1
-        if nFocus.key in self.__vals.keys():
-            print('Infinite cycle beginning at val:', nFocus.key)
-            raise ReferenceError
-        self.__vals[nFocus.key] = 0
+    # Count the keys lower than (or, if inclusive, equal to) the given key
+    def __count_below(self, key, inclusive):
+        key = self.__sort_key(key)
+        if not self.__sized:
+            raise TypeError('rank and count_range require order_statistic=True')
+        elif not self.__root:
+            return 0
 
-        if not nFocus.child[LEFT].is_nil():
-            if nFocus.color == RED and nFocus.child[LEFT].color == RED:
-                print('Left child and focus both red at val:', nFocus.key)
-                raise ValueError
-            elif Node.compare(nFocus, nFocus.child[LEFT]) is LEFT:
-                print('Left child value out of order at val:', nFocus.key)
-                raise KeyError
-        elif not nFocus.child[RIGHT].is_nil():
-            if nFocus.color == RED and nFocus.child[RIGHT].color == RED:
-                print('Right child and focus both red at val:', nFocus.key)
-                raise ValueError
-            elif Node.compare(nFocus, nFocus.child[RIGHT]) is RIGHT:
-                print('Right child value out of order at val:', nFocus.key)
-                raise KeyError
+        nFocus, nil, sort_key, count = self.__root, self.__nil, self.__order, 0
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if nKey < key or (inclusive and not key < nKey):
+                count += nFocus.size - nFocus.right.size
+                nFocus = nFocus.right
+            else:
+                nFocus = nFocus.left
+        return count
 
-        black_height[LEFT] = self.__inspect(nFocus.child[LEFT])
-        black_height[RIGHT] = self.__inspect(nFocus.child[RIGHT])
-        if black_height[LEFT] > 0 and black_height[RIGHT] > 0 and \
-                black_height[LEFT] != black_height[RIGHT]:
-            print('Black height mismatch at children of val:', nFocus.key)
-            raise ValueError
+    def rank(self, key):
+        return self.__count_below(key, False)
 
-        if nFocus is self.__root and \
-                self.__max_nodes[_REPORTED] != self.__max_nodes[_ACTUAL]:
-            print('Node count mismatch, expected %d but found %d' %
-                    (self.__max_nodes[_REPORTED], self.__max_nodes[_ACTUAL]))
-            raise ArithmeticError
+    def select(self, index):
+        if not self.__sized:
+            raise TypeError('select requires order_statistic=True')
+        elif index < 0:
+            index += self.__count
+        if index < 0 or index >= self.__count:
+            raise IndexError
+
+        nFocus = self.__root
+        while True:
+            left_size = nFocus.left.size
+            own_size = nFocus.size - nFocus.right.size
+            if index < left_size:
+                nFocus = nFocus.left
+            elif index >= own_size:
+                index -= own_size
+                nFocus = nFocus.right
+            else:
+                return nFocus
 
-        if black_height[LEFT] == black_height[RIGHT] == 0:
+    # Reversed bounds make an empty range, as in iter_range and delete_range
+    def count_range(self, low_key, high_key):
+        if not self.__sized:
+            raise TypeError('rank and count_range require order_statistic=True')
+        elif self.__less(high_key, low_key):
             return 0
-        elif nFocus.color == RED:
-            return black_height[LEFT]
+        return self.__count_below(high_key, True) - \
+                self.__count_below(low_key, False)
+
+    # Locate the nearest node on the given side of a key (CLRS successor
+    # and predecessor descents).  Returns None when no such node exists.
+    def __bound(self, key, direction, inclusive):
+        key = self.__sort_key(key)
+        if not self.__root:
+            return None
+
+        nFocus, nil, nBound = self.__root, self.__nil, None
+        sort_key = self.__order
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if key == nKey and inclusive:
+                return nFocus
+            elif key < nKey or (key == nKey and direction == LEFT):
+                if direction == RIGHT:
+                    nBound = nFocus
+                nFocus = nFocus.left
+            else:
+                if direction == LEFT:
+                    nBound = nFocus
+                nFocus = nFocus.right
+        return nBound
+
+    # Step to the in-order neighbour in the given direction by walking
+    # parent aliases, as traverse does.  Returns None past either end.
+    def __step(self, nFocus, direction):
+        nil = self.__nil
+        nChild = nFocus.get_child(direction)
+        if nChild is not nil:
+            nFocus, nChild = nChild, nChild.get_child(1 - direction)
+            while nChild is not nil:
+                nFocus, nChild = nChild, nChild.get_child(1 - direction)
+            return nFocus
+        while nFocus.parent and nFocus.parent.get_child(direction) is nFocus:
+            nFocus = nFocus.parent
+        return nFocus.parent
+
+    def adjacent(self, node, direction):
+        if direction != LEFT and direction != RIGHT:
+            raise KeyError
+        return self.__step(node, direction)
+
+    def floor(self, key):
+        return self.__bound(key, LEFT, True)
+
+    def ceiling(self, key):
+        return self.__bound(key, RIGHT, True)
+
+    def predecessor(self, key):
+        return self.__bound(key, LEFT, False)
+
+    def successor(self, key):
+        return self.__bound(key, RIGHT, False)
+
+    def iter_items(self, low_key = None, high_key = None, reverse = False):
+        for node in self.iter_range(low_key, high_key, reverse):
+            if not self.__multiset:
+                yield node.key, node.value
+                continue
+            for value in (reversed(node.value) if reverse else node.value):
+                yield node.key, value
+
+    def iter_range(self, low_key = None, high_key = None, reverse = False):
+        if reverse:
+            direction, start_key, stop_key = LEFT, high_key, low_key
+        else:
+            direction, start_key, stop_key = RIGHT, low_key, high_key
+
+        if start_key is not None:
+            nFocus = self.__bound(start_key, direction, True)
+        elif reverse:
+            nFocus = self.boundary(HIGHEST_KEY)
         else:
-            return black_height[LEFT] + 1
+            nFocus = self.boundary(LOWEST_KEY)
+
+        sort_key = self.__order
+        if stop_key is not None:
+            stop_key = self.__sort_key(stop_key)
+        while nFocus:
+            if stop_key is not None:
+                nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+                if (stop_key < nKey if direction == RIGHT else nKey < stop_key):
+                    return
+            yield nFocus
+            nFocus = self.__step(nFocus, direction)
+
+    def overlapping(self, low, high):
+        if not self.__interval:
+            raise TypeError('overlapping and stab require interval=True')
+        elif low is None or high is None:
+            raise TypeError
+        elif high < low:
+            return iter(())
+        return self.__overlapping(low, high)
+
+    def stab(self, point):
+        return self.overlapping(point, point)
+
+    # Combine the whole subtrees hanging inside the range along the two
+    # search paths: right subtrees off the path to low, left subtrees off
+    # the path to high, with the nodes on the paths themselves in between.
+    def aggregate(self, low_key = None, high_key = None):
+        if self.__combine is None:
+            raise TypeError('aggregate requires a combine monoid')
+        combine, identity = self.__combine, self.__identity
+        nil, sort_key = self.__nil, self.__order
+        low = None if low_key is None else self.__sort_key(low_key)
+        high = None if high_key is None else self.__sort_key(high_key)
+        if low is not None and high is not None and high < low:
+            return identity
+
+        # Descend to the highest node lying within both bounds
+        nFocus = self.__root or nil
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if low is not None and nKey < low:
+                nFocus = nFocus.right
+            elif high is not None and high < nKey:
+                nFocus = nFocus.left
+            else:
+                break
+        if nFocus is nil:
+            return identity
+        nSplit, total = nFocus, self.__measure_of(nFocus)
+
+        nFocus = nSplit.left
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if low is not None and nKey < low:
+                nFocus = nFocus.right
+                continue
+            part = self.__measure_of(nFocus)
+            if nFocus.right is not nil:
+                part = combine(part, nFocus.right.summary)
+            total = combine(part, total)
+            nFocus = nFocus.left
+
+        nFocus = nSplit.right
+        while nFocus is not nil:
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if high is not None and high < nKey:
+                nFocus = nFocus.left
+                continue
+            part = self.__measure_of(nFocus)
+            if nFocus.left is not nil:
+                part = combine(nFocus.left.summary, part)
+            total = combine(total, part)
+            nFocus = nFocus.right
+        return total
+
+    def __measure_of(self, nFocus):
+        if self.__measure is None:
+            return nFocus.value
+        return self.__measure(nFocus)
+
+    # An in-order walk which enters a subtree only if its highest endpoint
+    # reaches low, and which ends at the first interval starting past high
+    def __overlapping(self, low, high):
+        nFocus, nil, stack = self.__root or self.__nil, self.__nil, []
+        while True:
+            while nFocus is not nil and not nFocus.summary < low:
+                stack.append(nFocus)
+                nFocus = nFocus.left
+            if not stack:
+                return
+            nFocus = stack.pop()
+            if high < nFocus.key[0]:
+                return
+            elif not nFocus.key[1] < low:
+                yield nFocus
+            nFocus = nFocus.right
+
+    # Check the invariants held by a node itself and its links to its
+    # children: parent aliases, red parents of red nodes, key order between
+    # parent and child, multiset buckets, sizes and summaries.
+    def __inspect_node(self, nFocus):
+        nil, sort_key = self.__nil, self.__order
+        nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+        if nFocus.color == RED and nFocus.parent and \
+                nFocus.parent.color == RED:
+            print('Parent and focus both red at val:', nFocus.key)
+            raise ValueError
+        for direction in (LEFT, RIGHT):
+            nChild = nFocus.get_child(direction)
+            if nChild is nil:
+                continue
+            elif nChild.parent is not nFocus:
+                print('Parent alias mismatch at child of val:', nFocus.key)
+                raise ReferenceError
+            cKey = nChild.key if sort_key is None else sort_key(nChild.key)
+            if (not cKey < nKey) if direction == LEFT else (not nKey < cKey):
+                print('Child value out of order at val:', nFocus.key)
+                raise KeyError
 
-    def validate(self, _pre_action = None):
-        if not self.__debug or not self.__root:
+        if self.__multiset and \
+                (not isinstance(nFocus.value, list) or not nFocus.value):
+            print('Empty or missing bucket at val:', nFocus.key)
+            raise ValueError
+        elif self.__sized and nFocus.size != nFocus.left.size + \
+                nFocus.right.size + (len(nFocus.value) if self.__multiset else 1):
+            print('Subtree size mismatch at val:', nFocus.key)
+            raise ArithmeticError
+        elif self.__summarize is not None and nFocus.summary != \
+                self.__summarize(nFocus, nFocus.left.summary,
+                                 nFocus.right.summary):
+            print('Subtree summary mismatch at val:', nFocus.key)
+            raise ArithmeticError
+
+    # Walk the whole tree in order by parent aliases, as traverse does, so
+    # only the black depth, the previous key and a count are held.  Every
+    # nil must lie at the same black depth, and the keys must ascend; a
+    # cycle would revisit a key, so it fails the ascent before looping.
+    def __inspect(self):
+        nil, sort_key = self.__nil, self.__order
+        black_height, black_depth, entries = None, 0, 0
+        prev_key, have_prev = None, False
+        curr, prev = self.__root, None
+        while curr is not None:
+            if prev is curr.parent:
+                self.__inspect_node(curr)
+                black_depth += curr.color == BLACK
+                if curr.left is not nil:
+                    prev, curr = curr, curr.left
+                    continue
+                black_height = self.__inspect_nil(black_height, black_depth,
+                                                  curr)
+                prev = nil
+
+            if prev is curr.left:
+                nKey = curr.key if sort_key is None else sort_key(curr.key)
+                if have_prev and not prev_key < nKey:
+                    print('Value out of order or revisited at val:', curr.key)
+                    raise KeyError
+                prev_key, have_prev = nKey, True
+                entries += len(curr.value) if self.__multiset else 1
+                if curr.right is not nil:
+                    prev, curr = curr, curr.right
+                    continue
+                black_height = self.__inspect_nil(black_height, black_depth,
+                                                  curr)
+
+            black_depth -= curr.color == BLACK
+            prev, curr = curr, curr.parent
+        return entries
+
+    # Every nil must hang at the black height first seen, or set it
+    def __inspect_nil(self, black_height, black_depth, nParent):
+        if black_height is not None and black_height != black_depth:
+            print('Black height mismatch at children of val:', nParent.key)
+            raise ValueError
+        return black_depth
+
+    # Descend by key from the root to the node the last insert or delete
+    # touched, checking each node on the path and its children against the
+    # key bounds of the path.  Fixup rotations and recolorings stay on or
+    # beside this path.  Nils beside it must match the left spine's height.
+    def __inspect_path(self, nTarget):
+        nil, sort_key = self.__nil, self.__order
+        black_height, nFocus = 0, self.__root
+        while nFocus is not nil:
+            black_height += nFocus.color == BLACK
+            nFocus = nFocus.left
+
+        key = nTarget.key if sort_key is None else sort_key(nTarget.key)
+        low = high = None
+        black_depth, nFocus = 0, self.__root
+        while nFocus is not nil:
+            self.__inspect_node(nFocus)
+            black_depth += nFocus.color == BLACK
+            nKey = nFocus.key if sort_key is None else sort_key(nFocus.key)
+            if (low is not None and not low < nKey) or \
+                    (high is not None and not nKey < high):
+                print('Value out of order at val:', nFocus.key)
+                raise KeyError
+            if nFocus.left is nil or nFocus.right is nil:
+                self.__inspect_nil(black_height, black_depth, nFocus)
+            if key < nKey:
+                high, nFocus = nKey, nFocus.left
+            elif nKey < key:
+                low, nFocus = nKey, nFocus.right
+            elif nFocus is nTarget:
+                return
+            else:
+                break
+        print('Touched node unreachable at val:', nTarget.key)
+        raise ReferenceError
+
+    def validate(self, _pre_action = None, incremental = False):
+        if self.__debug:
+            if _pre_action == TREE_INSERT:
+                self.__max_nodes[_REPORTED] += 1
+            elif _pre_action == TREE_DELETE:
+                self.__max_nodes[_REPORTED] -= 1
+        if not self.__root:
             return
-        self.__vals = {}
-        self.__max_nodes[_ACTUAL] = 0
-        if _pre_action == TREE_INSERT:
-            self.__max_nodes[_REPORTED] += 1
-        elif _pre_action == TREE_DELETE:
-            self.__max_nodes[_REPORTED] -= 1
-        self.__inspect(self.__root)
+        elif self.__root.parent is not None or self.__root.color != BLACK:
+            print('Red or parented root at val:', self.__root.key)
+            raise ValueError
+
+        if incremental and self.__touched is not None:
+            self.__inspect_path(self.__touched)
+            entries = self.__count
+        else:
+            entries = self.__inspect()
+        expected = self.__max_nodes[_REPORTED] if self.__debug else \
+                self.__count
+        if entries is not None and expected is not None and \
+                entries != expected:
+            print('Node count mismatch, expected %d but found %d' %
+                    (expected, entries))
+            raise ArithmeticError
 
     def __display_cb(self, node, depth):
         if node.color == RED:
@@ -400,6 +1585,381 @@ class Tree(object):
         self.__elem_list = None
 
 
+
+class PersistentNode(object):
+    """ Container for a key and it's value within a PersistentTree
+
+    Instance variables:
+    key, value, color -- As on Node.
+
+    left, right -- Aliases to the node's direct descendants, or None where
+                missing.  There is no parent alias: a node may be shared by
+                many versions of a tree, each giving it different ancestors.
+
+    A node is never changed once linked into a tree; versions needing it
+    changed link a copy instead.
+
+    Interfaces:
+    get_child -- Return the descendant in the given direction.
+    """
+    __slots__ = ('key', 'value', 'color', 'left', 'right')
+
+    def __init__(self, color, left, key, value, right):
+        self.color = color
+        self.left = left
+        self.key = key
+        self.value = value
+        self.right = right
+
+    def get_child(self, direction):
+        if direction == LEFT:
+            return self.left
+        return self.right
+
+
+class PersistentTree(object):
+    """ Red-Black Tree whose versions are never modified once built
+
+    Every mutation leaves its tree untouched and returns a new version.  The
+    new version copies only the O(log(n)) nodes along the path it changed and
+    shares every other subtree with the old one, so old versions stay cheap
+    to keep and safe to read while newer ones are built.  Rebalancing follows
+    Okasaki (insert) and Kahrs (delete), which restructure only along the path.
+
+    Interfaces:
+    insert / delete / update -- As on Tree, but return the new version.
+
+    find, boundary, floor, ceiling, predecessor, successor -- As on Tree.
+
+    adjacent -- As on Tree.  Descends from this version's root, in O(log(n)).
+
+    traverse / iter_range -- As on Tree.  With no parent aliases to follow,
+                the path walked is kept in a stack of O(log(n)) nodes.
+                Versions never change, so iter_range generators stay valid
+                across later mutations.
+
+    validate -- Verify the version's ordering, coloring and node count.
+
+    len(tree) returns the node count in O(1).
+    """
+
+    def __init__(self, _root = None, _count = 0):
+        self.__root = _root
+        self.__count = _count
+
+    # Copy the source node's key and value into a node with new links
+    def __copy(self, color, nLeft, nSource, nRight):
+        return PersistentNode(color, nLeft, nSource.key, nSource.value, nRight)
+
+    def __is_red(self, nFocus):
+        return nFocus is not None and nFocus.color == RED
+
+    def __is_black(self, nFocus):
+        return nFocus is not None and nFocus.color == BLACK
+
+    def __recolor(self, nFocus, color):
+        return self.__copy(color, nFocus.left, nFocus, nFocus.right)
+
+    # Resolve a red node with a red child below a black node into a red
+    # node over two black ones (both red children are simply recolored)
+    def __balance(self, nLeft, nSource, nRight):
+        copy, is_red = self.__copy, self.__is_red
+        if is_red(nLeft) and is_red(nRight):
+            return copy(RED, self.__recolor(nLeft, BLACK), nSource,
+                        self.__recolor(nRight, BLACK))
+        elif is_red(nLeft) and is_red(nLeft.left):
+            return copy(RED, self.__recolor(nLeft.left, BLACK), nLeft,
+                        copy(BLACK, nLeft.right, nSource, nRight))
+        elif is_red(nLeft) and is_red(nLeft.right):
+            nMid = nLeft.right
+            return copy(RED, copy(BLACK, nLeft.left, nLeft, nMid.left), nMid,
+                        copy(BLACK, nMid.right, nSource, nRight))
+        elif is_red(nRight) and is_red(nRight.right):
+            return copy(RED, copy(BLACK, nLeft, nSource, nRight.left), nRight,
+                        self.__recolor(nRight.right, BLACK))
+        elif is_red(nRight) and is_red(nRight.left):
+            nMid = nRight.left
+            return copy(RED, copy(BLACK, nLeft, nSource, nMid.left), nMid,
+                        copy(BLACK, nMid.right, nRight, nRight.right))
+        return copy(BLACK, nLeft, nSource, nRight)
+
+    def __insert_path(self, nFocus, key, value):
+        if nFocus is None:
+            return PersistentNode(RED, None, key, value, None)
+        elif key < nFocus.key:
+            nLeft = self.__insert_path(nFocus.left, key, value)
+            if nFocus.color == RED:
+                return self.__copy(RED, nLeft, nFocus, nFocus.right)
+            return self.__balance(nLeft, nFocus, nFocus.right)
+        elif key > nFocus.key:
+            nRight = self.__insert_path(nFocus.right, key, value)
+            if nFocus.color == RED:
+                return self.__copy(RED, nFocus.left, nFocus, nRight)
+            return self.__balance(nFocus.left, nFocus, nRight)
+        raise LookupError
+
+    def insert(self, key, value = None):
+        if key is None:
+            raise TypeError
+        nRoot = self.__insert_path(self.__root, key, value)
+        if nRoot.color == RED:
+            nRoot = self.__recolor(nRoot, BLACK)
+        return PersistentTree(nRoot, self.__count + 1)
+
+    # The left subtree lost one black height; restore it on the way up
+    def __balance_left(self, nLeft, nSource, nRight):
+        if self.__is_red(nLeft):
+            return self.__copy(RED, self.__recolor(nLeft, BLACK), nSource,
+                               nRight)
+        elif self.__is_black(nRight):
+            return self.__balance(nLeft, nSource,
+                                  self.__recolor(nRight, RED))
+        nMid = nRight.left
+        return self.__copy(RED, self.__copy(BLACK, nLeft, nSource, nMid.left),
+                           nMid, self.__balance(nMid.right, nRight,
+                                    self.__recolor(nRight.right, RED)))
+
+    def __balance_right(self, nLeft, nSource, nRight):
+        if self.__is_red(nRight):
+            return self.__copy(RED, nLeft, nSource,
+                               self.__recolor(nRight, BLACK))
+        elif self.__is_black(nLeft):
+            return self.__balance(self.__recolor(nLeft, RED), nSource,
+                                  nRight)
+        nMid = nLeft.right
+        return self.__copy(RED, self.__balance(
+                                    self.__recolor(nLeft.left, RED),
+                                    nLeft, nMid.left),
+                           nMid, self.__copy(BLACK, nMid.right, nSource, nRight))
+
+    # Fuse the two subtrees of a removed node, which share a black height
+    def __fuse(self, nLeft, nRight):
+        if nLeft is None:
+            return nRight
+        elif nRight is None:
+            return nLeft
+        elif nLeft.color == RED and nRight.color == RED:
+            nMid = self.__fuse(nLeft.right, nRight.left)
+            if self.__is_red(nMid):
+                return self.__copy(RED,
+                        self.__copy(RED, nLeft.left, nLeft, nMid.left), nMid,
+                        self.__copy(RED, nMid.right, nRight, nRight.right))
+            return self.__copy(RED, nLeft.left, nLeft,
+                               self.__copy(RED, nMid, nRight, nRight.right))
+        elif nLeft.color == BLACK and nRight.color == BLACK:
+            nMid = self.__fuse(nLeft.right, nRight.left)
+            if self.__is_red(nMid):
+                return self.__copy(RED,
+                        self.__copy(BLACK, nLeft.left, nLeft, nMid.left), nMid,
+                        self.__copy(BLACK, nMid.right, nRight, nRight.right))
+            return self.__balance_left(nLeft.left, nLeft,
+                    self.__copy(BLACK, nMid, nRight, nRight.right))
+        elif nRight.color == RED:
+            return self.__copy(RED, self.__fuse(nLeft, nRight.left), nRight,
+                               nRight.right)
+        return self.__copy(RED, nLeft.left, nLeft,
+                           self.__fuse(nLeft.right, nRight))
+
+    def __delete_path(self, nFocus, key):
+        if nFocus is None:
+            raise LookupError
+        elif key < nFocus.key:
+            nLeft = self.__delete_path(nFocus.left, key)
+            if self.__is_black(nFocus.left):
+                return self.__balance_left(nLeft, nFocus, nFocus.right)
+            return self.__copy(RED, nLeft, nFocus, nFocus.right)
+        elif key > nFocus.key:
+            nRight = self.__delete_path(nFocus.right, key)
+            if self.__is_black(nFocus.right):
+                return self.__balance_right(nFocus.left, nFocus, nRight)
+            return self.__copy(RED, nFocus.left, nFocus, nRight)
+        return self.__fuse(nFocus.left, nFocus.right)
+
+    def delete(self, key):
+        if key is None:
+            raise TypeError
+        nRoot = self.__delete_path(self.__root, key)
+        if self.__is_red(nRoot):
+            nRoot = self.__recolor(nRoot, BLACK)
+        return PersistentTree(nRoot, self.__count - 1)
+
+    def __update_path(self, nFocus, key, value):
+        if nFocus is None:
+            raise LookupError
+        elif key < nFocus.key:
+            return self.__copy(nFocus.color,
+                    self.__update_path(nFocus.left, key, value), nFocus,
+                    nFocus.right)
+        elif key > nFocus.key:
+            return self.__copy(nFocus.color, nFocus.left, nFocus,
+                    self.__update_path(nFocus.right, key, value))
+        return PersistentNode(nFocus.color, nFocus.left, key, value,
+                              nFocus.right)
+
+    def update(self, key, value):
+        if key is None:
+            raise TypeError
+        return PersistentTree(self.__update_path(self.__root, key, value),
+                              self.__count)
+
+    def find(self, key):
+        if key is None:
+            raise TypeError
+
+        nFocus = self.__root
+        while nFocus is not None:
+            nKey = nFocus.key
+            if key < nKey:
+                nFocus = nFocus.left
+            elif key > nKey:
+                nFocus = nFocus.right
+            else:
+                return nFocus
+        raise LookupError
+
+    def boundary(self, find_option):
+        if not self.__root:
+            return None
+        elif find_option is LOWEST_KEY:
+            direction = LEFT
+        elif find_option is HIGHEST_KEY:
+            direction = RIGHT
+        else:
+            raise KeyError
+
+        curr = self.__root
+        while curr.get_child(direction) is not None:
+            curr = curr.get_child(direction)
+        return curr
+
+    def traverse(self, callback, process_order = IN_ORDER):
+        if not self.__root:
+            return
+        # Entries flagged True are due for the callback; the others are
+        # subtrees still to be expanded in the requested order
+        stack = [(self.__root, 1, False)]
+        while stack:
+            curr, depth, visit = stack.pop()
+            if visit:
+                callback(curr, depth)
+                continue
+
+            if process_order is POST_ORDER:
+                stack.append((curr, depth, True))
+            if curr.right is not None:
+                stack.append((curr.right, depth + 1, False))
+            if process_order is IN_ORDER:
+                stack.append((curr, depth, True))
+            if curr.left is not None:
+                stack.append((curr.left, depth + 1, False))
+            if process_order is PRE_ORDER:
+                stack.append((curr, depth, True))
+
+    def __len__(self):
+        return self.__count
+
+    # As Tree's bound descent, with None standing in for the nil sentinel
+    def __bound(self, key, direction, inclusive):
+        if key is None:
+            raise TypeError
+
+        nFocus, nBound = self.__root, None
+        while nFocus is not None:
+            nKey = nFocus.key
+            if key == nKey and inclusive:
+                return nFocus
+            elif key < nKey or (key == nKey and direction == LEFT):
+                if direction == RIGHT:
+                    nBound = nFocus
+                nFocus = nFocus.left
+            else:
+                if direction == LEFT:
+                    nBound = nFocus
+                nFocus = nFocus.right
+        return nBound
+
+    # Nodes may be shared by many versions, so the neighbour is found by
+    # descending this version from its root rather than by parent aliases
+    def adjacent(self, node, direction):
+        if direction != LEFT and direction != RIGHT:
+            raise KeyError
+        return self.__bound(node.key, direction, False)
+
+    def floor(self, key):
+        return self.__bound(key, LEFT, True)
+
+    def ceiling(self, key):
+        return self.__bound(key, RIGHT, True)
+
+    def predecessor(self, key):
+        return self.__bound(key, LEFT, False)
+
+    def successor(self, key):
+        return self.__bound(key, RIGHT, False)
+
+    # The stack holds the ancestors still to be yielded, nearest on top
+    def iter_range(self, low_key = None, high_key = None, reverse = False):
+        if reverse:
+            direction, start_key, stop_key = LEFT, high_key, low_key
+        else:
+            direction, start_key, stop_key = RIGHT, low_key, high_key
+
+        stack, nFocus = [], self.__root
+        while nFocus is not None:
+            if start_key is not None and \
+                    (nFocus.key < start_key if direction == RIGHT else
+                     nFocus.key > start_key):
+                nFocus = nFocus.get_child(direction)
+            else:
+                stack.append(nFocus)
+                nFocus = nFocus.get_child(1 - direction)
+
+        while stack:
+            nFocus = stack.pop()
+            if stop_key is not None and \
+                    (nFocus.key > stop_key if direction == RIGHT else
+                     nFocus.key < stop_key):
+                return
+            yield nFocus
+            nFocus = nFocus.get_child(direction)
+            while nFocus is not None:
+                stack.append(nFocus)
+                nFocus = nFocus.get_child(1 - direction)
+
+    # Return the black height of the subtree, raising on any violation
+    def __inspect(self, nFocus, low_key, high_key):
+        if nFocus is None:
+            return 0, 0
+        elif (low_key is not None and nFocus.key <= low_key) or \
+                (high_key is not None and nFocus.key >= high_key):
+            print('Key out of order at val:', nFocus.key)
+            raise KeyError
+        elif nFocus.color == RED and \
+                (self.__is_red(nFocus.left) or self.__is_red(nFocus.right)):
+            print('Child and focus both red at val:', nFocus.key)
+            raise ValueError
+
+        left_height, left_count = self.__inspect(nFocus.left, low_key,
+                                                 nFocus.key)
+        right_height, right_count = self.__inspect(nFocus.right, nFocus.key,
+                                                   high_key)
+        if left_height != right_height:
+            print('Black height mismatch at children of val:', nFocus.key)
+            raise ValueError
+        return (left_height + (nFocus.color == BLACK),
+                left_count + right_count + 1)
+
+    def validate(self):
+        if self.__is_red(self.__root):
+            print('Red root at val:', self.__root.key)
+            raise ValueError
+        count = self.__inspect(self.__root, None, None)[1]
+        if count != self.__count:
+            print('Node count mismatch, expected %d but found %d' %
+                    (self.__count, count))
+            raise ArithmeticError
+
+
 # Sanity check the tree implementation with a large count of variant instances
 def random_seed_tests():
     test_count = 42
@@ -409,14 +1969,311 @@ def random_seed_tests():
         for count in range(1, test_count):
             rand_array = list(range(count))
             random.shuffle(rand_array)
-            tree = Tree(debug = True)
+            # Each mutation is checked along its own path, then in full
+            tree = Tree(debug = True, order_statistic = bool(seed % 2))
             for key in rand_array:
                 tree.insert(key)
-                tree.validate(TREE_INSERT)
+                tree.validate(TREE_INSERT, incremental = True)
+            tree.validate()
             for key in rand_array:
                 tree.delete(key)
+                tree.validate(TREE_DELETE, incremental = True)
+                if key % 4 == 0:
+                    tree.validate()
+
+            # Every persistent version must survive the versions after it
+            versions = [PersistentTree()]
+            for key in rand_array:
+                versions.append(versions[-1].insert(key))
+            for key in rand_array:
+                versions.append(versions[-1].delete(key))
+            for index, version in enumerate(versions):
+                version.validate()
+                if index <= count:
+                    expected = sorted(rand_array[:index])
+                else:
+                    expected = sorted(rand_array[index - count:])
+                nodes = list(version.iter_range())
+                if [node.key for node in nodes] != expected:
+                    print('Persistent version changed at index:', index)
+                    raise ValueError
+                if [version.adjacent(node, RIGHT) for node in nodes] != \
+                        (nodes + [None])[1:] or \
+                        [version.adjacent(node, LEFT) for node in nodes] != \
+                        ([None] + nodes)[:-1]:
+                    print('Persistent neighbours mismatch at index:', index)
+                    raise ValueError
+
+            # Interval trees must report exactly the intervals stabbed
+            tree = Tree(debug = True, interval = True)
+            intervals = [(key, key + random.randrange(count)) for key in rand_array]
+            for interval in intervals:
+                tree.insert(interval)
+                tree.validate(TREE_INSERT)
+            for point in range(-1, 2 * count):
+                expected = sorted(interval for interval in intervals
+                                  if interval[0] <= point <= interval[1])
+                if [node.key for node in tree.stab(point)] != expected:
+                    print('Stabbing mismatch at point:', point)
+                    raise ValueError
+            for interval in intervals:
+                tree.delete(interval)
+                tree.validate(TREE_DELETE)
+
+            # Multisets must count every entry, removing the earliest first
+            tree = Tree(debug = True, multiset = True)
+            for index, key in enumerate(rand_array):
+                tree.insert(key // 2, index)
+                tree.validate(TREE_INSERT)
+            entries = sorted((key // 2, index)
+                             for index, key in enumerate(rand_array))
+            if list(tree.iter_items()) != entries or \
+                    [tree.select(i).key for i in range(count)] != \
+                    [key for key, _ in entries]:
+                print('Multiset entries mismatch at count:', count)
+                raise ValueError
+            for key, index in entries:
+                if tree.remove_one(key) != index:
+                    print('Multiset removal out of order at val:', key)
+                    raise ValueError
                 tree.validate(TREE_DELETE)
 
+            # Navigation must agree with bisecting the sorted keys
+            keys = sorted(random.sample(range(2 * count), count))
+            tree = Tree()
+            for key in rand_array:
+                tree.insert(keys[key])
+            key_of = lambda node: None if node is None else node.key
+            for probe in range(-1, 2 * count + 1):
+                lower = bisect.bisect_left(keys, probe)
+                upper = bisect.bisect_right(keys, probe)
+                if key_of(tree.floor(probe)) != \
+                        (keys[upper - 1] if upper else None) or \
+                        key_of(tree.ceiling(probe)) != \
+                        (keys[lower] if lower < count else None) or \
+                        key_of(tree.predecessor(probe)) != \
+                        (keys[lower - 1] if lower else None) or \
+                        key_of(tree.successor(probe)) != \
+                        (keys[upper] if upper < count else None):
+                    print('Navigation mismatch at probe:', probe)
+                    raise ValueError
+            low, high = sorted(random.sample(range(-1, 2 * count + 1), 2))
+            expected = [key for key in keys if low <= key <= high]
+            if [node.key for node in tree.iter_range(low, high)] != expected or \
+                    [node.key for node in tree.iter_range(low, high, True)] != \
+                    expected[::-1] or \
+                    [node.key for node in tree.iter_range(low)] != \
+                    [key for key in keys if low <= key] or \
+                    [node.key for node in tree.iter_range(None, high, True)] != \
+                    [key for key in reversed(keys) if key <= high] or \
+                    [node.key for node in tree.iter_range(high, low)]:
+                print('Range iteration mismatch at count:', count)
+                raise ValueError
+
+            # Bulk builds must hold exactly what single inserts would
+            tree = Tree.from_sorted(keys, [-key for key in keys], debug = True,
+                                    order_statistic = bool(seed % 2))
+            tree.validate()
+            batch = [key for key in range(3 * count) if key not in keys]
+            batch = random.sample(batch, random.randrange(count) + 1)
+            before = list(tree.iter_items())
+            try:
+                tree.bulk_insert(batch + batch[:1])
+            except LookupError:
+                pass
+            else:
+                print('Duplicate batch accepted at count:', count)
+                raise ValueError
+            if list(tree.iter_items()) != before:
+                print('Refused batch changed tree at count:', count)
+                raise ValueError
+            tree.bulk_insert(batch, [-key for key in batch])
+            tree.validate()
+            if list(tree.iter_items()) != \
+                    sorted((key, -key) for key in keys + batch) or \
+                    len(tree) != count + len(batch):
+                print('Bulk insert mismatch at count:', count)
+                raise ValueError
+
+            # Splits, joins and set operations must match the sorted lists
+            pivot = random.randrange(-1, 2 * count + 1)
+            tree = Tree.from_sorted(keys, order_statistic = bool(seed % 2))
+            lesser, found, greater = tree.split(pivot)
+            lesser.validate()
+            greater.validate()
+            if [node.key for node in lesser.iter_range()] != \
+                    [key for key in keys if key < pivot] or \
+                    [node.key for node in greater.iter_range()] != \
+                    [key for key in keys if key > pivot] or \
+                    (found is not None) != (pivot in keys) or len(tree):
+                print('Split mismatch at pivot:', pivot)
+                raise ValueError
+            lesser.join(pivot, greater)
+            lesser.validate()
+            if [node.key for node in lesser.iter_range()] != \
+                    sorted(set(keys) | set([pivot])) or len(greater):
+                print('Join mismatch at pivot:', pivot)
+                raise ValueError
+            low, high = sorted(random.sample(range(-1, 2 * count + 1), 2))
+            lesser.delete_range(low, high)
+            lesser.validate()
+            if [node.key for node in lesser.iter_range()] != \
+                    [key for key in sorted(set(keys) | set([pivot]))
+                     if not low <= key <= high]:
+                print('Range deletion mismatch at count:', count)
+                raise ValueError
+
+            other_keys = sorted(random.sample(range(2 * count), count))
+            for operation, expected in (
+                    ('union', set(keys) | set(other_keys)),
+                    ('intersection', set(keys) & set(other_keys)),
+                    ('difference', set(keys) - set(other_keys))):
+                tree = Tree.from_sorted(keys, ['this'] * count)
+                other = Tree.from_sorted(other_keys, ['other'] * count)
+                getattr(tree, operation)(other)
+                tree.validate()
+                if list(tree.iter_items()) != \
+                        [(key, 'this' if key in keys else 'other')
+                         for key in sorted(expected)] or len(other):
+                    print('Set operation mismatch at:', operation)
+                    raise ValueError
+
+            # Batch lookups must answer each key as a lone find would,
+            # in batch order, with repeated keys and misses mixed in
+            tree = Tree.from_sorted(keys, [-key for key in keys])
+            for size in (0, 1, count, 4 * count):
+                batch = [random.randrange(-1, 2 * count + 1)
+                         for _ in range(size)]
+                values = [-key if key in keys else None for key in batch]
+                found = [key in keys for key in batch]
+                if tree.find_many(iter(batch)) != (values, found) or \
+                        tree.contains_many(tuple(batch)) != found:
+                    print('Batch lookup mismatch at size:', size)
+                    raise ValueError
+
+            # Trees ordered by key or cmp must sort, find and navigate by
+            # that ordering, and treat keys it deems equal as duplicates
+            for options, order in (
+                    ({'key': lambda key: -key}, lambda key: -key),
+                    ({'cmp': lambda a, b: (a % 3 - b % 3) or (a - b)},
+                     lambda key: (key % 3, key)),
+                    ({'key': lambda key: key // 2}, lambda key: key // 2)):
+                tree = Tree(debug = True, order_statistic = bool(seed % 2),
+                            **options)
+                expected = {}
+                for key in rand_array:
+                    try:
+                        tree.insert(key, -key)
+                    except LookupError:
+                        if order(key) not in map(order, expected):
+                            raise
+                        continue
+                    tree.validate(TREE_INSERT, incremental = True)
+                    expected[key] = -key
+                ordered = sorted(expected, key = order)
+                if [node.key for node in tree.iter_range()] != ordered or \
+                        any(tree.find(key).value != -key for key in ordered):
+                    print('Ordered tree mismatch at count:', count)
+                    raise ValueError
+                probe = random.choice(ordered)
+                index = ordered.index(probe)
+                if tree.floor(probe).key != probe or \
+                        key_of(tree.successor(probe)) != \
+                        (ordered[index + 1] if index + 1 < len(ordered)
+                         else None) or \
+                        tree.find_many(ordered)[1] != [True] * len(ordered):
+                    print('Ordered navigation mismatch at val:', probe)
+                    raise ValueError
+                for key in ordered[::2]:
+                    tree.delete(key)
+                    tree.validate(TREE_DELETE, incremental = True)
+                tree.validate()
+                if [node.key for node in tree.iter_range()] != ordered[1::2]:
+                    print('Ordered deletion mismatch at count:', count)
+                    raise ValueError
+
+            # Summaries must follow every change.  Concatenation is not
+            # commutative, so it also catches summaries combined out of order.
+            concat = Tree(combine = lambda a, b: a + b, identity = (),
+                          measure = lambda node: (node.key,))
+            total = Tree(combine = lambda a, b: a + b, identity = 0)
+            for key in rand_array:
+                concat.insert(key)
+                total.insert(key, key)
+            for key in rand_array[::3]:
+                concat.delete(key)
+                total.update(key, -key)
+            concat.validate()
+            total.validate()
+            kept = sorted(rand_array[1::3] + rand_array[2::3])
+            values = dict((key, -key if key in rand_array[::3] else key)
+                          for key in rand_array)
+            for low, high in [(None, None)] + [sorted(random.sample(
+                    range(-1, count + 1), 2)) for _ in range(4)]:
+                inside = lambda key: (low is None or low <= key) and \
+                        (high is None or key <= high)
+                if concat.aggregate(low, high) != \
+                        tuple(key for key in kept if inside(key)) or \
+                        total.aggregate(low, high) != \
+                        sum(value for key, value in values.items()
+                            if inside(key)):
+                    print('Aggregate mismatch over:', low, high)
+                    raise ValueError
+            if concat.aggregate(high, low) != () or \
+                    total.aggregate(high, low) != 0:
+                print('Empty aggregate mismatch over:', high, low)
+                raise ValueError
+
+            # Methods needing an option the tree was built without refuse
+            tree = Tree.from_sorted(keys)
+            for method, args in (('remove_one', (0,)), ('remove_all', (0,)),
+                                 ('rank', (0,)), ('count_range', (0, 1)),
+                                 ('select', (0,)), ('stab', (0,)),
+                                 ('aggregate', ())):
+                try:
+                    getattr(tree, method)(*args)
+                except TypeError:
+                    pass
+                else:
+                    print('Missing option accepted by:', method)
+                    raise ValueError
+
+            # Reversed bounds make an empty range wherever a range is taken
+            low, high = sorted(random.sample(range(-1, 2 * count + 1), 2))
+            tree = Tree.from_sorted(keys, keys, combine = lambda a, b: a + b,
+                                    identity = 0)
+            intervals = Tree(interval = True)
+            for key in keys:
+                intervals.insert((key, key + count))
+            tree.delete_range(high, low)
+            if tree.count_range(high, low) or list(tree.iter_range(high, low)) \
+                    or list(tree.iter_items(high, low, True)) or \
+                    tree.aggregate(high, low) != 0 or \
+                    list(intervals.overlapping(high, low)) or \
+                    [node.key for node in tree.iter_range()] != keys:
+                print('Reversed range not empty at count:', count)
+                raise ValueError
+
+            # A summary of None would pass for an empty subtree, so a tree
+            # summarizing values refuses to hold None as one
+            for change in (lambda: tree.insert(-1),
+                           lambda: tree.bulk_insert([-2, -1], [0, None]),
+                           lambda: tree.update(keys[0], None),
+                           lambda: Tree.from_sorted([0], combine = max),
+                           lambda: Tree().count_range(high, low)):
+                try:
+                    change()
+                except (TypeError, ValueError):
+                    pass
+                else:
+                    print('Missing value or option accepted at count:', count)
+                    raise ValueError
+            tree.validate()
+            if list(tree.iter_items()) != [(key, key) for key in keys] or \
+                    tree.aggregate() != sum(keys):
+                print('Refused change altered tree at count:', count)
+                raise ValueError
+
 # Running as main shall invoke random seed testing
 if __name__ == '__main__':
     print('Init')
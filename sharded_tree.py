@@ -0,0 +1,552 @@
+""" Red-Black Tree partitioned by key range across worker processes
+
+mduder.net
+October 2026
+
+Classes:
+    ShardNode   -- Copy of a key and its value as read from a shard.
+
+    ShardedTree -- Tree interface over shards, each a Tree held by a worker
+                   process of its own, so batched work spreads across cores
+                   rather than queueing on one interpreter lock.  Keys are
+                   routed to shards by range, batches are split by shard and
+                   served by every shard at once, range iteration reads the
+                   shards in key order, and shards split and join as they
+                   grow uneven.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import bisect
+import functools
+import itertools
+import multiprocessing
+import pickle
+import random
+
+import red_black_tree as rbt
+
+
+class ShardNode(object):
+    """ Key and value read from a shard
+
+    Instance variables:
+    key, value -- As on Node.  The node is a copy: changing its value does
+                  not change the shard's, which only update does.
+    """
+    __slots__ = ('key', 'value')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def __repr__(self):
+        return 'ShardNode(%r, %r)' % (self.key, self.value)
+
+
+def _pair(node):
+    return None if node is None else (node.key, node.value)
+
+def _items(tree, low_key, high_key, reverse, limit):
+    return [(node.key, node.value) for node in
+            itertools.islice(tree.iter_range(low_key, high_key, reverse), limit)]
+
+# Entries are moved one (key, value) pair each, as iter_items yields them,
+# so the receiving shard's bulk_insert rebuilds any multiset buckets
+def _take(tree, low_key):
+    items = list(tree.iter_items(low_key))
+    if items:
+        tree.delete_range(items[0][0], items[-1][0])
+    return items
+
+# Hand over the upper half of the shard's entries, from the median key up.
+# The lowest key always stays, so a shard holding a single multiset key
+# hands over nothing.
+def _take_upper(tree):
+    median = next(itertools.islice(tree.iter_items(), len(tree) // 2, None))[0]
+    if tree.find(median) is tree.boundary(rbt.LOWEST_KEY):
+        node = tree.successor(median)
+        if node is None:
+            return []
+        median = node.key
+    return _take(tree, median)
+
+# Operations a worker runs on its shard; results must pickle, so no nodes
+_SHARD_OPS = {
+    'find':          lambda tree, key: _pair(tree.find(key)),
+    'insert':        lambda tree, key, value: _pair(tree.insert(key, value)),
+    'delete':        lambda tree, key: tree.delete(key),
+    'update':        lambda tree, key, value: tree.update(key, value),
+    'boundary':      lambda tree, find_option: _pair(tree.boundary(find_option)),
+    'find_many':     lambda tree, keys: tree.find_many(keys),
+    'bulk_insert':   lambda tree, keys, values: tree.bulk_insert(keys, values),
+    'items':         _items,
+    'take_upper':    _take_upper,
+    'take_all':      lambda tree: _take(tree, None),
+    'validate':      lambda tree: tree.validate(),
+}
+
+# Each message is a list of (operation, arguments) to run in order, and is
+# answered by a list of (succeeded, result or exception) and the shard size.
+# A bulk insert is staged here, once its keys are known to be new, until
+# the coordinator commits or discards it.
+def _serve_shard(connection, options):
+    tree, staged = rbt.Tree(**options), []
+
+    def stage(tree, keys, values):
+        del staged[:]
+        if not options.get('multiset') and any(tree.contains_many(keys)):
+            raise LookupError
+        staged.append((keys, values))
+
+    ops = dict(_SHARD_OPS,
+               stage = stage,
+               commit = lambda tree: tree.bulk_insert(*staged.pop()),
+               discard = lambda tree: staged.clear())
+    while True:
+        try:
+            batch = connection.recv()
+        except EOFError:
+            return
+        if batch is None:
+            return
+        replies = []
+        for op, args in batch:
+            try:
+                replies.append((True, ops[op](tree, *args)))
+            except Exception as error:
+                replies.append((False, error))
+        connection.send((replies, len(tree)))
+
+
+class ShardedTree(object):
+    """ Tree split by key range over worker processes
+
+    Instance variables:
+    min_shard -- Size below which a shard is never split.
+
+    skew      -- Once every worker holds a shard, the largest shard is split
+                 when it holds more than skew times the mean shard size.
+
+    Interfaces:
+    find / insert / delete / update / boundary -- As on Tree, routed to the
+                 shard holding the key.  Nodes returned are ShardNode copies.
+                 Each call is one synchronous round trip to a worker, so
+                 single-key traffic is served one request at a time and runs
+                 slower than an in-process Tree.  Only the batch interfaces
+                 below spread work across cores.
+
+    find_many / contains_many / bulk_insert -- As on Tree.  The batch is
+                 split by shard and sent to every shard before any reply is
+                 awaited, so the shards serve their parts in parallel.
+                 bulk_insert is atomic, as on Tree: every shard first checks
+                 and stages its part, and only once all have succeeded are
+                 the staged parts inserted.  Otherwise they are discarded
+                 and the first error raised.
+
+    iter_range -- As on Tree, yielding ShardNode copies.  The shards cover
+                 disjoint ranges, so walking them in key order merges their
+                 results.  Keys are fetched chunk_size at a time, the first
+                 chunk from every shard in the range at once, and each chunk
+                 after from where the last left off, so iteration never
+                 holds a position within a shard between fetches.
+
+    rebalance  -- Split and join shards until none is too large.  Called
+                 after every mutation, where it costs a scan of the shard
+                 sizes unless a shard has grown past its share.  A multiset
+                 shard holding a single key cannot be split.
+
+    shard_sizes -- Return the size of every shard, in key order.
+
+    validate   -- Validate every shard, and check each holds only its range.
+
+    close      -- Stop the workers.  Also invoked when leaving a with block.
+
+    len(tree) returns the key count in O(shards).
+
+    The tree starts as a single shard.  While workers sit idle, any shard
+    of at least 2 * min_shard keys is split at its median and the upper half
+    moved to an idle worker.  Once all are busy, a shard past its share is
+    split after the adjacent pair of smallest combined size is joined into
+    one, freeing a worker.  Both move keys between processes, in O(n) for
+    the shards involved, so they are kept rare by the thresholds above.
+
+    Keys, values and any key or cmp option must pickle; options are passed
+    to every shard's Tree.
+    """
+
+    def __init__(self, workers = None, min_shard = 4096, skew = 2.0,
+                 chunk_size = 1024, **options):
+        self.min_shard = min_shard
+        self.skew = skew
+        self.chunk_size = chunk_size
+        order = options.get('key')
+        if options.get('cmp') is not None:
+            order = functools.cmp_to_key(options['cmp'])
+        self.__sort_key = order or (lambda key: key)
+        self.__multiset = options.get('multiset', False)
+
+        self.__connections, self.__processes = [], []
+        for _ in range(workers or multiprocessing.cpu_count()):
+            connection, worker_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target = _serve_shard,
+                                              args = (worker_end, options))
+            process.daemon = True
+            process.start()
+            worker_end.close()
+            self.__connections.append(connection)
+            self.__processes.append(process)
+        self.__sizes = [0] * len(self.__connections)
+        # Shard i is held by worker __shards[i] and holds the keys ordered
+        # from __lows[i - 1] up to, but not including, __lows[i]
+        self.__shards, self.__lows = [0], []
+        self.__idle = list(range(len(self.__connections) - 1, 0, -1))
+
+    def __len__(self):
+        return sum(self.__sizes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connection, process in zip(self.__connections, self.__processes):
+            try:
+                connection.send(None)
+            except (OSError, ValueError):
+                pass
+            connection.close()
+            process.join()
+
+    def shard_sizes(self):
+        return [self.__sizes[worker] for worker in self.__shards]
+
+    def __position(self, key):
+        return bisect.bisect_right(self.__lows, self.__sort_key(key))
+
+    # Send every worker its batch before awaiting any reply.  Should a send
+    # fail, as on a value which does not pickle, the workers already sent
+    # to are still heard from, so no reply is left unread in a pipe.
+    def __exchange(self, batches):
+        sent, replies = [], {}
+        try:
+            for worker, batch in batches.items():
+                self.__connections[worker].send(batch)
+                sent.append(worker)
+        finally:
+            for worker in sent:
+                replies[worker], self.__sizes[worker] = \
+                        self.__connections[worker].recv()
+        return replies
+
+    def __call(self, worker, op, *args):
+        (succeeded, result), = self.__exchange({worker: [(op, args)]})[worker]
+        if not succeeded:
+            raise result
+        return result
+
+    def __call_key(self, op, key, *args):
+        if key is None:
+            raise TypeError
+        return self.__call(self.__shards[self.__position(key)], op, key, *args)
+
+    def find(self, key):
+        return ShardNode(*self.__call_key('find', key))
+
+    def insert(self, key, value = None):
+        node = ShardNode(*self.__call_key('insert', key, value))
+        self.rebalance()
+        return node
+
+    def delete(self, key):
+        self.__call_key('delete', key)
+        self.rebalance()
+
+    def update(self, key, value):
+        self.__call_key('update', key, value)
+
+    def boundary(self, find_option):
+        if find_option is rbt.LOWEST_KEY:
+            shards = self.__shards
+        elif find_option is rbt.HIGHEST_KEY:
+            shards = reversed(self.__shards)
+        else:
+            raise KeyError
+        for worker in shards:
+            if self.__sizes[worker]:
+                return ShardNode(*self.__call(worker, 'boundary', find_option))
+        return None
+
+    # Split a batch by shard, keeping each key's index within the batch
+    def __route(self, keys):
+        routed = {}
+        for index, key in enumerate(keys):
+            if key is None:
+                raise TypeError
+            worker = self.__shards[self.__position(key)]
+            routed.setdefault(worker, []).append(index)
+        return routed
+
+    def find_many(self, keys):
+        keys = list(keys)
+        routed = self.__route(keys)
+        replies = self.__exchange(dict(
+                (worker, [('find_many', ([keys[index] for index in indices],))])
+                for worker, indices in routed.items()))
+        values, found = [None] * len(keys), [False] * len(keys)
+        for worker, indices in routed.items():
+            (succeeded, result), = replies[worker]
+            if not succeeded:
+                raise result
+            for index, value, present in zip(indices, *result):
+                values[index], found[index] = value, present
+        return values, found
+
+    def contains_many(self, keys):
+        return self.find_many(keys)[1]
+
+    # Duplicates within the batch are caught here, keys already held by the
+    # shards as each stages its part, so nothing is inserted unless all pass
+    def bulk_insert(self, keys, values = None):
+        keys = list(keys)
+        values = [None] * len(keys) if values is None else list(values)
+        if len(values) != len(keys):
+            raise ValueError
+        routed = self.__route(keys)
+        if not self.__multiset:
+            sort_keys = sorted(self.__sort_key(key) for key in keys)
+            for index in range(1, len(sort_keys)):
+                if not sort_keys[index - 1] < sort_keys[index]:
+                    raise LookupError
+
+        try:
+            replies = self.__exchange(dict(
+                    (worker, [('stage', ([keys[index] for index in indices],
+                                         [values[index] for index in indices]))])
+                    for worker, indices in routed.items()))
+            for worker in routed:
+                (succeeded, result), = replies[worker]
+                if not succeeded:
+                    raise result
+        except BaseException:
+            self.__exchange(dict((worker, [('discard', ())])
+                                 for worker in routed))
+            raise
+        replies = self.__exchange(dict((worker, [('commit', ())])
+                                       for worker in routed))
+        self.rebalance()
+        for worker in routed:
+            (succeeded, result), = replies[worker]
+            if not succeeded:
+                raise result
+
+    def iter_range(self, low_key = None, high_key = None, reverse = False):
+        first = 0 if low_key is None else self.__position(low_key)
+        last = len(self.__shards) - 1 if high_key is None else \
+                self.__position(high_key)
+        workers = self.__shards[first:last + 1]
+        if reverse:
+            workers.reverse()
+        workers = [worker for worker in workers if self.__sizes[worker]]
+        args = (low_key, high_key, reverse, self.chunk_size)
+        chunks = self.__exchange(dict((worker, [('items', args)])
+                                      for worker in workers))
+
+        for worker in workers:
+            (succeeded, chunk), = chunks[worker]
+            while True:
+                if not succeeded:
+                    raise chunk
+                for key, value in chunk:
+                    yield ShardNode(key, value)
+                if len(chunk) < self.chunk_size:
+                    break
+                # Resume from the last key read, which is skipped again
+                resume = chunk[-1][0]
+                args = (low_key, resume, True, self.chunk_size + 1) if reverse \
+                        else (resume, high_key, False, self.chunk_size + 1)
+                (succeeded, chunk), = self.__exchange(
+                        {worker: [('items', args)]})[worker]
+                chunk = chunk[1:] if succeeded else chunk
+
+    def rebalance(self):
+        for _ in range(len(self.__connections)):
+            sizes = self.shard_sizes()
+            largest = max(range(len(sizes)), key = sizes.__getitem__)
+            if sizes[largest] < 2 * self.min_shard:
+                return
+            if not self.__idle:
+                if sizes[largest] <= self.skew * sum(sizes) / len(sizes):
+                    return
+                pairs = [position for position in range(len(sizes) - 1)
+                         if largest not in (position, position + 1)]
+                if not pairs:
+                    return
+                joined = min(pairs, key = lambda position:
+                             sizes[position] + sizes[position + 1])
+                if sizes[joined] + sizes[joined + 1] > sizes[largest] // 2:
+                    return
+                self.__join(joined)
+                if largest > joined:
+                    largest -= 1
+            if not self.__split(largest):
+                return
+
+    # Return whether the shard could be split
+    def __split(self, position):
+        worker, spare = self.__shards[position], self.__idle.pop()
+        items = self.__call(worker, 'take_upper')
+        if not items:
+            self.__idle.append(spare)
+            return False
+        self.__call(spare, 'bulk_insert', [key for key, _ in items],
+                    [value for _, value in items])
+        self.__shards.insert(position + 1, spare)
+        self.__lows.insert(position, self.__sort_key(items[0][0]))
+        return True
+
+    # Move every key of the shard after the given one into it
+    def __join(self, position):
+        worker, freed = self.__shards[position], self.__shards[position + 1]
+        items = self.__call(freed, 'take_all')
+        self.__call(worker, 'bulk_insert', [key for key, _ in items],
+                    [value for _, value in items])
+        del self.__shards[position + 1], self.__lows[position]
+        self.__idle.append(freed)
+
+    def validate(self):
+        replies = self.__exchange(dict((worker, [('validate', ()),
+                                                 ('boundary', (rbt.LOWEST_KEY,)),
+                                                 ('boundary', (rbt.HIGHEST_KEY,))])
+                                       for worker in self.__shards))
+        for position, worker in enumerate(self.__shards):
+            (valid, error), (_, lowest), (_, highest) = replies[worker]
+            if not valid:
+                raise error
+            if lowest is None:
+                continue
+            if (position and self.__sort_key(lowest[0]) < self.__lows[position - 1]) \
+                    or (position < len(self.__lows) and
+                        not self.__sort_key(highest[0]) < self.__lows[position]):
+                raise KeyError
+        for worker in self.__idle:
+            if self.__sizes[worker]:
+                raise ValueError
+
+
+# Sanity check the shards against a dict, with shards small enough to
+# split and join throughout
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        with ShardedTree(workers = 3, min_shard = 8, chunk_size = 5) as tree:
+            expected = {}
+            for _ in range(test_count * 4):
+                key, roll = random.randrange(test_count * 8), random.random()
+                try:
+                    if roll < 0.4:
+                        node = tree.insert(key, -key)
+                        if key in expected or node.key != key:
+                            raise ValueError
+                        expected[key] = -key
+                    elif roll < 0.6:
+                        tree.delete(key)
+                        del expected[key]
+                    elif roll < 0.7:
+                        tree.update(key, key)
+                        expected[key] = key
+                    elif roll < 0.8:
+                        if tree.find(key).value != expected[key]:
+                            raise ValueError
+                    else:
+                        keys = random.sample(range(test_count * 16), 20)
+                        new_keys = [key for key in keys if key not in expected]
+                        tree.bulk_insert(new_keys, new_keys)
+                        expected.update((key, key) for key in new_keys)
+                        if tree.find_many(keys) != \
+                                ([expected.get(key) for key in keys],
+                                 [key in expected for key in keys]):
+                            raise ValueError
+                except LookupError:
+                    if (key in expected) != (roll < 0.4):
+                        print('Lookup mismatch at seed:', seed)
+                        raise
+
+            # A batch failing on any shard must leave every shard untouched,
+            # and the pipes must stay in step after a failed send.  The
+            # batch spans the lowest and highest shards.
+            fresh = list(range(-20, 0)) + [test_count * 16]
+            for batch, values in ((fresh + list(expected)[:1], None),
+                                  (fresh + fresh[:1], None),
+                                  (fresh, [None] * 20 + [lambda: None])):
+                try:
+                    tree.bulk_insert(batch, values)
+                except (LookupError, AttributeError, pickle.PicklingError):
+                    pass
+                else:
+                    if expected:
+                        print('Failing batch accepted at seed:', seed)
+                        raise ValueError
+                    expected.update((key, None) for key in batch)
+                if tree.contains_many(fresh) != \
+                        [key in expected for key in fresh]:
+                    print('Failed batch partly applied at seed:', seed)
+                    raise ValueError
+
+            ordered = sorted(expected.items())
+            low, high = sorted(random.sample(range(test_count * 8), 2))
+            if len(tree) != len(expected) or \
+                    [(node.key, node.value) for node in tree.iter_range()] != \
+                    ordered or \
+                    [node.key for node in tree.iter_range(low, high, True)] != \
+                    [key for key, _ in reversed(ordered) if low <= key <= high]:
+                print('Shard contents mismatch at seed:', seed)
+                raise ValueError
+            lowest, highest = (tree.boundary(rbt.LOWEST_KEY),
+                               tree.boundary(rbt.HIGHEST_KEY))
+            if ordered and (lowest.key, highest.key) != (ordered[0][0],
+                                                         ordered[-1][0]):
+                print('Boundary mismatch at seed:', seed)
+                raise ValueError
+            tree.validate()
+            sizes = tree.shard_sizes()
+            if len(sizes) != 3 or max(sizes) > 2 * tree.skew * len(tree) / 3:
+                print('Shards unbalanced at seed:', seed, sizes)
+                raise ValueError
+
+        # Multiset shards move each entry on its own, and one whose entries
+        # share a key stays whole.  Keys rise so shards split, then early
+        # keys are deleted so the small shards join.
+        with ShardedTree(workers = 3, min_shard = 4, chunk_size = 5,
+                         multiset = True) as tree:
+            expected = {}
+            for step in range(test_count * 4):
+                key = random.randrange(step // 4 + 2)
+                if random.random() < 0.8:
+                    tree.insert(key, step)
+                    expected.setdefault(key, []).append(step)
+                elif key in expected:
+                    tree.delete(key)
+                    del expected[key]
+            keys = [random.randrange(test_count) for _ in range(20)]
+            tree.bulk_insert(keys, keys)
+            for key in keys:
+                expected.setdefault(key, []).append(key)
+            for key in list(expected)[:len(expected) // 2]:
+                tree.delete(key)
+                del expected[key]
+            tree.validate()
+            if [(node.key, node.value) for node in tree.iter_range()] != \
+                    sorted(expected.items()) or \
+                    len(tree) != sum(map(len, expected.values())):
+                print('Multiset shard mismatch at seed:', seed)
+                raise ValueError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
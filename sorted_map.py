@@ -0,0 +1,324 @@
+""" Sorted mapping built on the Red-Black Tree
+
+mduder.net
+October 2026
+
+Classes:
+    SortedMap -- MutableMapping whose keys are kept in sorted order.  It may
+                 stand in for a dict wherever ordered iteration, positional
+                 access or range queries are needed, without re-sorting.
+
+    SortedKeysView, SortedValuesView, SortedItemsView -- Lazy views over a
+                 SortedMap, iterating in key order and indexable by position.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import bisect
+import random
+
+try:
+    from collections.abc import (ItemsView, KeysView, MutableMapping,
+                                 ValuesView)
+except ImportError:
+    from collections import ItemsView, KeysView, MutableMapping, ValuesView
+
+import red_black_tree as rbt
+
+
+class SortedMap(MutableMapping):
+    """ Mapping of keys to values, iterated in ascending key order
+
+    Instance variables:
+    key / cmp -- Optional ordering given at object initialization, as on
+                Tree.  Without either, keys are compared directly.
+
+    Interfaces:
+    m[key], m[key] = value, del m[key], key in m, iter(m), len(m) --
+                As on dict.  Lookups and changes run in O(log(n)); len()
+                runs in O(1).  Missing keys raise KeyError.
+
+    keys / values / items -- Return lazy views, walking the tree only when
+                iterated.  Views also support reversed() and indexing by
+                position, e.g. m.keys()[0] for the lowest key.
+
+    bisect_left / bisect_right -- Return the position at which the given key
+                would be inserted to keep the keys sorted, before (or after)
+                an equal key, as the bisect module does for lists.
+
+    peekitem -- Return the (key, value) pair at the given position (by
+                default the last), without removing it.
+
+    popitem  -- Remove and return the (key, value) pair at the given position
+                (by default the last).
+
+    irange   -- Lazily yield the keys between two keys, inclusive, in ascending
+                (or, if reverse, descending) order.  A bound of None leaves
+                that end of the range open.
+
+    floor_key / ceiling_key -- Return the highest key not above / lowest key
+                not below the given key, or None if there is no such key.
+
+    Positional access and bisection run in O(log(n)), using the subtree
+    sizes of an order statistic Tree.  The remaining MutableMapping methods
+    (get, pop, setdefault, update, ==) come from the abstract base class.
+    """
+
+    def __init__(self, items = None, key = None, cmp = None):
+        self.key = key
+        self.cmp = cmp
+        self.__tree = rbt.Tree(order_statistic = True, key = key, cmp = cmp)
+        if items is not None:
+            self.update(items)
+
+    def __getitem__(self, key):
+        try:
+            return self.__tree.find(key).value
+        except LookupError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            self.__tree.find(key).value = value
+        except LookupError:
+            self.__tree.insert(key, value)
+
+    def __delitem__(self, key):
+        try:
+            self.__tree.delete(key)
+        except LookupError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self.__tree.find(key)
+        except LookupError:
+            return False
+        return True
+
+    def __iter__(self):
+        for node in self.__tree.iter_range():
+            yield node.key
+
+    def __reversed__(self):
+        for node in self.__tree.iter_range(reverse = True):
+            yield node.key
+
+    def __len__(self):
+        return len(self.__tree)
+
+    def __repr__(self):
+        return '%s({%s})' % (type(self).__name__, ', '.join(
+                '%r: %r' % item for item in self.items()))
+
+    def keys(self):
+        return SortedKeysView(self)
+
+    def values(self):
+        return SortedValuesView(self)
+
+    def items(self):
+        return SortedItemsView(self)
+
+    def clear(self):
+        self.__tree = rbt.Tree(order_statistic = True, key = self.key,
+                               cmp = self.cmp)
+
+    def copy(self):
+        other = type(self)(key = self.key, cmp = self.cmp)
+        nodes = list(self.__tree.iter_range())
+        other.__tree = rbt.Tree.from_sorted(
+                [node.key for node in nodes], [node.value for node in nodes],
+                order_statistic = True, key = self.key, cmp = self.cmp)
+        return other
+
+    def bisect_left(self, key):
+        return self.__tree.rank(key)
+
+    def bisect_right(self, key):
+        return self.__tree.rank(key) + (1 if key in self else 0)
+
+    bisect = bisect_right
+
+    # The views walk the tree through these rather than by key lookups
+    def _node_at(self, index):
+        return self.__tree.select(index)
+
+    def _iter_items(self, reverse):
+        for node in self.__tree.iter_range(reverse = reverse):
+            yield node.key, node.value
+
+    def peekitem(self, index = -1):
+        node = self.__tree.select(index)
+        return node.key, node.value
+
+    def popitem(self, index = -1):
+        if not self:
+            raise KeyError('popitem(): map is empty')
+        node = self.__tree.select(index)
+        key, value = node.key, node.value
+        self.__tree.delete(key)
+        return key, value
+
+    def irange(self, minimum = None, maximum = None, reverse = False):
+        for node in self.__tree.iter_range(minimum, maximum, reverse):
+            yield node.key
+
+    def floor_key(self, key):
+        node = self.__tree.floor(key)
+        return None if node is None else node.key
+
+    def ceiling_key(self, key):
+        node = self.__tree.ceiling(key)
+        return None if node is None else node.key
+
+
+class SortedKeysView(KeysView):
+    """ Lazy view of a SortedMap's keys in ascending order
+    """
+    def __iter__(self):
+        return iter(self._mapping)
+
+    def __reversed__(self):
+        return reversed(self._mapping)
+
+    def __getitem__(self, index):
+        return self._mapping._node_at(index).key
+
+
+class SortedValuesView(ValuesView):
+    """ Lazy view of a SortedMap's values in ascending key order
+    """
+    def __iter__(self):
+        for _, value in self._mapping._iter_items(False):
+            yield value
+
+    def __reversed__(self):
+        for _, value in self._mapping._iter_items(True):
+            yield value
+
+    def __getitem__(self, index):
+        return self._mapping._node_at(index).value
+
+
+class SortedItemsView(ItemsView):
+    """ Lazy view of a SortedMap's (key, value) pairs in ascending key order
+    """
+    def __iter__(self):
+        return self._mapping._iter_items(False)
+
+    def __reversed__(self):
+        return self._mapping._iter_items(True)
+
+    def __getitem__(self, index):
+        node = self._mapping._node_at(index)
+        return node.key, node.value
+
+
+# Sanity check the mapping against a dict, in ascending and (through the
+# key option) descending order
+def random_seed_tests():
+    test_count = 42
+    for seed in range(test_count):
+        print('Testing seed:', seed)
+        random.seed(seed)
+        for order in (None, lambda key: -key):
+            sorted_map, expected = SortedMap(key = order), {}
+            for _ in range(test_count * 4):
+                key, roll = random.randrange(test_count), random.random()
+                if roll < 0.5:
+                    sorted_map[key] = expected[key] = -key
+                elif roll < 0.7:
+                    try:
+                        del sorted_map[key]
+                    except KeyError:
+                        if key in expected:
+                            raise
+                    else:
+                        del expected[key]
+                else:
+                    try:
+                        value = sorted_map[key]
+                    except KeyError:
+                        if key in expected:
+                            raise
+                    else:
+                        if value != expected[key]:
+                            print('Value mismatch at seed:', seed)
+                            raise ValueError
+                if (key in sorted_map) != (key in expected) or \
+                        sorted_map.get(key, 'missing') != \
+                        expected.get(key, 'missing'):
+                    print('Membership mismatch at seed:', seed)
+                    raise ValueError
+
+            keys = sorted(expected, key = order)
+            items = [(key, expected[key]) for key in keys]
+            if len(sorted_map) != len(expected) or list(sorted_map) != keys or \
+                    list(reversed(sorted_map.keys())) != keys[::-1] or \
+                    list(sorted_map.values()) != [value for _, value in items] or \
+                    list(sorted_map.items()) != items or sorted_map != expected:
+                print('Iteration mismatch at seed:', seed)
+                raise ValueError
+            for index in range(-len(keys), len(keys)):
+                if sorted_map.keys()[index] != keys[index] or \
+                        sorted_map.values()[index] != items[index][1] or \
+                        sorted_map.items()[index] != items[index] or \
+                        sorted_map.peekitem(index) != items[index]:
+                    print('Position mismatch at seed:', seed, index)
+                    raise ValueError
+            for index in (len(keys), -len(keys) - 1):
+                try:
+                    sorted_map.keys()[index]
+                except IndexError:
+                    pass
+                else:
+                    print('Position out of range accepted at seed:', seed)
+                    raise ValueError
+
+            sort_keys = [key if order is None else order(key) for key in keys]
+            low, high = sorted(random.sample(range(-1, test_count + 1), 2))
+            if order is not None:
+                low, high = high, low
+            for key in (low, high):
+                sort_key = key if order is None else order(key)
+                below = [k for k, s in zip(keys, sort_keys) if not s > sort_key]
+                above = [k for k, s in zip(keys, sort_keys) if not s < sort_key]
+                if sorted_map.bisect_left(key) != \
+                        bisect.bisect_left(sort_keys, sort_key) or \
+                        sorted_map.bisect_right(key) != \
+                        bisect.bisect_right(sort_keys, sort_key) or \
+                        sorted_map.floor_key(key) != \
+                        (below[-1] if below else None) or \
+                        sorted_map.ceiling_key(key) != \
+                        (above[0] if above else None):
+                    print('Bisection mismatch at seed:', seed, key)
+                    raise ValueError
+            in_range = [key for key in keys if low <= key <= high or
+                        high <= key <= low]
+            if list(sorted_map.irange(low, high)) != in_range or \
+                    list(sorted_map.irange(low, high, True)) != in_range[::-1]:
+                print('Range mismatch at seed:', seed)
+                raise ValueError
+
+            copied = sorted_map.copy()
+            while items:
+                index = random.randrange(-len(items), len(items))
+                if sorted_map.popitem(index) != items.pop(index):
+                    print('Pop mismatch at seed:', seed)
+                    raise ValueError
+            try:
+                sorted_map.popitem()
+            except KeyError:
+                pass
+            else:
+                print('Empty pop accepted at seed:', seed)
+                raise ValueError
+            if list(copied.items()) != [(key, expected[key]) for key in keys]:
+                print('Copy changed at seed:', seed)
+                raise ValueError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()
@@ -0,0 +1,540 @@
+""" Asyncio front-end serving a Red-Black Tree to many coroutines and clients
+
+mduder.net
+October 2026
+
+Classes:
+    TreeService -- Tree wrapper for coroutines.  Point requests made in the
+                   same pass of the event loop are coalesced into one batch,
+                   sorted by key and applied together, and range scans run
+                   as async generators which hand the loop back every
+                   scan_chunk nodes, so no request holds the loop for long.
+
+    TreeClient  -- Connection to a TreeService served over TCP by serve.
+
+Functions:
+    serve -- Serve a TreeService over TCP, on the local host by default.
+
+The protocol is one JSON object per line in each direction.  A request
+carries an id, an op of 'get', 'put', 'delete' or 'range', and the op's
+arguments:
+
+    {"id": 7, "op": "put", "key": 3, "value": "three"}
+    {"id": 8, "op": "range", "low": 1, "high": 9}
+
+Every reply echoes the id of its request.  A point request is answered once,
+by {"id", "value"} or by {"id", "error"} naming the exception raised, such
+as "LookupError" for a missing key.  A range request is answered by one
+{"id", "items": [[key, value], ...]} per chunk scanned, then by
+{"id", "done": true}.  Requests on one connection are served concurrently,
+so replies may arrive out of order.  Keys and values must survive a JSON
+round trip; tuples, for instance, come back as lists.
+
+Running as main shall invoke the asyncio tests.
+"""
+import asyncio
+import builtins
+import functools
+import itertools
+import json
+import random
+
+import red_black_tree as rbt
+
+
+class TreeService(object):
+    """ Tree served to coroutines in sorted batches
+
+    Instance variables:
+    tree       -- The Tree served.  Reading it directly between awaits is
+                  safe; mutating it directly bypasses pending batches.
+
+    batching   -- Whether point requests are coalesced.  Without batching
+                  each request is applied as soon as it is made.
+
+    scan_chunk -- Nodes read by a scan before handing the loop back.
+
+    batches    -- Count of batches applied so far.
+
+    Interfaces:
+    get    -- Coroutine returning the value held for a key.  A missing key
+              raises LookupError.
+
+    put    -- Coroutine inserting a key with a value, or replacing the
+              value of a key already held.
+
+    delete -- Coroutine removing a key.  A missing key raises LookupError.
+
+    scan   -- Async generator of the (key, value) pairs from low_key to
+              high_key inclusive, either bound defaulting to the tree's end.
+              With neither bound given it walks the whole tree in order.
+
+    scan_chunks -- As scan, yielding lists of up to scan_chunk pairs.
+
+    submit -- Make a 'get', 'put' or 'delete' request, returning a Future
+              of its result without awaiting it.  Must be called while the
+              event loop is running.
+
+    A request queues itself and schedules a flush on the loop if none is
+    pending, so a batch gathers every request made before the loop next
+    runs its callbacks.  All requests of a batch are in flight at once,
+    which lets them be applied in any order; they are sorted by key, under
+    the tree's key or cmp ordering, keeping arrival order among keys the
+    ordering deems equal.  The keys' current values are
+    read by one find_many walk, each key's requests are resolved in turn
+    against its value, and the outcome is written back with one bulk_insert
+    for new keys, then an update or delete for each key changed.  Should a
+    batch fail as a whole, for instance on keys which do not compare, its
+    requests are retried one at a time so only the offending ones fail.
+
+    Scans never hold an iterator across an await: each chunk is read in
+    one go, and the next resumes after the last key read.  Every chunk is
+    consistent, but a scan sees requests applied between its chunks.
+    """
+
+    def __init__(self, batching = True, scan_chunk = 256, **options):
+        # A put replaces a key's value rather than adding to its bucket
+        if options.get('multiset'):
+            raise ValueError
+        self.tree = rbt.Tree(**options)
+        order = options.get('key')
+        if options.get('cmp') is not None:
+            order = functools.cmp_to_key(options['cmp'])
+        self.__sort_key = order or (lambda key: key)
+        self.batching = batching
+        self.scan_chunk = scan_chunk
+        self.batches = 0
+        self.__pending = []
+
+    def __len__(self):
+        return len(self.tree)
+
+    async def get(self, key):
+        return await self.submit('get', key)
+
+    async def put(self, key, value = None):
+        await self.submit('put', key, value)
+
+    async def delete(self, key):
+        await self.submit('delete', key)
+
+    def submit(self, op, key, value = None):
+        if op not in ('get', 'put', 'delete'):
+            raise ValueError(op)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.batching:
+            try:
+                future.set_result(self.__apply_one(op, key, value))
+            except Exception as error:
+                future.set_exception(error)
+            return future
+        if not self.__pending:
+            loop.call_soon(self.__flush)
+        self.__pending.append((op, key, value, future))
+        return future
+
+    def __apply_one(self, op, key, value):
+        if op == 'get':
+            return self.tree.find(key).value
+        elif op == 'delete':
+            self.tree.delete(key)
+            return None
+        try:
+            self.tree.update(key, value)
+        except LookupError:
+            self.tree.insert(key, value)
+        return None
+
+    def __flush(self):
+        batch, self.__pending = self.__pending, []
+        self.batches += 1
+        try:
+            outcomes = self.__apply(batch)
+        except Exception:
+            outcomes = []
+            for op, key, value, unused_future in batch:
+                try:
+                    outcomes.append((self.__apply_one(op, key, value), None))
+                except Exception as error:
+                    outcomes.append((None, error))
+
+        for (unused_op, unused_key, unused_value, future), (result, error) in \
+                zip(batch, outcomes):
+            if future.cancelled():
+                continue
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # Anything which may raise does so before the tree is changed
+    # Requests are grouped by the tree's ordering, so keys it deems equal
+    # share a group, which is looked up and written under its first key.
+    def __apply(self, batch):
+        sort_keys = [self.__sort_key(request[1]) for request in batch]
+        order = sorted(range(len(batch)), key = sort_keys.__getitem__)
+        groups, group_key = [], None
+        for index in order:
+            if groups and not group_key < sort_keys[index]:
+                groups[-1][1].append(index)
+            else:
+                groups.append((batch[index][1], [index]))
+                group_key = sort_keys[index]
+        values, found = self.tree.find_many([key for key, _ in groups])
+
+        outcomes = [None] * len(batch)
+        inserts, updates, deletes = [], [], []
+        for (key, indices), value, present in zip(groups, values, found):
+            held, written = present, False
+            for index in indices:
+                op, new_value = batch[index][0], batch[index][2]
+                if op == 'put':
+                    held, written, value = True, True, new_value
+                    outcomes[index] = (None, None)
+                elif not held:
+                    outcomes[index] = (None, LookupError(batch[index][1]))
+                elif op == 'get':
+                    outcomes[index] = (value, None)
+                else:
+                    held = False
+                    outcomes[index] = (None, None)
+            if held and not present:
+                inserts.append((key, value))
+            elif held and written:
+                updates.append((key, value))
+            elif present and not held:
+                deletes.append(key)
+
+        self.tree.bulk_insert([key for key, _ in inserts],
+                              [value for _, value in inserts])
+        for key, value in updates:
+            self.tree.update(key, value)
+        for key in deletes:
+            self.tree.delete(key)
+        return outcomes
+
+    async def scan_chunks(self, low_key = None, high_key = None):
+        resume = None
+        while True:
+            start = low_key if resume is None else resume
+            chunk = []
+            for node in self.tree.iter_range(start, high_key):
+                if resume is not None and not chunk and node.key == resume:
+                    continue
+                chunk.append((node.key, node.value))
+                if len(chunk) == self.scan_chunk:
+                    break
+            if chunk:
+                yield chunk
+            if len(chunk) < self.scan_chunk:
+                return
+            resume = chunk[-1][0]
+            await asyncio.sleep(0)
+
+    async def scan(self, low_key = None, high_key = None):
+        async for chunk in self.scan_chunks(low_key, high_key):
+            for item in chunk:
+                yield item
+
+
+async def serve(service, host = '127.0.0.1', port = 0):
+    """ Start serving the given TreeService, returning the asyncio Server
+
+    With the default port of 0 the system picks a free one, found through
+    server.sockets[0].getsockname().
+    """
+    async def connected(reader, writer):
+        await _serve_connection(service, reader, writer)
+    return await asyncio.start_server(connected, host, port)
+
+def _send(writer, message):
+    writer.write((json.dumps(message) + '\n').encode())
+
+# Point requests are answered from their futures' callbacks, so only range
+# requests cost a task of their own
+async def _serve_connection(service, reader, writer):
+    answering = set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            _answer(service, line, writer, answering)
+            await writer.drain()
+        if answering:
+            await asyncio.gather(*answering, return_exceptions = True)
+    finally:
+        writer.close()
+
+def _answer(service, line, writer, answering):
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        if request['op'] == 'range':
+            waiter = asyncio.ensure_future(_scan(service, request, writer))
+            finished = answering.discard
+        else:
+            waiter = service.submit(request['op'], request['key'],
+                                    request.get('value'))
+            finished = functools.partial(_reply, writer, request_id, answering)
+    except Exception as error:
+        _send(writer, {'id': request_id, 'error': type(error).__name__})
+        return
+    answering.add(waiter)
+    waiter.add_done_callback(finished)
+
+def _reply(writer, request_id, answering, waiter):
+    answering.discard(waiter)
+    if writer.is_closing():
+        return
+    error = waiter.exception()
+    if error is not None:
+        _send(writer, {'id': request_id, 'error': type(error).__name__})
+    else:
+        _send(writer, {'id': request_id, 'value': waiter.result()})
+
+async def _scan(service, request, writer):
+    request_id = request.get('id')
+    try:
+        async for chunk in service.scan_chunks(request.get('low'),
+                                               request.get('high')):
+            _send(writer, {'id': request_id, 'items': chunk})
+            await writer.drain()
+        reply = {'id': request_id, 'done': True}
+    except Exception as error:
+        reply = {'id': request_id, 'error': type(error).__name__}
+    _send(writer, reply)
+
+# Raise the builtin exception an error reply names, else RuntimeError
+def _result(reply):
+    if 'error' not in reply:
+        return reply.get('value')
+    error = getattr(builtins, reply['error'], None)
+    if not (isinstance(error, type) and issubclass(error, Exception)):
+        error = RuntimeError
+    raise error(reply['error'])
+
+
+class TreeClient(object):
+    """ Client of a TreeService served by serve
+
+    Interfaces:
+    connect -- Coroutine returning a client connected to the given host
+               and port.
+
+    get / put / delete -- Coroutines as on TreeService.  An error reply is
+               raised as the builtin exception it names, or as RuntimeError.
+
+    scan    -- Async generator of the (key, value) pairs from low_key to
+               high_key inclusive, as on TreeService.
+
+    close   -- Coroutine closing the connection.  Requests still waiting
+               raise ConnectionError.
+
+    Any number of requests may be in flight at once; replies are matched
+    to their requests by id.
+    """
+
+    def __init__(self, reader, writer):
+        self.__reader, self.__writer = reader, writer
+        self.__ids = itertools.count()
+        self.__waiting = {}
+        self.__reading = asyncio.ensure_future(self.__read())
+
+    @classmethod
+    async def connect(cls, host = '127.0.0.1', port = None):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    # Point replies resolve a future; range replies go to the scan's queue
+    async def __read(self):
+        try:
+            while True:
+                line = await self.__reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                waiter = self.__waiting.get(reply.get('id'))
+                if isinstance(waiter, asyncio.Queue):
+                    waiter.put_nowait(reply)
+                elif waiter is not None:
+                    del self.__waiting[reply['id']]
+                    if not waiter.done():
+                        waiter.set_result(reply)
+        finally:
+            closed = {'error': 'ConnectionError'}
+            for waiter in self.__waiting.values():
+                if isinstance(waiter, asyncio.Queue):
+                    waiter.put_nowait(closed)
+                elif not waiter.done():
+                    waiter.set_result(closed)
+
+    async def __call(self, message):
+        if self.__reading.done():
+            raise ConnectionError
+        message['id'] = request_id = next(self.__ids)
+        future = asyncio.get_running_loop().create_future()
+        self.__waiting[request_id] = future
+        _send(self.__writer, message)
+        await self.__writer.drain()
+        return _result(await future)
+
+    async def get(self, key):
+        return await self.__call({'op': 'get', 'key': key})
+
+    async def put(self, key, value = None):
+        await self.__call({'op': 'put', 'key': key, 'value': value})
+
+    async def delete(self, key):
+        await self.__call({'op': 'delete', 'key': key})
+
+    async def scan(self, low_key = None, high_key = None):
+        if self.__reading.done():
+            raise ConnectionError
+        request_id = next(self.__ids)
+        replies = self.__waiting[request_id] = asyncio.Queue()
+        try:
+            _send(self.__writer, {'id': request_id, 'op': 'range',
+                                  'low': low_key, 'high': high_key})
+            await self.__writer.drain()
+            while True:
+                reply = await replies.get()
+                if 'items' in reply:
+                    for key, value in reply['items']:
+                        yield key, value
+                elif reply.get('done'):
+                    return
+                else:
+                    _result(reply)
+        finally:
+            self.__waiting.pop(request_id, None)
+
+    async def close(self):
+        self.__writer.close()
+        await self.__reading
+        await self.__writer.wait_closed()
+
+
+# Check the service against a dict fed the same requests in arrival order.
+# Keys are independent and a batch keeps each key's arrival order, so every
+# request must see what the dict saw.
+async def _random_batches(seed, batching):
+    rand = random.Random(seed)
+    service, expected = TreeService(batching, scan_chunk = 7), {}
+    for _ in range(20):
+        requests, outcomes = [], []
+        for _ in range(rand.randrange(1, 60)):
+            op, key = rand.choice(('get', 'put', 'delete')), rand.randrange(40)
+            value = rand.randrange(1000)
+            requests.append(service.put(key, value) if op == 'put' else
+                            getattr(service, op)(key))
+            if op == 'put':
+                expected[key] = value
+                outcomes.append(None)
+            elif key not in expected:
+                outcomes.append(LookupError)
+            elif op == 'delete':
+                del expected[key]
+                outcomes.append(None)
+            else:
+                outcomes.append(expected[key])
+        results = await asyncio.gather(*requests, return_exceptions = True)
+        for result, outcome in zip(results, outcomes):
+            if (type(result) is LookupError) != (outcome is LookupError) or \
+                    (outcome is not LookupError and result != outcome):
+                print('Request outcome mismatch at seed:', seed)
+                raise ValueError
+        scanned = [item async for item in service.scan()]
+        if scanned != sorted(expected.items()):
+            print('Scan mismatch at seed:', seed)
+            raise ValueError
+    service.tree.validate()
+    if batching and service.batches != 20:
+        print('Batch count mismatch at seed:', seed)
+        raise ValueError
+
+async def _tests():
+    for seed in range(42):
+        print('Testing seed:', seed)
+        for batching in (True, False):
+            await _random_batches(seed, batching)
+
+    # Keys which do not compare fail alone when the batch is retried
+    service = TreeService()
+    await service.put(1, 'one')
+    results = await asyncio.gather(service.put(2, 'two'), service.get('x'),
+                                   service.get(1), return_exceptions = True)
+    if results[0] is not None or type(results[1]) is not TypeError or \
+            results[2] != 'one' or len(service) != 2:
+        print('Failed batch not retried request by request')
+        raise ValueError
+
+    # Keys the tree's ordering deems equal share one group, in arrival order
+    for options in ({'key': str.lower},
+                    {'cmp': lambda a, b: (a.lower() > b.lower()) -
+                                         (a.lower() < b.lower())}):
+        service = TreeService(**options)
+        results = await asyncio.gather(
+                service.put('b', 1), service.put('a', 2), service.get('B'),
+                service.put('A', 3), service.delete('B'), service.get('a'),
+                service.get('b'), return_exceptions = True)
+        if results[:6] != [None, None, 1, None, None, 3] or \
+                type(results[6]) is not LookupError or \
+                list(service.tree.iter_items()) != [('a', 3)]:
+            print('Ordering ignored when batching:', results)
+            raise ValueError
+
+    # A scan hands the loop back between chunks, so deletes land mid-scan
+    # and requests made meanwhile are answered before the scan ends
+    service = TreeService(scan_chunk = 10)
+    for key in range(1000):
+        service.tree.insert(key, key)
+    scanned, answered = [], []
+    async def delete_odd():
+        await asyncio.gather(*(service.delete(key)
+                               for key in range(1, 1000, 2)))
+        answered.append(len(scanned))
+    deleting = asyncio.ensure_future(delete_odd())
+    async for key, unused_value in service.scan():
+        scanned.append(key)
+    await deleting
+    if scanned != sorted(set(scanned)) or \
+            not set(range(0, 1000, 2)) <= set(scanned) or \
+            len(scanned) == 1000 or answered[0] == len(scanned):
+        print('Scan blocked the loop or lost keys')
+        raise ValueError
+
+    # The same requests over the local protocol
+    service = TreeService(scan_chunk = 16)
+    server = await serve(service)
+    port = server.sockets[0].getsockname()[1]
+    clients = [await TreeClient.connect(port = port) for _ in range(4)]
+    await asyncio.gather(*(client.put(key, [key, str(key)])
+                           for client in clients
+                           for key in range(clients.index(client), 200, 4)))
+    values = await asyncio.gather(*(clients[key % 4].get(key)
+                                    for key in range(200)))
+    scanned = [item async for item in clients[0].scan(50, 149)]
+    if values != [[key, str(key)] for key in range(200)] or \
+            scanned != [(key, [key, str(key)]) for key in range(50, 150)]:
+        print('Protocol results mismatch')
+        raise ValueError
+    await clients[1].delete(7)
+    for request in (clients[2].get(7), clients[3].delete(7)):
+        try:
+            await request
+        except LookupError:
+            continue
+        print('Missing key not reported over the protocol')
+        raise ValueError
+    for client in clients:
+        await client.close()
+    server.close()
+    await server.wait_closed()
+
+# Running as main shall invoke the asyncio tests
+if __name__ == '__main__':
+    print('Init')
+    asyncio.run(_tests())
@@ -0,0 +1,180 @@
+""" Binary snapshots of a Red-Black Tree
+
+mduder.net
+October 2026
+
+A snapshot stores the tree's keys in ascending order as a flat array of
+little-endian 64-bit integers, followed by an array of value offsets and
+the pickled values themselves.  A value of None is stored as an empty blob.
+Only trees with integer keys can be saved; the tree's ordering (key or
+cmp) is not saved, so load must be given the same one again.  A multiset
+is saved one key per entry and loads back with multiset=True.
+
+    header  -- magic, format version, key count
+    keys    -- count * int64
+    offsets -- (count + 1) * uint64, relative to the start of the blobs
+    blobs   -- pickled values, back to back
+
+Functions:
+    dump -- Stream an in-order walk of the tree into a snapshot file.  The
+            file is written beside the target and renamed over it once
+            flushed to disk, so a crash never leaves a partial snapshot.
+            The directory is fsynced after the rename, so the rename itself
+            survives a power loss.  If writing fails, as on a key which is
+            not an int64, the partial file is removed and the target left
+            as it was.
+
+    fsync_directory -- Flush the directory entry of the given path to disk.
+
+    load -- Memory-map a snapshot file and bulk-build a tree from it in O(n).
+            Extra keyword arguments are passed on to the Tree constructor.
+
+Running as main shall invoke random seed testing.
+"""
+from __future__ import print_function
+import mmap
+import os
+import pickle
+import random
+import struct
+import sys
+import tempfile
+from array import array
+
+import red_black_tree as rbt
+
+_MAGIC, _VERSION = b'RBTS', 1
+_HEADER = struct.Struct('<4sIQ')
+
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def dump(tree, path):
+    count = len(tree)
+    keys, offsets = array('q'), array('Q', [0])
+    blob_start = _HEADER.size + count * 8 + (count + 1) * 8
+    temp_path = path + '.tmp'
+
+    try:
+        with open(temp_path, 'wb') as snapshot:
+            snapshot.seek(blob_start)
+
+            for key, value in tree.iter_items():
+                keys.append(key)
+                if value is None:
+                    offsets.append(offsets[-1])
+                    continue
+                blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                snapshot.write(blob)
+                offsets.append(offsets[-1] + len(blob))
+
+            snapshot.seek(0)
+            snapshot.write(_HEADER.pack(_MAGIC, _VERSION, count))
+            _to_little_endian(keys).tofile(snapshot)
+            _to_little_endian(offsets).tofile(snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(path)
+
+# Platforms which cannot open a directory (Windows) skip the flush
+def fsync_directory(path):
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+def load(path, **options):
+    with open(path, 'rb') as snapshot:
+        mapped = mmap.mmap(snapshot.fileno(), 0, access = mmap.ACCESS_READ)
+    try:
+        magic, version, count = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError
+        keys_end = _HEADER.size + count * 8
+        blob_start = keys_end + (count + 1) * 8
+
+        with memoryview(mapped) as view, \
+                view[_HEADER.size:keys_end].cast('q') as keys, \
+                view[keys_end:blob_start].cast('Q') as offsets:
+            if sys.byteorder == 'big':
+                keys = _to_little_endian(array('q', keys))
+                offsets = _to_little_endian(array('Q', offsets))
+
+            def read_values():
+                for index in range(count):
+                    start, end = offsets[index], offsets[index + 1]
+                    if start == end:
+                        yield None
+                    else:
+                        yield pickle.loads(
+                                view[blob_start + start:blob_start + end])
+
+            return rbt.Tree.from_sorted(keys, read_values(), **options)
+    finally:
+        mapped.close()
+
+
+# Round-trip random trees of every layout a snapshot can hold, and check a
+# failed dump leaves neither a partial file nor a changed target behind
+def random_seed_tests():
+    test_count = 42
+    layouts = ({}, {'order_statistic': True}, {'multiset': True},
+               {'combine': lambda a, b: a + b, 'identity': 0,
+                'measure': lambda node: node.key})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.snapshot')
+        for seed in range(test_count):
+            print('Testing seed:', seed)
+            random.seed(seed)
+            for options in layouts:
+                tree = rbt.Tree(**options)
+                for _ in range(random.randrange(test_count * 4)):
+                    key = random.choice((random.randrange(-50, 50),
+                                         random.randrange(-2 ** 63, 2 ** 63)))
+                    value = random.choice((None, key, str(key), [key]))
+                    try:
+                        tree.insert(key, value)
+                    except LookupError:
+                        pass
+                dump(tree, path)
+                loaded = load(path, **options)
+                loaded.validate()
+                if list(loaded.iter_items()) != list(tree.iter_items()) or \
+                        len(loaded) != len(tree) or \
+                        ('combine' in options and
+                         loaded.aggregate() != tree.aggregate()):
+                    print('Snapshot round trip mismatch at seed:', seed)
+                    raise ValueError
+
+            before = open(path, 'rb').read()
+            for keys in (['x', 'y'], [1, 2 ** 63]):
+                try:
+                    dump(rbt.Tree.from_sorted(keys), path)
+                except (TypeError, OverflowError):
+                    pass
+                else:
+                    print('Unsavable key accepted at seed:', seed)
+                    raise ValueError
+            if os.listdir(directory) != ['tree.snapshot'] or \
+                    open(path, 'rb').read() != before:
+                print('Failed dump left files behind at seed:', seed)
+                raise ValueError
+
+# Running as main shall invoke random seed testing
+if __name__ == '__main__':
+    print('Init')
+    random_seed_tests()